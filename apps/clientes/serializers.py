@@ -6,6 +6,17 @@ class ClienteSerializer(serializers.ModelSerializer):
         model = Cliente
         fields = '__all__'
 
+class ClienteResumoSerializer(serializers.ModelSerializer):
+    """Resumo do cliente embutido em listagens de outros apps."""
+
+    class Meta:
+        model = Cliente
+        fields = ['id', 'nome', 'tipo']
+        read_only_fields = fields
+
+class ClienteLookupSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+
 class PedidoClienteSerializer(serializers.ModelSerializer):
     class Meta:
         model = PedidoCliente
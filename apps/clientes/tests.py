@@ -1,3 +1,26 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase, APIClient
 
-# Create your tests here.
+from apps.clientes.models import Cliente
+
+
+class ClienteLookupTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='comercial', password='senha-teste')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.ana = Cliente.objects.create(nome='Ana', cpf_cnpj='111.111.111-11', tipo='PF')
+        self.bruno = Cliente.objects.create(nome='Bruno', cpf_cnpj='222.222.222-22', tipo='PF')
+        Cliente.objects.create(nome='Carla', cpf_cnpj='333.333.333-33', tipo='PF')
+
+    def test_lookup_returns_only_requested_names(self):
+        response = self.client.get('/api/clientes/lookup/', {'ids': f'{self.ana.id},{self.bruno.id},999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {str(self.ana.id): 'Ana', str(self.bruno.id): 'Bruno'})
+        # Not nested under the client collection
+        self.assertEqual(self.client.get('/api/clientes/clientes/lookup/', {'ids': self.ana.id}).status_code, 404)
+
+    def test_lookup_requires_valid_ids(self):
+        self.assertEqual(self.client.get('/api/clientes/lookup/').status_code, 400)
+        self.assertEqual(self.client.get('/api/clientes/lookup/', {'ids': 'abc'}).status_code, 400)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClienteViewSet, PedidoClienteViewSet, ClienteAuthViewSet, PedidoTrackingViewSet
+from .views import ClienteViewSet, PedidoClienteViewSet, ClienteAuthViewSet, ClienteLookupViewSet, PedidoTrackingViewSet
 
 app_name = 'clientes'
 
@@ -10,6 +10,7 @@ router.register(r'pedidos', PedidoClienteViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('lookup/', ClienteLookupViewSet.as_view({'get': 'lookup'}), name='cliente-lookup'),
     path('clientes/login/', ClienteAuthViewSet.as_view({'post': 'login'}), name='cliente-login'),
     path('pedidos/track/<str:numero_pedido>/', PedidoTrackingViewSet.as_view({'get': 'retrieve'}), name='pedido-track'),
 ]
\ No newline at end of file
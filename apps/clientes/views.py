@@ -3,13 +3,30 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .models import Cliente, PedidoCliente
-from .serializers import ClienteSerializer, PedidoClienteSerializer, PedidoStatusUpdateSerializer
+from .serializers import (
+    ClienteLookupSerializer, ClienteSerializer, PedidoClienteSerializer, PedidoStatusUpdateSerializer
+)
 
 class ClienteViewSet(viewsets.ModelViewSet):
     queryset = Cliente.objects.all()
     serializer_class = ClienteSerializer
     permission_classes = [IsAuthenticated]
 
+class ClienteLookupViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """
+        Nomes dos clientes pedidos em ?ids=1,2,3, no formato {id: nome}, com
+        uma consulta que lê só essas duas colunas. Ids inexistentes são omitidos.
+        """
+        ids = [parte.strip() for parte in request.query_params.get('ids', '').split(',') if parte.strip()]
+        serializer = ClienteLookupSerializer(data={'ids': ids})
+        serializer.is_valid(raise_exception=True)
+        nomes = Cliente.objects.filter(id__in=serializer.validated_data['ids']).values_list('id', 'nome')
+        return Response({str(id_): nome for id_, nome in nomes})
+
 class PedidoClienteViewSet(viewsets.ModelViewSet):
     queryset = PedidoCliente.objects.all()
     serializer_class = PedidoClienteSerializer
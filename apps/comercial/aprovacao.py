@@ -0,0 +1,97 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.estoque.reservas import reservar_pedidos
+from apps.pcp.models import OrdemProducao
+from .models import PedidoVenda
+
+# Prioridade do pedido de venda → prioridade da ordem de produção
+PRIORIDADE_PCP = {
+    'BAIXA': 'BAIXA',
+    'NORMAL': 'MEDIA',
+    'ALTA': 'ALTA',
+    'URGENTE': 'URGENTE',
+}
+
+# Status a partir dos quais um pedido pode ser aprovado (APROVADO só gera a
+# ordem de produção que estiver faltando)
+STATUS_APROVAVEIS = ('PENDENTE', 'APROVADO')
+
+
+def _pedidos_com_ordem(pedido_ids):
+    return set(OrdemProducao.objects.filter(pedido_venda__in=pedido_ids).values_list('pedido_venda_id', flat=True))
+
+
+def gerar_ordens_producao(pedidos):
+    """
+    Cria, com um único bulk_create, as ordens de produção dos pedidos que ainda
+    não têm uma. A ligação única OrdemProducao.pedido_venda torna a operação
+    idempotente, inclusive entre requisições concorrentes: se outra requisição
+    criar a ordem de um destes pedidos entre a consulta e o INSERT, o INSERT é
+    desfeito e refeito sem ele. Os pedidos devem vir com o cliente carregado.
+    Retorna quantas ordens foram de fato criadas.
+    """
+    pedidos = list(pedidos)
+    pedido_ids = [pedido.id for pedido in pedidos]
+    com_ordem = _pedidos_com_ordem(pedido_ids)
+    while True:
+        ordens = [
+            OrdemProducao(
+                pedido_venda=pedido,
+                client=pedido.cliente.nome,
+                start_date=pedido.data_pedido.date(),
+                estimated_end_date=pedido.prazo or pedido.data_pedido.date(),
+                status='PENDENTE',
+                priority=PRIORIDADE_PCP.get(pedido.prioridade, 'MEDIA'),
+            )
+            for pedido in pedidos
+            if pedido.id not in com_ordem
+        ]
+        if not ordens:
+            return 0
+        try:
+            with transaction.atomic():
+                OrdemProducao.objects.bulk_create(ordens)
+            return len(ordens)
+        except IntegrityError:
+            atuais = _pedidos_com_ordem(pedido_ids)
+            if atuais == com_ordem:
+                # O conflito não veio de uma ordem criada em paralelo
+                raise
+            com_ordem = atuais
+
+
+def aprovar_pedidos(pedido_ids):
+    """
+    Aprova vários pedidos em uma transação: um UPDATE para o status, a reserva
+    dos materiais dos recém-aprovados e um bulk_create para as ordens de
+    produção. Pedidos já aprovados só recebem a ordem que estiver faltando;
+    pedidos em outros status são ignorados. Retorna um resumo.
+    """
+    pedido_ids = list(dict.fromkeys(pedido_ids))
+    with transaction.atomic():
+        pedidos = list(
+            PedidoVenda.objects.select_for_update().filter(id__in=pedido_ids).select_related('cliente').order_by('id')
+        )
+        aprovaveis = [pedido for pedido in pedidos if pedido.status in STATUS_APROVAVEIS]
+        novos = [pedido for pedido in aprovaveis if pedido.status != 'APROVADO']
+
+        if novos:
+            PedidoVenda.objects.filter(id__in=[pedido.id for pedido in novos]).update(
+                status='APROVADO', updated_at=timezone.now()
+            )
+            reservar_pedidos([pedido.id for pedido in novos if not pedido.materiais_baixados])
+        ordens_criadas = gerar_ordens_producao(aprovaveis)
+
+    encontrados = {pedido.id for pedido in pedidos}
+    return {
+        'aprovados': [pedido.id for pedido in novos],
+        'ja_aprovados': [pedido.id for pedido in aprovaveis if pedido.status == 'APROVADO'],
+        'ordens_criadas': ordens_criadas,
+        'ignorados': [
+            {'id': pedido.id, 'status': pedido.status}
+            for pedido in pedidos
+            if pedido.status not in STATUS_APROVAVEIS
+        ],
+        'nao_encontrados': [pedido_id for pedido_id in pedido_ids if pedido_id not in encontrados],
+    }
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.utils import timezone
+
+from apps.estoque.movimentacao import debitar_materiais
+from apps.estoque.reservas import liberar_reservas
+from .models import PedidoVenda
+from .necessidades import calcular_necessidades
+from .versoes import chave_versao_pedido, invalidar_versao
+
+
+def baixar_materiais_pedido(pedido):
+    """
+    Baixa do estoque os materiais necessários do pedido, uma única vez.
+
+    O pedido é marcado com um UPDATE condicional em materiais_baixados antes
+    do débito: chamadas repetidas ou concorrentes para o mesmo pedido não
+    alteram nenhuma linha e retornam None. Se algum material não tiver saldo,
+    EstoqueInsuficiente é levantada e nada é gravado, nem a marcação.
+    Retorna os registros de HistoricoUsoMaterial criados.
+    """
+    with transaction.atomic():
+        marcado = PedidoVenda.objects.filter(id=pedido.id, materiais_baixados=False).update(
+            materiais_baixados=True, updated_at=timezone.now()
+        )
+        if not marcado:
+            return None
+
+        necessidades = calcular_necessidades([pedido.id])[pedido.id]
+        historico = debitar_materiais(
+            (material_id, dados['quantidade'], pedido.id) for material_id, dados in necessidades.items()
+        )
+        # O que estava reservado para o pedido acabou de sair do estoque
+        liberar_reservas([pedido.id])
+        invalidar_versao(chave_versao_pedido(pedido.id))
+
+    pedido.materiais_baixados = True
+    return historico
@@ -0,0 +1,175 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from apps.estoque.models import MateriaPrima
+from .versoes import CHAVE_VERSAO_BOM, obter_versao, incrementar_versao
+
+UNIDADES_MEDIDA = dict(MateriaPrima.UNIDADE_MEDIDA_CHOICES)
+
+# Fichas técnicas compiladas deste processo, indexadas pelo id do ModeloProduto.
+# São descartadas em bloco sempre que a versão do BOM gravada no banco muda.
+_fichas = {}
+_versao_fichas = None
+_lock = threading.Lock()
+
+# Estado por thread dos blocos em que as invalidações do BOM são agrupadas.
+_agrupamento = threading.local()
+
+
+def normalizar_grade(tamanhos):
+    """
+    Converte a grade de tamanhos de um item em {tamanho: quantidade inteira},
+    descartando entradas inválidas ou sem peças.
+    """
+    grade = {}
+    if not isinstance(tamanhos, dict):
+        return grade
+    for tamanho, quantidade in tamanhos.items():
+        try:
+            quantidade = int(quantidade)
+        except (TypeError, ValueError):
+            continue
+        if quantidade > 0:
+            grade[tamanho] = quantidade
+    return grade
+
+
+class FichaCompilada:
+    """
+    Ficha técnica de um ModeloProduto compilada em uma matriz tamanho × material.
+    """
+
+    def __init__(self, modelo_id, linhas):
+        self.modelo_id = modelo_id
+        self.linhas = tuple(linhas)
+        self.materiais = {}
+        self.consumo = {}
+        for linha in self.linhas:
+            material_id = linha['material_id']
+            if material_id not in self.materiais:
+                self.materiais[material_id] = {
+                    'material_id': material_id,
+                    'nome': linha['material__name'],
+                    'unidade': UNIDADES_MEDIDA.get(linha['material__unidade_medida'], linha['material__unidade_medida']),
+                    'unidade_medida': linha['material__unidade_medida'],
+                    'tipo_produto': linha['material__tipo_produto'],
+                    'cor': linha['material__cor'],
+                }
+            self.consumo.setdefault(linha['tamanho'], []).append((material_id, linha['quantidade']))
+
+    def multiplicar(self, grade):
+        """
+        Multiplica uma grade já normalizada pela matriz de consumo e retorna
+        {material_id: quantidade (Decimal)}.
+        """
+        totais = {}
+        for tamanho, quantidade_pecas in grade.items():
+            for material_id, consumo in self.consumo.get(tamanho, ()):
+                totais[material_id] = totais.get(material_id, Decimal('0')) + consumo * quantidade_pecas
+        return totais
+
+    def calcular(self, tamanhos):
+        """
+        Multiplica a grade de tamanhos pela matriz de consumo e retorna a lista de
+        materiais no mesmo formato gravado em ItemPedido.materiais.
+        """
+        totais = self.multiplicar(normalizar_grade(tamanhos))
+        return [
+            {
+                'material_id': material_id,
+                'nome': self.materiais[material_id]['nome'],
+                'quantidade': float(quantidade),
+                'unidade': self.materiais[material_id]['unidade'],
+            }
+            for material_id, quantidade in totais.items()
+        ]
+
+
+def _compilar(modelo_ids):
+    from .models import ConsumoMaterial
+
+    linhas_por_modelo = {modelo_id: [] for modelo_id in modelo_ids}
+    linhas = ConsumoMaterial.objects.filter(modelo_id__in=modelo_ids).order_by('modelo_id', 'tamanho', 'id').values(
+        'id', 'modelo_id', 'tamanho', 'quantidade', 'material_id',
+        'material__name', 'material__unidade_medida', 'material__tipo_produto', 'material__cor',
+    )
+    for linha in linhas:
+        linhas_por_modelo[linha['modelo_id']].append(linha)
+    return {modelo_id: FichaCompilada(modelo_id, linhas) for modelo_id, linhas in linhas_por_modelo.items()}
+
+
+def obter_fichas(modelo_ids):
+    """
+    Retorna {modelo_id: FichaCompilada} para os modelos pedidos. Os modelos que
+    ainda não estão no cache são compilados juntos, em uma única consulta.
+    """
+    global _versao_fichas
+
+    ids = {modelo_id for modelo_id in modelo_ids if modelo_id}
+    if not ids:
+        return {}
+
+    versao = obter_versao(CHAVE_VERSAO_BOM)
+    with _lock:
+        if _versao_fichas != versao:
+            _fichas.clear()
+            _versao_fichas = versao
+        fichas = {modelo_id: _fichas[modelo_id] for modelo_id in ids if modelo_id in _fichas}
+
+    faltantes = ids - fichas.keys()
+    if faltantes:
+        compiladas = _compilar(faltantes)
+        with _lock:
+            # Só guarda se ninguém invalidou o BOM enquanto a consulta rodava.
+            if _versao_fichas == versao:
+                _fichas.update(compiladas)
+        fichas.update(compiladas)
+    return fichas
+
+
+def obter_ficha(modelo_id):
+    return obter_fichas([modelo_id]).get(modelo_id)
+
+
+def _descartar_fichas_locais():
+    global _versao_fichas
+    with _lock:
+        _fichas.clear()
+        _versao_fichas = None
+
+
+def invalidar_bom():
+    """
+    Descarta as fichas compiladas. A versão do BOM é trocada na transação
+    corrente: ela mesma passa a compilar as fichas sob a versão nova, os
+    demais processos descartam as suas no commit e, se a transação for
+    desfeita, as fichas compiladas com os dados não confirmados ficam sob uma
+    versão que nunca mais é lida. Dentro de invalidacao_agrupada() a troca é
+    feita uma única vez, ao final do bloco.
+    """
+    if getattr(_agrupamento, 'profundidade', 0) > 0:
+        _agrupamento.pendente = True
+        return
+    incrementar_versao(CHAVE_VERSAO_BOM)
+    _descartar_fichas_locais()
+
+
+@contextmanager
+def invalidacao_agrupada():
+    """
+    Agrupa as invalidações do BOM feitas no bloco (por exemplo, pelos signals
+    de um delete em lote) em uma só, ao final. Usado pelos caminhos em lote,
+    dentro da transação que altera as fichas.
+    """
+    _agrupamento.profundidade = getattr(_agrupamento, 'profundidade', 0) + 1
+    try:
+        yield
+    finally:
+        _agrupamento.profundidade -= 1
+        pendente = _agrupamento.profundidade == 0 and getattr(_agrupamento, 'pendente', False)
+        if pendente:
+            _agrupamento.pendente = False
+    # Com exceção, a transação que fez as alterações é desfeita
+    if pendente:
+        invalidar_bom()
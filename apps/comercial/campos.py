@@ -0,0 +1,64 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _parametro(request, nome):
+    valor = request.query_params.get(nome)
+    if valor is None:
+        return None
+    return {parte.strip() for parte in valor.split(',') if parte.strip()}
+
+
+def filtrar_campos(request, caminho, nomes, expansiveis=()):
+    """
+    Campos que o serializer no `caminho` (tupla de nomes a partir da raiz, por
+    exemplo ('itens',)) deve produzir numa leitura:
+
+    - ?fields=id,status,itens.tamanhos restringe os campos de cada nível;
+      um nível sem nenhum campo listado mantém todos.
+    - ?expand=itens,itens.materiais escolhe quais blocos aninhados pesados
+      (os `expansiveis`) entram. Sem ?expand, todos entram, como antes.
+
+    Escritas não são afetadas: os campos graváveis continuam todos presentes.
+    """
+    nomes = list(nomes)
+    if request is None or request.method not in SAFE_METHODS:
+        return nomes
+
+    campos = _parametro(request, 'fields')
+    if campos is not None:
+        profundidade = len(caminho)
+        selecionados = {
+            partes[profundidade]
+            for partes in (campo.split('.') for campo in campos)
+            if len(partes) > profundidade and tuple(partes[:profundidade]) == caminho
+        }
+        if selecionados:
+            nomes = [nome for nome in nomes if nome in selecionados]
+
+    expandir = _parametro(request, 'expand')
+    if expandir is not None:
+        nomes = [nome for nome in nomes if nome not in expansiveis or '.'.join(caminho + (nome,)) in expandir]
+    return nomes
+
+
+class CamposDinamicosMixin:
+    """
+    Aplica filtrar_campos() ao serializer. Os campos removidos não são
+    calculados, e o viewset pode usar a mesma regra para decidir o que
+    pré-buscar.
+    """
+    CAMPOS_EXPANSIVEIS = ()
+
+    def get_fields(self):
+        campos = super().get_fields()
+        manter = filtrar_campos(self.context.get('request'), self._caminho(), campos, self.CAMPOS_EXPANSIVEIS)
+        return {nome: campos[nome] for nome in manter}
+
+    def _caminho(self):
+        partes = []
+        serializer = self
+        while serializer is not None:
+            if getattr(serializer, 'field_name', None):
+                partes.append(serializer.field_name)
+            serializer = getattr(serializer, 'parent', None)
+        return tuple(reversed(partes))
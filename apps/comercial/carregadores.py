@@ -0,0 +1,60 @@
+from apps.estoque.models import MateriaPrima
+from .models import ModeloProduto
+
+
+class Carregador:
+    """
+    Carrega objetos por id em lote, no estilo DataLoader: os ids registrados
+    antes da primeira leitura são buscados juntos, em uma única consulta, e
+    cada objeto é buscado no máximo uma vez por requisição.
+    """
+
+    def __init__(self, carregar):
+        self._carregar = carregar
+        self._carregados = {}
+        self._pendentes = set()
+
+    def registrar(self, ids):
+        self._pendentes.update(id_ for id_ in ids if id_ is not None and id_ not in self._carregados)
+
+    def obter(self, id_):
+        if id_ not in self._carregados:
+            self._pendentes.add(id_)
+            self._despachar()
+        return self._carregados.get(id_)
+
+    def _despachar(self):
+        pendentes, self._pendentes = self._pendentes, set()
+        encontrados = self._carregar(pendentes)
+        for id_ in pendentes:
+            self._carregados[id_] = encontrados.get(id_)
+
+
+class Carregadores:
+    def __init__(self):
+        self.materiais = Carregador(MateriaPrima.objects.in_bulk)
+        self.modelos = Carregador(
+            ModeloProduto.objects.prefetch_related('consumo_materiais__material').in_bulk
+        )
+
+
+def obter_carregadores(contexto):
+    """
+    Carregadores da requisição, guardados no contexto do serializer raiz, que
+    é compartilhado por todos os serializers aninhados.
+    """
+    carregadores = contexto.get('carregadores')
+    if carregadores is None:
+        carregadores = contexto['carregadores'] = Carregadores()
+    return carregadores
+
+
+def registrar_itens(contexto, itens):
+    """
+    Registra os modelos e materiais referenciados pelos itens para que sejam
+    buscados juntos na primeira leitura.
+    """
+    carregadores = obter_carregadores(contexto)
+    for item in itens:
+        carregadores.modelos.registrar([item.modelo_base_id])
+        carregadores.materiais.registrar(material.get('material_id') for material in item.materiais or [])
@@ -0,0 +1,190 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import PedidoVenda, Vendedor, Comissao, ResumoVendedorMensal
+
+CENTAVOS = Decimal('0.01')
+
+# Pedidos que não geram comissão
+STATUS_SEM_COMISSAO = ('PENDENTE', 'REJEITADO', 'CANCELADO')
+
+
+def inicio_do_mes(data):
+    """Primeiro dia do mês de uma data ou datetime (no fuso local)."""
+    if hasattr(data, 'hour'):
+        data = timezone.localtime(data).date() if timezone.is_aware(data) else data.date()
+    return data.replace(day=1)
+
+
+def valor_comissao(valor_total, taxa):
+    """Comissão em reais de `taxa` por cento sobre `valor_total`, em Decimal."""
+    return (Decimal(valor_total) * Decimal(taxa) / 100).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def _percentual_meta(total_vendas):
+    return Case(
+        When(meta__gt=0, then=total_vendas * 100 / F('meta')),
+        default=Value(Decimal('0')),
+        output_field=DecimalField(max_digits=9, decimal_places=2),
+    )
+
+
+def acumular_resumos(comissoes, sinal=1):
+    """
+    Soma (sinal=1) ou subtrai (sinal=-1) as comissões dos acumulados mensais
+    dos vendedores. Os resumos que faltam são criados com a meta atual do
+    vendedor, e todos os resumos afetados recebem a diferença em um único
+    UPDATE com F(), sem ler os valores atuais. O valor de vendas é o
+    valor_pedido gravado na comissão, e não o valor atual do pedido, para que
+    o estorno retire exatamente o que foi somado.
+    """
+    deltas = {}
+    for comissao in comissoes:
+        chave = (comissao.vendedor_id, comissao.competencia)
+        vendas, valor, pedidos = deltas.get(chave, (Decimal('0'), Decimal('0'), 0))
+        deltas[chave] = (vendas + sinal * (comissao.valor_pedido or 0), valor + sinal * comissao.valor, pedidos + sinal)
+    if not deltas:
+        return
+
+    metas = dict(Vendedor.objects.filter(id__in={vendedor_id for vendedor_id, _ in deltas}).values_list('id', 'meta_mensal'))
+    ResumoVendedorMensal.objects.bulk_create(
+        [
+            ResumoVendedorMensal(vendedor_id=vendedor_id, competencia=mes, meta=metas.get(vendedor_id, 0))
+            for vendedor_id, mes in deltas
+        ],
+        ignore_conflicts=True,
+    )
+
+    def caso(indice, campo, saida):
+        return Case(
+            *[
+                When(vendedor_id=vendedor_id, competencia=mes, then=F(campo) + Value(delta[indice]))
+                for (vendedor_id, mes), delta in deltas.items()
+            ],
+            default=F(campo),
+            output_field=saida,
+        )
+
+    guarda = Q()
+    for vendedor_id, mes in deltas:
+        guarda |= Q(vendedor_id=vendedor_id, competencia=mes)
+    valor_decimal = DecimalField(max_digits=14, decimal_places=2)
+    vendas = caso(0, 'total_vendas', valor_decimal)
+    ResumoVendedorMensal.objects.filter(guarda).update(
+        total_vendas=vendas,
+        total_comissao=caso(1, 'total_comissao', valor_decimal),
+        pedidos=caso(2, 'pedidos', IntegerField()),
+        percentual_meta=_percentual_meta(vendas),
+        updated_at=timezone.now(),
+    )
+
+
+def calcular_comissoes(inicio, fim, vendedor_ids=None):
+    """
+    Gera, em uma passagem, as comissões de todos os pedidos elegíveis feitos
+    entre `inicio` e `fim` (datas, inclusive): pedidos com vendedor e valor,
+    fora de STATUS_SEM_COMISSAO e ainda sem comissão. O valor usa a taxa de
+    cada vendedor. As comissões são gravadas com um bulk_create e os resumos
+    mensais são atualizados na mesma transação. Retorna as comissões criadas.
+    """
+    with transaction.atomic():
+        vendedores = Vendedor.objects.select_for_update().order_by('id')
+        if vendedor_ids is not None:
+            vendedores = vendedores.filter(id__in=list(vendedor_ids))
+        # Travar os vendedores serializa execuções concorrentes sobre os mesmos pedidos
+        taxas = dict(vendedores.values_list('id', 'taxa_comissao'))
+
+        pedidos = PedidoVenda.objects.filter(
+            vendedor_id__in=list(taxas),
+            data_pedido__date__gte=inicio,
+            data_pedido__date__lte=fim,
+            valor_total__isnull=False,
+            comissoes__isnull=True,
+        ).exclude(status__in=STATUS_SEM_COMISSAO).only('id', 'vendedor_id', 'valor_total', 'data_pedido')
+
+        comissoes = [
+            Comissao(
+                vendedor_id=pedido.vendedor_id,
+                pedido=pedido,
+                valor=valor_comissao(pedido.valor_total, taxas[pedido.vendedor_id]),
+                taxa=taxas[pedido.vendedor_id],
+                valor_pedido=pedido.valor_total,
+                competencia=inicio_do_mes(pedido.data_pedido),
+            )
+            for pedido in pedidos
+        ]
+        Comissao.objects.bulk_create(comissoes)
+        acumular_resumos(comissoes)
+    return comissoes
+
+
+def estornar_comissoes(comissoes):
+    """Apaga as comissões e retira seus valores dos resumos mensais."""
+    comissoes = [comissao for comissao in comissoes if comissao.competencia is not None]
+    with transaction.atomic():
+        Comissao.objects.filter(id__in=[comissao.id for comissao in comissoes]).delete()
+        acumular_resumos(comissoes, sinal=-1)
+
+
+def reajustar_comissoes(pedido, vendedor_alterado=False):
+    """
+    Refaz as comissões de um pedido cujo valor ou vendedor mudou: retira dos
+    resumos o que foi somado na criação e soma os valores novos. Com
+    `vendedor_alterado`, a comissão passa ao vendedor atual do pedido, com a
+    taxa dele; senão mantém a taxa gravada. Pedido que ficou sem valor ou sem
+    vendedor tem as comissões estornadas.
+    """
+    comissoes = list(pedido.comissoes.all())
+    if not comissoes:
+        return []
+    if pedido.valor_total is None or (vendedor_alterado and pedido.vendedor_id is None):
+        estornar_comissoes(comissoes)
+        return []
+
+    with transaction.atomic():
+        acumular_resumos(comissoes, sinal=-1)
+        taxa_vendedor = Vendedor.objects.values_list('taxa_comissao', flat=True).get(id=pedido.vendedor_id) if vendedor_alterado else None
+        agora = timezone.now()
+        for comissao in comissoes:
+            if vendedor_alterado:
+                comissao.vendedor_id, comissao.taxa = pedido.vendedor_id, taxa_vendedor
+            if comissao.taxa is not None:
+                comissao.valor = valor_comissao(pedido.valor_total, comissao.taxa)
+            comissao.valor_pedido = pedido.valor_total
+            comissao.updated_at = agora
+        Comissao.objects.bulk_update(comissoes, ['vendedor', 'taxa', 'valor', 'valor_pedido', 'updated_at'])
+        acumular_resumos(comissoes)
+    return comissoes
+
+
+def atualizar_meta(vendedor):
+    """
+    Aplica a meta atual do vendedor aos resumos do mês corrente em diante;
+    os meses fechados mantêm a meta que tinham.
+    """
+    meta = Decimal(vendedor.meta_mensal)
+    ResumoVendedorMensal.objects.filter(vendedor=vendedor, competencia__gte=inicio_do_mes(timezone.now())).update(
+        meta=meta,
+        percentual_meta=F('total_vendas') * 100 / Value(meta) if meta > 0 else Value(Decimal('0')),
+        updated_at=timezone.now(),
+    )
+
+
+def reconstruir_resumos():
+    """Recalcula todos os resumos mensais a partir das comissões gravadas."""
+    with transaction.atomic():
+        ResumoVendedorMensal.objects.all().delete()
+        comissoes = Comissao.objects.filter(competencia__isnull=False, valor_pedido__isnull=False).only(
+            'vendedor', 'competencia', 'valor', 'valor_pedido'
+        )
+        acumular_resumos(comissoes.iterator())
+
+
+def ranking(mes, ordenar='total_vendas', limite=None):
+    """Resumos de um mês, do maior para o menor pelo campo `ordenar`."""
+    resumos = ResumoVendedorMensal.objects.filter(competencia=inicio_do_mes(mes)).select_related('vendedor')
+    resumos = resumos.order_by(f'-{ordenar}', 'vendedor__nome')
+    return resumos[:limite] if limite else resumos
@@ -0,0 +1,86 @@
+import csv
+
+from django.db.models import Prefetch
+
+from .bom import normalizar_grade
+from .models import PedidoVenda, ItemPedido
+
+# Pedidos lidos do banco por vez; os itens de cada bloco vêm em uma consulta
+TAMANHO_BLOCO_EXPORTACAO = 500
+
+COLUNAS_EXPORTACAO = [
+    'pedido_id', 'data_pedido', 'prazo', 'status', 'prioridade', 'cliente_id', 'cliente',
+    'cliente_cpf_cnpj', 'valor_total', 'quantidade_pecas', 'item_id', 'tipo', 'modelo',
+    'modelo_base', 'grade', 'quantidade_item', 'preco_unitario', 'materiais',
+]
+
+
+def filtrar_pedidos(status=None, cliente=None, data_inicio=None, data_fim=None):
+    """
+    Pedidos a exportar, em ordem de id. `status` é uma lista de status; as
+    datas limitam data_pedido (inclusive).
+    """
+    queryset = PedidoVenda.objects.all()
+    if status:
+        queryset = queryset.filter(status__in=status)
+    if cliente:
+        queryset = queryset.filter(cliente_id=cliente)
+    if data_inicio:
+        queryset = queryset.filter(data_pedido__date__gte=data_inicio)
+    if data_fim:
+        queryset = queryset.filter(data_pedido__date__lte=data_fim)
+    return queryset.order_by('id')
+
+
+def _grade(tamanhos):
+    return ';'.join(f'{tamanho}:{quantidade}' for tamanho, quantidade in normalizar_grade(tamanhos).items())
+
+
+def _materiais(materiais):
+    return ';'.join(
+        f"{material.get('nome', material.get('material_id'))}:{material.get('quantidade')} {material.get('unidade', '')}".rstrip()
+        for material in materiais or []
+    )
+
+
+def linhas_exportacao(queryset, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Gera as linhas da exportação (a primeira é o cabeçalho): uma por item, ou
+    uma só, sem dados de item, para pedido sem itens. Os pedidos são lidos com
+    iterator(), em blocos de `tamanho_bloco` com cliente e itens pré-buscados,
+    então a memória usada não depende de quantos pedidos são exportados.
+    """
+    queryset = queryset.select_related('cliente').prefetch_related(
+        Prefetch('itens', queryset=ItemPedido.objects.select_related('modelo_base').order_by('id'))
+    )
+    yield COLUNAS_EXPORTACAO
+    for pedido in queryset.iterator(chunk_size=tamanho_bloco):
+        dados_pedido = [
+            pedido.id, pedido.data_pedido.isoformat(), pedido.prazo.isoformat() if pedido.prazo else '',
+            pedido.status, pedido.prioridade, pedido.cliente_id, pedido.cliente.nome, pedido.cliente.cpf_cnpj,
+            '' if pedido.valor_total is None else pedido.valor_total, pedido.quantidade_pecas,
+        ]
+        itens = pedido.itens.all()
+        if not itens:
+            yield dados_pedido + [''] * (len(COLUNAS_EXPORTACAO) - len(dados_pedido))
+            continue
+        for item in itens:
+            yield dados_pedido + [
+                item.id, item.tipo, item.modelo, item.modelo_base.nome if item.modelo_base else '',
+                _grade(item.tamanhos), sum(normalizar_grade(item.tamanhos).values()),
+                '' if item.preco_unitario is None else item.preco_unitario, _materiais(item.materiais),
+            ]
+
+
+class _Eco:
+    """Arquivo falso para csv.writer: devolve a linha formatada em vez de gravá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_csv(queryset, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """Gera a exportação como texto CSV, uma linha por vez."""
+    escritor = csv.writer(_Eco())
+    for linha in linhas_exportacao(queryset, tamanho_bloco):
+        yield escritor.writerow(linha)
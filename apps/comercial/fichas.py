@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .bom import invalidacao_agrupada, invalidar_bom
+from .models import ConsumoMaterial
+from .recalculo import marcar_modelos
+
+
+def _chave(consumo):
+    material = consumo['material']
+    return consumo['tamanho'], getattr(material, 'pk', material)
+
+
+def gravar_consumos(modelo, consumos):
+    """
+    Substitui a ficha técnica do modelo pelas linhas `consumos` (dicts com
+    tamanho, material e quantidade). As linhas são comparadas com as existentes
+    pela chave única (tamanho, material) e a diferença é aplicada com um delete
+    filtrado, um bulk_update e um bulk_create, qualquer que seja o tamanho da
+    ficha. As fichas compiladas são invalidadas uma vez, ao final.
+    """
+    existentes = {
+        (consumo.tamanho, consumo.material_id): consumo
+        for consumo in ConsumoMaterial.objects.filter(modelo=modelo)
+    }
+    alterados, novos = [], []
+    agora = timezone.now()
+    for dados in consumos:
+        consumo = existentes.pop(_chave(dados), None)
+        if consumo is None:
+            novos.append(ConsumoMaterial(modelo=modelo, **dados))
+        elif consumo.quantidade != dados['quantidade']:
+            consumo.quantidade = dados['quantidade']
+            consumo.updated_at = agora
+            alterados.append(consumo)
+
+    with transaction.atomic(), invalidacao_agrupada():
+        if existentes:
+            ConsumoMaterial.objects.filter(id__in=[consumo.id for consumo in existentes.values()]).delete()
+        if alterados:
+            ConsumoMaterial.objects.bulk_update(alterados, ['quantidade', 'updated_at'])
+        if novos:
+            ConsumoMaterial.objects.bulk_create(novos)
+        # bulk_update e bulk_create não disparam os signals de ConsumoMaterial
+        if existentes or alterados or novos:
+            invalidar_bom()
+            marcar_modelos([modelo.id])
+
+    # O consumo pré-buscado pelo viewset não reflete mais o banco
+    getattr(modelo, '_prefetched_objects_cache', {}).pop('consumo_materiais', None)
+    return {'removidos': len(existentes), 'alterados': len(alterados), 'criados': len(novos)}
@@ -0,0 +1,70 @@
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from .bom import normalizar_grade
+from .models import GradeItemPedido
+
+# Valores aceitos em ?agrupar no endpoint de peças
+AGRUPAMENTOS_PECAS = ('modelo', 'tamanho', 'mes')
+
+
+def linhas_grade(itens):
+    """Linhas de GradeItemPedido (não gravadas) correspondentes a ItemPedido.tamanhos."""
+    return [
+        GradeItemPedido(
+            item_id=item.id, pedido_id=item.pedido_id, modelo_base_id=item.modelo_base_id,
+            tamanho=tamanho, quantidade=quantidade,
+        )
+        for item in itens
+        for tamanho, quantidade in normalizar_grade(item.tamanhos).items()
+    ]
+
+
+def sincronizar_grades(itens, novos=False):
+    """
+    Regrava as linhas de grade dos itens a partir de ItemPedido.tamanhos, com
+    um delete filtrado e um bulk_create, qualquer que seja o número de itens.
+    Com novos=True os itens acabaram de ser criados e o delete é dispensado.
+    """
+    itens = list(itens)
+    if not itens:
+        return
+    if not novos:
+        GradeItemPedido.objects.filter(item_id__in=[item.id for item in itens]).delete()
+    GradeItemPedido.objects.bulk_create(linhas_grade(itens))
+
+
+def somar_pecas(agrupar, data='pedido', data_inicio=None, data_fim=None, status=None, cliente=None, modelo=None):
+    """
+    Soma as peças das grades no banco, agrupadas por qualquer combinação de
+    modelo, tamanho e mês (da data do pedido ou do prazo). Retorna uma lista
+    de dicts com as chaves de agrupamento e 'pecas'.
+    """
+    campo_data = 'pedido__data_pedido' if data == 'pedido' else 'pedido__prazo'
+    campo_dia = 'pedido__data_pedido__date' if data == 'pedido' else 'pedido__prazo'
+    grades = GradeItemPedido.objects.all()
+    if data_inicio:
+        grades = grades.filter(**{f'{campo_dia}__gte': data_inicio})
+    if data_fim:
+        grades = grades.filter(**{f'{campo_dia}__lte': data_fim})
+    if status:
+        grades = grades.filter(pedido__status__in=status)
+    if cliente:
+        grades = grades.filter(pedido__cliente_id=cliente)
+    if modelo:
+        grades = grades.filter(modelo_base_id=modelo)
+
+    colunas = []
+    if 'modelo' in agrupar:
+        colunas += ['modelo_base_id', 'modelo_base__nome']
+    if 'tamanho' in agrupar:
+        colunas.append('tamanho')
+    if 'mes' in agrupar:
+        grades = grades.annotate(mes=TruncMonth(campo_data))
+        colunas.append('mes')
+
+    resultado = grades.values(*colunas).annotate(pecas=Sum('quantidade')).order_by(*colunas)
+    return [
+        {('modelo' if chave == 'modelo_base__nome' else chave): valor for chave, valor in linha.items()}
+        for linha in resultado
+    ]
@@ -0,0 +1,134 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .grades import sincronizar_grades
+from .models import PedidoVenda, ItemPedido
+from .necessidades import agregar_grades, calcular_materiais_itens, serializar_necessidades, sincronizar_necessidades
+from .recalculo import recalculo_suspenso
+from .versoes import chave_versao_pedido, invalidar_versao
+
+
+def _montar_item(pedido, item_data):
+    item_data = dict(item_data)
+    # 'materiais' e 'id' nunca são gravados a partir do payload
+    item_data.pop('materiais', None)
+    item_data.pop('id', None)
+    return ItemPedido(pedido=pedido, **item_data)
+
+
+def _aplicar_necessidades(pedidos_itens):
+    """
+    Calcula os materiais de todos os itens e o agregado de cada pedido em uma
+    única passagem, sem consultar os itens de volta no banco.
+    """
+    calcular_materiais_itens([item for _, itens in pedidos_itens for item in itens])
+    necessidades = agregar_grades(
+        (indice, item.modelo_base_id, item.tamanhos)
+        for indice, (_, itens) in enumerate(pedidos_itens)
+        for item in itens
+    )
+    for indice, (pedido, _) in enumerate(pedidos_itens):
+        pedido.materiais_necessarios = serializar_necessidades(necessidades.get(indice, {}))
+
+
+def criar_pedidos(lote):
+    """
+    Cria vários pedidos com seus itens. `lote` é uma lista de pares
+    (dados_do_pedido, lista_de_dados_dos_itens). O número de consultas não
+    depende da quantidade de itens: um insert para os pedidos (ou um por pedido,
+    se o banco não devolver as chaves de um bulk insert) e um para os itens.
+    """
+    pedidos_itens = []
+    for dados_pedido, itens_dados in lote:
+        dados_pedido = dict(dados_pedido)
+        dados_pedido.pop('materiais_necessarios', None)
+        pedido = PedidoVenda(**dados_pedido)
+        pedidos_itens.append((pedido, [_montar_item(pedido, item_data) for item_data in itens_dados]))
+
+    with transaction.atomic(), recalculo_suspenso():
+        _aplicar_necessidades(pedidos_itens)
+
+        pedidos = [pedido for pedido, _ in pedidos_itens]
+        if len(pedidos) > 1 and connection.features.can_return_rows_from_bulk_insert:
+            PedidoVenda.objects.bulk_create(pedidos)
+        else:
+            for pedido in pedidos:
+                pedido.save()
+
+        itens = []
+        for pedido, itens_pedido in pedidos_itens:
+            for item in itens_pedido:
+                # Reatribui para copiar a chave gerada para item.pedido_id
+                item.pedido = pedido
+                itens.append(item)
+        ItemPedido.objects.bulk_create(itens)
+        sincronizar_grades(itens, novos=True)
+        sincronizar_necessidades(itens, novos=True)
+
+        for pedido in pedidos:
+            invalidar_versao(chave_versao_pedido(pedido.id))
+    return pedidos
+
+
+def criar_pedido(dados_pedido, itens_dados):
+    return criar_pedidos([(dados_pedido, itens_dados)])[0]
+
+
+def atualizar_pedido(pedido, dados_pedido, itens_dados=None):
+    """
+    Atualiza um pedido e, se `itens_dados` for informado, sincroniza seus itens:
+    os itens recebidos são comparados com os existentes pelo id e aplicados com
+    um delete filtrado, um bulk_update e um bulk_create. O agregado do pedido é
+    recalculado uma única vez, na mesma gravação dos campos do pedido.
+    """
+    with transaction.atomic(), recalculo_suspenso():
+        for attr, value in dados_pedido.items():
+            setattr(pedido, attr, value)
+
+        if itens_dados is not None:
+            existentes = {item.id: item for item in pedido.itens.all()}
+            alterados, novos = [], []
+            campos_alterados = set()
+
+            for item_data in itens_dados:
+                item_id = item_data.get('id')
+                if item_id and item_id in existentes:
+                    item = existentes.pop(item_id)
+                    for attr, value in item_data.items():
+                        if attr not in ('id', 'materiais'):
+                            setattr(item, attr, value)
+                            campos_alterados.add(attr)
+                    alterados.append(item)
+                else:
+                    novos.append(_montar_item(pedido, item_data))
+
+            if existentes:
+                ItemPedido.objects.filter(id__in=list(existentes)).delete()
+
+            itens = alterados + novos
+            _aplicar_necessidades([(pedido, itens)])
+
+            if alterados:
+                agora = timezone.now()
+                for item in alterados:
+                    item.updated_at = agora
+                ItemPedido.objects.bulk_update(alterados, sorted(campos_alterados) + ['materiais', 'updated_at'])
+                if campos_alterados & {'tamanhos', 'modelo_base'}:
+                    sincronizar_grades(alterados)
+                    sincronizar_necessidades(alterados)
+            if novos:
+                ItemPedido.objects.bulk_create(novos)
+                sincronizar_grades(novos, novos=True)
+                sincronizar_necessidades(novos, novos=True)
+
+            # Os itens pré-buscados pelo viewset não refletem mais o banco
+            getattr(pedido, '_prefetched_objects_cache', {}).pop('itens', None)
+
+        # Só grava o que mudou: materiais_baixados e os demais campos mantidos
+        # por outros caminhos não são sobrescritos com o valor lido antes
+        campos = list(dados_pedido) + ['updated_at']
+        if itens_dados is not None:
+            campos.append('materiais_necessarios')
+        pedido.save(update_fields=campos)
+        invalidar_versao(chave_versao_pedido(pedido.id))
+    return pedido
@@ -0,0 +1,223 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError
+
+from apps.clientes.models import Cliente
+from .gravacao import criar_pedidos
+from .models import PedidoVenda, ItemPedido, ModeloProduto, ConsumoMaterial
+
+# Pedidos gravados por transação; os materiais são calculados uma vez por lote
+TAMANHO_LOTE_IMPORTACAO = 200
+
+FORMATOS_IMPORTACAO = ('csv', 'jsonl')
+
+TAMANHOS = [tamanho for tamanho, _ in ConsumoMaterial.TAMANHO_CHOICES]
+PRIORIDADES = dict(PedidoVenda.PRIORIDADE_CHOICES)
+TIPOS_ITEM = dict(ItemPedido.TIPO_PRODUTO_CHOICES)
+
+
+def ler_linhas(arquivo, formato):
+    """
+    Lê um arquivo de texto já aberto, uma linha por vez, e gera pares
+    (número_da_linha, dict). CSV usa a primeira linha como cabeçalho; jsonl
+    traz um objeto JSON por linha. Linhas em branco são ignoradas.
+    """
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for linha in leitor:
+            if any((valor or '').strip() for valor in linha.values() if isinstance(valor, str)):
+                yield leitor.line_num, linha
+        return
+
+    for numero, texto in enumerate(arquivo, start=1):
+        if not texto.strip():
+            continue
+        try:
+            dados = json.loads(texto)
+        except ValueError:
+            dados = None
+        yield numero, dados if isinstance(dados, dict) else {'_invalida': True}
+
+
+def _texto(dados, campo):
+    valor = dados.get(campo)
+    return '' if valor is None else str(valor).strip()
+
+
+def _grade(dados):
+    """Grade do item: objeto 'tamanhos', coluna 'grade' (P:10;M:5) ou colunas por tamanho."""
+    if isinstance(dados.get('tamanhos'), dict):
+        brutos = dados['tamanhos'].items()
+    elif _texto(dados, 'grade'):
+        brutos = [parte.split(':', 1) if ':' in parte else (parte, '') for parte in _texto(dados, 'grade').split(';') if parte.strip()]
+    else:
+        brutos = [(chave, valor) for chave, valor in dados.items() if isinstance(chave, str) and chave.strip().upper() in TAMANHOS]
+
+    grade, erros = {}, []
+    for tamanho, quantidade in brutos:
+        tamanho = str(tamanho).strip().upper()
+        quantidade = '' if quantidade is None else str(quantidade).strip()
+        if not quantidade:
+            continue
+        if tamanho not in TAMANHOS:
+            erros.append(f"Tamanho inválido: {tamanho}.")
+        elif not quantidade.isdigit():
+            erros.append(f"Quantidade inválida para o tamanho {tamanho}: {quantidade}.")
+        elif int(quantidade) > 0:
+            grade[tamanho] = grade.get(tamanho, 0) + int(quantidade)
+    if not grade and not erros:
+        erros.append("A grade de tamanhos está vazia.")
+    return grade, erros
+
+
+def _validar_linha(dados, modelos, clientes):
+    """Converte uma linha do arquivo em (dados_do_pedido, dados_do_item, erros)."""
+    if dados.get('_invalida'):
+        return None, None, ["Linha não é um objeto JSON válido."]
+
+    erros = []
+    dados_pedido = {}
+    cpf_cnpj = _texto(dados, 'cpf_cnpj')
+    if not cpf_cnpj:
+        erros.append("cpf_cnpj é obrigatório.")
+    elif cpf_cnpj not in clientes:
+        erros.append(f"Cliente não encontrado: {cpf_cnpj}.")
+    else:
+        dados_pedido['cliente_id'] = clientes[cpf_cnpj]
+
+    if _texto(dados, 'prazo'):
+        try:
+            dados_pedido['prazo'] = date.fromisoformat(_texto(dados, 'prazo'))
+        except ValueError:
+            erros.append(f"Prazo inválido: {_texto(dados, 'prazo')} (use AAAA-MM-DD).")
+    prioridade = _texto(dados, 'prioridade').upper() or 'NORMAL'
+    if prioridade not in PRIORIDADES:
+        erros.append(f"Prioridade inválida: {prioridade}.")
+    dados_pedido['prioridade'] = prioridade
+
+    item = {'descricao': _texto(dados, 'descricao') or None}
+    nome_modelo = _texto(dados, 'modelo')
+    modelo = modelos.get(nome_modelo.casefold())
+    if not nome_modelo:
+        erros.append("modelo é obrigatório.")
+    elif modelo is None:
+        erros.append(f"Modelo não encontrado: {nome_modelo}.")
+    else:
+        item.update(modelo_base_id=modelo.id, modelo=modelo.nome, tipo=modelo.tipo)
+
+    tipo = _texto(dados, 'tipo').upper()
+    if tipo:
+        if tipo in TIPOS_ITEM:
+            item['tipo'] = tipo
+        else:
+            erros.append(f"Tipo inválido: {tipo}.")
+
+    if _texto(dados, 'preco_unitario'):
+        try:
+            item['preco_unitario'] = Decimal(_texto(dados, 'preco_unitario').replace(',', '.')).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            erros.append(f"Preço unitário inválido: {_texto(dados, 'preco_unitario')}.")
+
+    item['tamanhos'], erros_grade = _grade(dados)
+    return dados_pedido, item, erros + erros_grade
+
+
+def _agrupar_pedidos(linhas):
+    """
+    Agrupa linhas consecutivas com a mesma referência na coluna 'pedido' em um
+    só pedido; linhas sem referência formam um pedido cada. Gera listas de
+    (número_da_linha, dict).
+    """
+    atual, referencia_atual = [], None
+    for numero, dados in linhas:
+        referencia = _texto(dados, 'pedido')
+        if atual and (not referencia or referencia != referencia_atual):
+            yield atual
+            atual = []
+        atual.append((numero, dados))
+        referencia_atual = referencia
+    if atual:
+        yield atual
+
+
+def _gravar_lote(lote, modelos, relatorio):
+    """Valida e grava um lote de pedidos (listas de linhas) em uma transação."""
+    clientes = dict(Cliente.objects.filter(
+        cpf_cnpj__in={_texto(dados, 'cpf_cnpj') for linhas in lote for _, dados in linhas}
+    ).values_list('cpf_cnpj', 'id'))
+
+    validos = []
+    for linhas in lote:
+        dados_pedido, itens, erros_pedido = None, [], []
+        for numero, dados in linhas:
+            dados_linha, item, erros = _validar_linha(dados, modelos, clientes)
+            if erros:
+                erros_pedido.append({'linha': numero, 'pedido': _texto(dados, 'pedido') or None, 'erros': erros})
+                continue
+            if dados_pedido is None:
+                dados_pedido = dados_linha
+            elif dados_linha != dados_pedido:
+                erros_pedido.append({
+                    'linha': numero, 'pedido': _texto(dados, 'pedido') or None,
+                    'erros': ["Cliente, prazo ou prioridade diferem das outras linhas do pedido."],
+                })
+                continue
+            itens.append(item)
+
+        if erros_pedido:
+            # Um pedido só entra completo: a falha em uma linha descarta o pedido
+            relatorio['erros'].extend(erros_pedido)
+            relatorio['pedidos_rejeitados'] += 1
+            continue
+
+        quantidades = [sum(item['tamanhos'].values()) for item in itens]
+        dados_pedido['quantidade_pecas'] = sum(quantidades)
+        if all(item.get('preco_unitario') is not None for item in itens):
+            dados_pedido['valor_total'] = sum(
+                (item['preco_unitario'] * quantidade for item, quantidade in zip(itens, quantidades)), Decimal('0')
+            )
+        validos.append((linhas, dados_pedido, itens))
+
+    if not validos:
+        return
+    try:
+        pedidos = criar_pedidos([(dados_pedido, itens) for _, dados_pedido, itens in validos])
+    except DatabaseError as e:
+        for linhas, _, _ in validos:
+            relatorio['erros'].append({
+                'linha': linhas[0][0], 'pedido': _texto(linhas[0][1], 'pedido') or None,
+                'erros': [f"Falha ao gravar o lote: {e}"],
+            })
+        relatorio['pedidos_rejeitados'] += len(validos)
+        return
+
+    relatorio['pedidos_criados'] += len(pedidos)
+    relatorio['itens_criados'] += sum(len(itens) for _, _, itens in validos)
+    relatorio['ids'].extend(pedido.id for pedido in pedidos)
+
+
+def importar_pedidos(linhas, tamanho_lote=TAMANHO_LOTE_IMPORTACAO):
+    """
+    Importa pedidos a partir das linhas de ler_linhas(). Cada linha é um item
+    (modelo × grade); as linhas consecutivas com a mesma referência em 'pedido'
+    formam um pedido. Modelos são resolvidos pelo nome e clientes pelo
+    cpf_cnpj, por mapas montados antes da validação. Os pedidos válidos são
+    gravados em lotes de `tamanho_lote`, cada um em sua transação; um pedido
+    com qualquer linha inválida é descartado e os demais seguem. Retorna um
+    relatório com os pedidos criados e os erros por linha.
+    """
+    modelos = {modelo.nome.casefold(): modelo for modelo in ModeloProduto.objects.only('id', 'nome', 'tipo')}
+    relatorio = {'pedidos_criados': 0, 'itens_criados': 0, 'pedidos_rejeitados': 0, 'ids': [], 'erros': []}
+
+    lote = []
+    for pedido in _agrupar_pedidos(linhas):
+        lote.append(pedido)
+        if len(lote) >= tamanho_lote:
+            _gravar_lote(lote, modelos, relatorio)
+            lote = []
+    if lote:
+        _gravar_lote(lote, modelos, relatorio)
+    return relatorio
@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.comercial.comissoes import calcular_comissoes, inicio_do_mes, reconstruir_resumos
+
+
+def _data(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Data inválida: {valor} (use AAAA-MM-DD).")
+
+
+class Command(BaseCommand):
+    help = "Gera as comissões dos pedidos elegíveis de um período e atualiza os resumos mensais dos vendedores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', type=_data, help="Primeiro dia (padrão: início do mês atual).")
+        parser.add_argument('--fim', type=_data, help="Último dia (padrão: hoje).")
+        parser.add_argument('--vendedor', type=int, action='append', help="Id do vendedor (pode repetir).")
+        parser.add_argument('--reconstruir', action='store_true', help="Recalcula os resumos mensais a partir das comissões.")
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        inicio = options['inicio'] or inicio_do_mes(hoje)
+        fim = options['fim'] or hoje
+        if inicio > fim:
+            raise CommandError("--inicio deve ser anterior ou igual a --fim.")
+
+        comissoes = calcular_comissoes(inicio, fim, options['vendedor'])
+        total = sum(comissao.valor for comissao in comissoes)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(comissoes)} comissão(ões) gerada(s) entre {inicio} e {fim}, total {total}."
+        ))
+
+        if options['reconstruir']:
+            reconstruir_resumos()
+            self.stdout.write(self.style.SUCCESS("Resumos mensais recalculados."))
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.comercial.mrp import calcular_mrp
+
+
+class Command(BaseCommand):
+    help = "Confronta a demanda de todos os pedidos em aberto com o estoque e lista as faltas de material."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apenas-faltas', action='store_true', help="Lista apenas os materiais que vão faltar.")
+        parser.add_argument('--json', action='store_true', help="Emite o resultado em JSON.")
+
+    def handle(self, *args, **options):
+        resultado = calcular_mrp()
+        if options['apenas_faltas']:
+            resultado = [linha for linha in resultado if linha['primeira_falta_pedido_id'] is not None]
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, cls=JSONEncoder, ensure_ascii=False, indent=2))
+            return
+
+        for linha in resultado:
+            if linha['primeira_falta_pedido_id'] is None:
+                situacao = self.style.SUCCESS("suficiente")
+            else:
+                situacao = self.style.ERROR(
+                    f"falta a partir do pedido {linha['primeira_falta_pedido_id']} "
+                    f"(prazo {linha['primeira_falta_prazo'] or 'não definido'}), déficit total {linha['deficit']}"
+                )
+            self.stdout.write(
+                f"{linha['nome']}: estoque {linha['estoque']} {linha['unidade']}, "
+                f"demanda {linha['demanda_total']} em {linha['pedidos']} pedido(s) - {situacao}"
+            )
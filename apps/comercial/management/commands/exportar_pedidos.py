@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.comercial.exportacao import TAMANHO_BLOCO_EXPORTACAO, filtrar_pedidos, gerar_csv
+from apps.comercial.models import PedidoVenda
+
+
+def _data(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Data inválida: {valor} (use AAAA-MM-DD).")
+
+
+class Command(BaseCommand):
+    help = "Exporta pedidos, itens, grade de tamanhos e materiais em CSV, uma linha por item."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', default=[], help="Status a exportar (pode repetir).")
+        parser.add_argument('--cliente', type=int, help="Id do cliente.")
+        parser.add_argument('--data-inicio', type=_data, help="Primeira data do pedido (AAAA-MM-DD).")
+        parser.add_argument('--data-fim', type=_data, help="Última data do pedido (AAAA-MM-DD).")
+        parser.add_argument('--saida', help="Arquivo de destino; sem ele, o CSV vai para a saída padrão.")
+        parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO_EXPORTACAO, help="Pedidos lidos por consulta.")
+
+    def handle(self, *args, **options):
+        validos = dict(PedidoVenda.STATUS_CHOICES)
+        invalidos = [status for status in options['status'] if status not in validos]
+        if invalidos:
+            raise CommandError(f"Status inválidos: {', '.join(invalidos)}.")
+
+        queryset = filtrar_pedidos(
+            status=options['status'],
+            cliente=options['cliente'],
+            data_inicio=options['data_inicio'],
+            data_fim=options['data_fim'],
+        )
+        linhas = gerar_csv(queryset, options['bloco'])
+
+        if not options['saida']:
+            for linha in linhas:
+                self.stdout.write(linha, ending='')
+            return
+
+        total = -1  # o cabeçalho não conta
+        with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+            for linha in linhas:
+                arquivo.write(linha)
+                total += 1
+        self.stderr.write(self.style.SUCCESS(f"{total} linha(s) exportada(s) para {options['saida']}."))
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.comercial.importacao import FORMATOS_IMPORTACAO, TAMANHO_LOTE_IMPORTACAO, importar_pedidos, ler_linhas
+
+
+class Command(BaseCommand):
+    help = "Importa pedidos de um arquivo CSV ou jsonl com uma linha por item (modelo × grade de tamanhos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo.")
+        parser.add_argument('--formato', choices=FORMATOS_IMPORTACAO, help="Formato; sem ele, vem da extensão.")
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_IMPORTACAO, help="Pedidos gravados por transação.")
+        parser.add_argument('--json', action='store_true', help="Emite o relatório em JSON.")
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or options['arquivo'].rsplit('.', 1)[-1].lower()
+        if formato not in FORMATOS_IMPORTACAO:
+            raise CommandError("Informe o formato com --formato (csv ou jsonl).")
+
+        try:
+            with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+                relatorio = importar_pedidos(ler_linhas(arquivo, formato), options['lote'])
+        except OSError as e:
+            raise CommandError(f"Não foi possível ler o arquivo: {e}")
+        except UnicodeDecodeError:
+            raise CommandError("O arquivo deve estar em UTF-8.")
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio, ensure_ascii=False, indent=2))
+            return
+
+        for erro in relatorio['erros']:
+            referencia = f" (pedido {erro['pedido']})" if erro['pedido'] else ''
+            self.stdout.write(self.style.ERROR(f"Linha {erro['linha']}{referencia}: {' '.join(erro['erros'])}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{relatorio['pedidos_criados']} pedido(s) e {relatorio['itens_criados']} item(ns) importados; "
+            f"{relatorio['pedidos_rejeitados']} pedido(s) rejeitado(s)."
+        ))
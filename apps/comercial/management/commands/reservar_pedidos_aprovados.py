@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.comercial.models import PedidoVenda
+from apps.estoque.reservas import reservar_pedidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Reserva os materiais dos pedidos aprovados que ainda não tiveram os materiais baixados. "
+        "Execute uma vez após a implantação das reservas; repetir é seguro, pois as reservas de cada "
+        "pedido são substituídas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Pedidos reservados por transação.")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote deve ser maior que zero.")
+
+        pedido_ids = list(
+            PedidoVenda.objects.filter(status='APROVADO', materiais_baixados=False).order_by('id').values_list('id', flat=True)
+        )
+        reservas = 0
+        for inicio in range(0, len(pedido_ids), options['lote']):
+            reservas += len(reservar_pedidos(pedido_ids[inicio:inicio + options['lote']]))
+        self.stdout.write(self.style.SUCCESS(
+            f"{reservas} reserva(s) gravada(s) para {len(pedido_ids)} pedido(s) aprovado(s)."
+        ))
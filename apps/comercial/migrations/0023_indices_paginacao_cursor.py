@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0001_initial'),
+        ('comercial', '0022_pedidovenda_materiais_necessarios'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedidovenda',
+            index=models.Index(fields=['-data_pedido', '-id'], name='comercial_p_data_pe_12662a_idx'),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:16
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def preparar_comissoes(apps, schema_editor):
+    """
+    Preenche a competência das comissões existentes com o mês (no fuso local)
+    do pedido. Pedidos com mais de uma comissão impedem a restrição de
+    unicidade; a migração para com a lista deles em vez de apagar registros
+    financeiros, para que sejam resolvidos antes.
+    """
+    Comissao = apps.get_model('comercial', 'Comissao')
+    duplicados = list(
+        Comissao.objects.values('pedido_id').annotate(total=Count('id')).filter(total__gt=1)
+        .order_by('pedido_id').values_list('pedido_id', flat=True)
+    )
+    if duplicados:
+        raise RuntimeError(
+            "Há pedidos com mais de uma comissão; resolva-os antes de migrar "
+            f"(restrição comissao_unica_por_pedido). Pedidos: {', '.join(map(str, duplicados))}."
+        )
+
+    comissoes = list(Comissao.objects.select_related('pedido').only('id', 'pedido__data_pedido'))
+    for comissao in comissoes:
+        comissao.competencia = timezone.localtime(comissao.pedido.data_pedido).date().replace(day=1)
+    Comissao.objects.bulk_update(comissoes, ['competencia'], batch_size=2000)
+
+
+def preencher_resumos(apps, schema_editor):
+    """Monta os resumos mensais dos vendedores a partir das comissões existentes."""
+    Comissao = apps.get_model('comercial', 'Comissao')
+    Vendedor = apps.get_model('comercial', 'Vendedor')
+    ResumoVendedorMensal = apps.get_model('comercial', 'ResumoVendedorMensal')
+
+    metas = dict(Vendedor.objects.values_list('id', 'meta_mensal'))
+    linhas = Comissao.objects.filter(competencia__isnull=False, pedido__valor_total__isnull=False).order_by().values(
+        'vendedor_id', 'competencia'
+    ).annotate(total_vendas=Sum('pedido__valor_total'), total_comissao=Sum('valor'), pedidos=Count('id'))
+
+    resumos = []
+    for linha in linhas:
+        meta = metas.get(linha['vendedor_id']) or 0
+        resumos.append(ResumoVendedorMensal(
+            meta=meta,
+            percentual_meta=(linha['total_vendas'] * 100 / meta).quantize(Decimal('0.01')) if meta > 0 else 0,
+            **linha,
+        ))
+    ResumoVendedorMensal.objects.bulk_create(resumos, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0023_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVendedorMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('competencia', models.DateField(help_text='Primeiro dia do mês')),
+                ('total_vendas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_comissao', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('meta', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('percentual_meta', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal do Vendedor',
+                'verbose_name_plural': 'Resumos Mensais dos Vendedores',
+                'ordering': ['-competencia', '-total_vendas'],
+            },
+        ),
+        migrations.AddField(
+            model_name='comissao',
+            name='competencia',
+            field=models.DateField(blank=True, help_text='Primeiro dia do mês do pedido', null=True),
+        ),
+        migrations.AddField(
+            model_name='comissao',
+            name='taxa',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Percentual aplicado ao valor do pedido', max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedidovenda',
+            name='vendedor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos', to='comercial.vendedor'),
+        ),
+        migrations.AddField(
+            model_name='vendedor',
+            name='taxa_comissao',
+            field=models.DecimalField(decimal_places=2, default=5.0, help_text='Percentual de comissão sobre o valor do pedido', max_digits=5),
+        ),
+        migrations.RunPython(preparar_comissoes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comissao',
+            constraint=models.UniqueConstraint(fields=('pedido',), name='comissao_unica_por_pedido'),
+        ),
+        migrations.AddField(
+            model_name='resumovendedormensal',
+            name='vendedor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_mensais', to='comercial.vendedor'),
+        ),
+        migrations.AddIndex(
+            model_name='resumovendedormensal',
+            index=models.Index(fields=['competencia', '-total_vendas'], name='comercial_r_compete_ac958b_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resumovendedormensal',
+            unique_together={('vendedor', 'competencia')},
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
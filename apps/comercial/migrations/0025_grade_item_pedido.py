@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_grades(apps, schema_editor):
+    """Copia a grade JSON dos itens existentes para as linhas de grade, em blocos."""
+    ItemPedido = apps.get_model('comercial', 'ItemPedido')
+    GradeItemPedido = apps.get_model('comercial', 'GradeItemPedido')
+
+    linhas = []
+    itens = ItemPedido.objects.values_list('id', 'pedido_id', 'modelo_base_id', 'tamanhos')
+    for item_id, pedido_id, modelo_base_id, tamanhos in itens.iterator(chunk_size=2000):
+        if not isinstance(tamanhos, dict):
+            continue
+        for tamanho, quantidade in tamanhos.items():
+            try:
+                quantidade = int(quantidade)
+            except (TypeError, ValueError):
+                continue
+            if quantidade > 0:
+                linhas.append(GradeItemPedido(
+                    item_id=item_id, pedido_id=pedido_id, modelo_base_id=modelo_base_id,
+                    tamanho=tamanho, quantidade=quantidade,
+                ))
+        if len(linhas) >= 2000:
+            GradeItemPedido.objects.bulk_create(linhas)
+            linhas = []
+    GradeItemPedido.objects.bulk_create(linhas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0024_comissoes_resumo_mensal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeItemPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tamanho', models.CharField(max_length=3)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade', to='comercial.itempedido')),
+                ('modelo_base', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='grades_itens', to='comercial.modeloproduto')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grades_itens', to='comercial.pedidovenda')),
+            ],
+            options={
+                'verbose_name': 'Grade do Item de Pedido',
+                'verbose_name_plural': 'Grades dos Itens de Pedido',
+                'indexes': [models.Index(fields=['modelo_base', 'tamanho'], name='comercial_g_modelo__23e13a_idx')],
+                'unique_together': {('item', 'tamanho')},
+            },
+        ),
+        migrations.RunPython(preencher_grades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_necessidades(apps, schema_editor):
+    """Calcula as linhas de necessidade dos itens existentes a partir das fichas técnicas."""
+    ConsumoMaterial = apps.get_model('comercial', 'ConsumoMaterial')
+    ItemPedido = apps.get_model('comercial', 'ItemPedido')
+    NecessidadeMaterial = apps.get_model('comercial', 'NecessidadeMaterial')
+
+    fichas = {}
+    for modelo_id, tamanho, material_id, quantidade in ConsumoMaterial.objects.values_list(
+        'modelo_id', 'tamanho', 'material_id', 'quantidade'
+    ):
+        fichas.setdefault(modelo_id, {}).setdefault(tamanho, []).append((material_id, quantidade))
+
+    linhas = []
+    itens = ItemPedido.objects.filter(modelo_base_id__in=list(fichas)).values_list('id', 'pedido_id', 'modelo_base_id', 'tamanhos')
+    for item_id, pedido_id, modelo_id, tamanhos in itens.iterator(chunk_size=2000):
+        if not isinstance(tamanhos, dict):
+            continue
+        totais = {}
+        for tamanho, pecas in tamanhos.items():
+            try:
+                pecas = int(pecas)
+            except (TypeError, ValueError):
+                continue
+            if pecas <= 0:
+                continue
+            for material_id, consumo in fichas[modelo_id].get(tamanho, ()):
+                totais[material_id] = totais.get(material_id, 0) + consumo * pecas
+        linhas += [
+            NecessidadeMaterial(item_id=item_id, pedido_id=pedido_id, material_id=material_id, quantidade=quantidade)
+            for material_id, quantidade in totais.items()
+        ]
+        if len(linhas) >= 2000:
+            NecessidadeMaterial.objects.bulk_create(linhas)
+            linhas = []
+    NecessidadeMaterial.objects.bulk_create(linhas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0025_grade_item_pedido'),
+        ('estoque', '0015_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NecessidadeMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades', to='comercial.itempedido')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades_pedidos', to='estoque.materiaprima')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades_materiais', to='comercial.pedidovenda')),
+            ],
+            options={
+                'verbose_name': 'Necessidade de Material do Item',
+                'verbose_name_plural': 'Necessidades de Materiais dos Itens',
+                'indexes': [models.Index(fields=['material', 'pedido'], name='comercial_n_materia_42eb4b_idx')],
+                'unique_together': {('item', 'material')},
+            },
+        ),
+        migrations.RunPython(preencher_necessidades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_valor_pedido(apps, schema_editor):
+    """
+    Copia para as comissões existentes o valor atual do pedido, que é o que os
+    resumos mensais somaram até aqui.
+    """
+    Comissao = apps.get_model('comercial', 'Comissao')
+    PedidoVenda = apps.get_model('comercial', 'PedidoVenda')
+    Comissao.objects.update(
+        valor_pedido=Subquery(PedidoVenda.objects.filter(id=OuterRef('pedido_id')).values('valor_total')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0026_necessidade_material'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comissao',
+            name='valor_pedido',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Valor do pedido somado ao resumo mensal', max_digits=10, null=True),
+        ),
+        migrations.RunPython(preencher_valor_pedido, migrations.RunPython.noop),
+    ]
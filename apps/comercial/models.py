@@ -34,6 +34,7 @@ class PedidoVenda(BaseModel):
     ]
 
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='pedidos_venda')
+    vendedor = models.ForeignKey('Vendedor', on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos')
     data_pedido = models.DateTimeField(auto_now_add=True)
     prazo = models.DateField(null=True, blank=True)
     prioridade = models.CharField(max_length=20, choices=PRIORIDADE_CHOICES, default='NORMAL')
@@ -52,6 +53,8 @@ class PedidoVenda(BaseModel):
         indexes = [
             models.Index(fields=['cliente', 'data_pedido']),
             models.Index(fields=['status']),
+            # Ordenação da paginação por cursor da lista de pedidos
+            models.Index(fields=['-data_pedido', '-id']),
         ]
 
     def __str__(self):
@@ -125,27 +128,16 @@ class ItemPedido(BaseModel):
     def calcular_materiais(self):
         """
         Calcula a necessidade total de materiais com base na grade de tamanhos e no consumo por modelo.
+        O consumo vem da ficha técnica compilada em cache (apps.comercial.bom).
         """
-        if not self.modelo_base or not self.tamanhos:
+        from .bom import obter_ficha
+
+        if not self.modelo_base_id or not self.tamanhos:
             self.materiais = []
             return
 
-        necessidades = {}
-        for tamanho, quantidade_pecas in self.tamanhos.items():
-            if quantidade_pecas <= 0:
-                continue
-            
-            consumo_por_tamanho = ConsumoMaterial.objects.filter(modelo=self.modelo_base, tamanho=tamanho)
-            for consumo in consumo_por_tamanho:
-                material_id = consumo.material.id
-                quantidade_necessaria = consumo.quantidade * quantidade_pecas
-                
-                if material_id not in necessidades:
-                    necessidades[material_id] = {'material_id': material_id, 'nome': consumo.material.name, 'quantidade': 0, 'unidade': consumo.material.get_unidade_medida_display()}
-                
-                necessidades[material_id]['quantidade'] += float(quantidade_necessaria)
-
-        self.materiais = list(necessidades.values())
+        ficha = obter_ficha(self.modelo_base_id)
+        self.materiais = ficha.calcular(self.tamanhos) if ficha else []
 
     def save(self, *args, **kwargs):
         self.calcular_materiais()
@@ -158,6 +150,52 @@ class ItemPedido(BaseModel):
     def __str__(self):
         return f"Item de Pedido {self.id} - {self.get_tipo_display()} ({self.modelo})"
 
+class GradeItemPedido(models.Model):
+    """
+    Grade de tamanhos do item em linhas (uma por tamanho com peças), mantida em
+    sincronia com ItemPedido.tamanhos pelas gravações de itens. Pedido e modelo
+    são copiados do item para que as somas por modelo, tamanho e período sejam
+    feitas no banco sem passar pelos itens.
+    """
+    item = models.ForeignKey(ItemPedido, on_delete=models.CASCADE, related_name='grade')
+    pedido = models.ForeignKey(PedidoVenda, on_delete=models.CASCADE, related_name='grades_itens')
+    modelo_base = models.ForeignKey(ModeloProduto, on_delete=models.SET_NULL, null=True, blank=True, related_name='grades_itens')
+    tamanho = models.CharField(max_length=3)
+    quantidade = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Grade do Item de Pedido"
+        verbose_name_plural = "Grades dos Itens de Pedido"
+        unique_together = ('item', 'tamanho')
+        indexes = [
+            models.Index(fields=['modelo_base', 'tamanho']),
+        ]
+
+    def __str__(self):
+        return f"Item {self.item_id} - {self.tamanho}: {self.quantidade}"
+
+class NecessidadeMaterial(models.Model):
+    """
+    Necessidade de um material para um item (grade × ficha técnica), em linhas,
+    gravada junto com ItemPedido.materiais. Permite somar a demanda por
+    material e por pedido no banco e cruzá-la com MateriaPrima.
+    """
+    item = models.ForeignKey(ItemPedido, on_delete=models.CASCADE, related_name='necessidades')
+    pedido = models.ForeignKey(PedidoVenda, on_delete=models.CASCADE, related_name='necessidades_materiais')
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='necessidades_pedidos')
+    quantidade = models.DecimalField(max_digits=14, decimal_places=3)
+
+    class Meta:
+        verbose_name = "Necessidade de Material do Item"
+        verbose_name_plural = "Necessidades de Materiais dos Itens"
+        unique_together = ('item', 'material')
+        indexes = [
+            models.Index(fields=['material', 'pedido']),
+        ]
+
+    def __str__(self):
+        return f"Item {self.item_id} - material {self.material_id}: {self.quantidade}"
+
 class Orcamento(BaseModel):
     STATUS_CHOICES = [
         ('PENDENTE', 'Pendente'),
@@ -187,6 +225,7 @@ class Vendedor(BaseModel):
     nome = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     meta_mensal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    taxa_comissao = models.DecimalField(max_digits=5, decimal_places=2, default=5.00, help_text="Percentual de comissão sobre o valor do pedido")
 
     class Meta:
         verbose_name = "Vendedor"
@@ -203,6 +242,9 @@ class Comissao(BaseModel):
     vendedor = models.ForeignKey(Vendedor, on_delete=models.CASCADE, related_name='comissoes')
     pedido = models.ForeignKey(PedidoVenda, on_delete=models.CASCADE, related_name='comissoes')
     valor = models.DecimalField(max_digits=10, decimal_places=2)
+    taxa = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, help_text="Percentual aplicado ao valor do pedido")
+    valor_pedido = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Valor do pedido somado ao resumo mensal")
+    competencia = models.DateField(null=True, blank=True, help_text="Primeiro dia do mês do pedido")
     data_pagamento = models.DateField(null=True, blank=True)
 
     class Meta:
@@ -213,6 +255,52 @@ class Comissao(BaseModel):
             models.Index(fields=['vendedor', 'data_pagamento']),
             models.Index(fields=['pedido']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['pedido'], name='comissao_unica_por_pedido'),
+        ]
 
     def __str__(self):
         return f"Comissão de {self.valor} para {self.vendedor.nome} (Pedido: {self.pedido.id})"
+
+class ResumoVendedorMensal(models.Model):
+    """
+    Acumulado mensal de cada vendedor, mantido pelo motor de comissões com
+    UPDATEs incrementais. O ranking lê esta tabela em vez de agregar pedidos.
+    """
+    vendedor = models.ForeignKey(Vendedor, on_delete=models.CASCADE, related_name='resumos_mensais')
+    competencia = models.DateField(help_text="Primeiro dia do mês")
+    total_vendas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_comissao = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pedidos = models.PositiveIntegerField(default=0)
+    meta = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    percentual_meta = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumo Mensal do Vendedor"
+        verbose_name_plural = "Resumos Mensais dos Vendedores"
+        ordering = ['-competencia', '-total_vendas']
+        unique_together = ('vendedor', 'competencia')
+        indexes = [
+            models.Index(fields=['competencia', '-total_vendas']),
+        ]
+
+    def __str__(self):
+        return f"{self.vendedor.nome} - {self.competencia:%m/%Y}: {self.total_vendas}"
+
+class VersaoCache(models.Model):
+    """
+    Versão atual de um conjunto de dados derivados (fichas técnicas, estoque,
+    materiais de um pedido). Cada invalidação grava um token novo na mesma
+    transação que altera os dados, então todos os processos enxergam a mesma
+    versão e um rollback descarta também a invalidação.
+    """
+    chave = models.CharField(max_length=100, unique=True)
+    versao = models.CharField(max_length=32)
+
+    class Meta:
+        verbose_name = "Versão de Cache"
+        verbose_name_plural = "Versões de Cache"
+
+    def __str__(self):
+        return f"{self.chave}: {self.versao}"
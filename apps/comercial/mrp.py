@@ -0,0 +1,122 @@
+from decimal import Decimal
+
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from apps.estoque.models import MateriaPrima
+from .bom import UNIDADES_MEDIDA
+from .models import PedidoVenda, NecessidadeMaterial
+from .necessidades import somar_necessidades
+
+# Pedidos nesses status não consomem mais matéria-prima
+STATUS_ENCERRADOS = ['CONCLUIDO', 'CANCELADO', 'REJEITADO']
+
+
+def pedidos_em_aberto():
+    """
+    Pedidos que ainda vão consumir matéria-prima, na ordem em que serão
+    atendidos: prazo (sem prazo por último), urgentes primeiro e data do pedido.
+    """
+    return PedidoVenda.objects.exclude(status__in=STATUS_ENCERRADOS).filter(materiais_baixados=False).annotate(
+        ordem_prioridade=Case(
+            When(prioridade='URGENTE', then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by(F('prazo').asc(nulls_last=True), 'ordem_prioridade', 'data_pedido', 'id')
+
+
+def calcular_mrp(pedidos=None):
+    """
+    Confronta a demanda acumulada dos pedidos em aberto com o estoque de cada
+    material e retorna, por material, a demanda total, o saldo projetado e o
+    primeiro pedido (e prazo) em que o estoque deixa de ser suficiente.
+
+    São três consultas independentemente do número de pedidos: pedidos,
+    necessidades somadas por pedido e material e estoque; a compensação é
+    uma única passagem linear.
+    """
+    if pedidos is None:
+        pedidos = pedidos_em_aberto()
+    sequencia = list(pedidos.values_list('id', 'prazo'))
+
+    necessidades = somar_necessidades(NecessidadeMaterial.objects.filter(pedido__in=pedidos.values('id')))
+
+    material_ids = {material_id for por_material in necessidades.values() for material_id in por_material}
+    estoque = {
+        material['id']: material
+        for material in MateriaPrima.objects.filter(id__in=list(material_ids)).values('id', 'name', 'quantity')
+    }
+
+    resultado = {}
+    for pedido_id, prazo in sequencia:
+        for material_id, necessidade in necessidades.get(pedido_id, {}).items():
+            material = estoque.get(material_id)
+            if material is None:
+                continue
+            linha = resultado.get(material_id)
+            if linha is None:
+                linha = resultado[material_id] = {
+                    'material_id': material_id,
+                    'nome': material['name'],
+                    'unidade': necessidade['unidade'],
+                    'estoque': material['quantity'],
+                    'demanda_total': Decimal('0'),
+                    'saldo_projetado': material['quantity'],
+                    'pedidos': 0,
+                    'primeira_falta_pedido_id': None,
+                    'primeira_falta_prazo': None,
+                    'deficit_primeira_falta': Decimal('0'),
+                }
+            linha['demanda_total'] += necessidade['quantidade']
+            linha['saldo_projetado'] -= necessidade['quantidade']
+            linha['pedidos'] += 1
+            if linha['saldo_projetado'] < 0 and linha['primeira_falta_pedido_id'] is None:
+                linha['primeira_falta_pedido_id'] = pedido_id
+                linha['primeira_falta_prazo'] = prazo
+                linha['deficit_primeira_falta'] = -linha['saldo_projetado']
+
+    for linha in resultado.values():
+        linha['deficit'] = max(-linha['saldo_projetado'], Decimal('0'))
+
+    # Materiais em falta primeiro, pela data da primeira falta
+    return sorted(
+        resultado.values(),
+        key=lambda linha: (
+            linha['primeira_falta_pedido_id'] is None,
+            linha['primeira_falta_prazo'] is None,
+            linha['primeira_falta_prazo'] or 0,
+            linha['nome'],
+        ),
+    )
+
+
+def demanda_em_aberto(apenas_faltas=False):
+    """
+    Demanda total de cada material nos pedidos em aberto, com o estoque, em um
+    único SUM ... GROUP BY sobre NecessidadeMaterial ligado a MateriaPrima.
+    Com apenas_faltas, só os materiais cuja demanda supera o estoque (filtro
+    aplicado no HAVING).
+    """
+    linhas = NecessidadeMaterial.objects.filter(pedido__materiais_baixados=False).exclude(
+        pedido__status__in=STATUS_ENCERRADOS
+    ).values(
+        'material_id', 'material__name', 'material__unidade_medida', 'material__quantity', 'material__reserved',
+    ).annotate(
+        demanda=Sum('quantidade'), pedidos=Count('pedido_id', distinct=True),
+    ).order_by('material__name')
+    if apenas_faltas:
+        linhas = linhas.filter(demanda__gt=F('material__quantity'))
+
+    return [
+        {
+            'material_id': linha['material_id'],
+            'nome': linha['material__name'],
+            'unidade': UNIDADES_MEDIDA.get(linha['material__unidade_medida'], linha['material__unidade_medida']),
+            'estoque': linha['material__quantity'],
+            'reservado': linha['material__reserved'],
+            'demanda': linha['demanda'],
+            'pedidos': linha['pedidos'],
+            'falta': max(linha['demanda'] - linha['material__quantity'], Decimal('0')),
+        }
+        for linha in linhas
+    ]
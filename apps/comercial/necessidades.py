@@ -0,0 +1,145 @@
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Sum
+
+from .bom import UNIDADES_MEDIDA, obter_fichas, normalizar_grade
+
+
+def _ids_pedidos(pedidos):
+    if isinstance(pedidos, (int, models.Model)):
+        pedidos = [pedidos]
+    return list(dict.fromkeys(getattr(pedido, 'pk', pedido) for pedido in pedidos))
+
+
+def agregar_grades(linhas):
+    """
+    Motor de necessidades de materiais.
+
+    Recebe linhas (chave, modelo_id, tamanhos) — tipicamente (pedido_id, modelo,
+    grade) de cada item — e retorna {chave: {material_id: necessidade}}. As grades
+    de todos os itens que compartilham chave e modelo são somadas em um único
+    vetor por tamanho antes da multiplicação pela matriz de consumo, e todas as
+    fichas técnicas envolvidas são carregadas de uma vez.
+    """
+    grades = {}
+    for chave, modelo_id, tamanhos in linhas:
+        por_modelo = grades.setdefault(chave, {})
+        if not modelo_id:
+            continue
+        grade = por_modelo.setdefault(modelo_id, {})
+        for tamanho, quantidade in normalizar_grade(tamanhos).items():
+            grade[tamanho] = grade.get(tamanho, 0) + quantidade
+
+    fichas = obter_fichas({modelo_id for por_modelo in grades.values() for modelo_id in por_modelo})
+
+    resultado = {}
+    for chave, por_modelo in grades.items():
+        necessidades = resultado.setdefault(chave, {})
+        for modelo_id, grade in por_modelo.items():
+            ficha = fichas.get(modelo_id)
+            if ficha is None:
+                continue
+            for material_id, quantidade in ficha.multiplicar(grade).items():
+                if material_id not in necessidades:
+                    material = ficha.materiais[material_id]
+                    necessidades[material_id] = {
+                        'material_id': material_id,
+                        'nome': material['nome'],
+                        'unidade': material['unidade'],
+                        'quantidade': Decimal('0'),
+                    }
+                necessidades[material_id]['quantidade'] += quantidade
+    return resultado
+
+
+def somar_necessidades(linhas):
+    """
+    Soma no banco as linhas de NecessidadeMaterial (um queryset já filtrado)
+    por pedido e material, com nome e unidade lidos de MateriaPrima no mesmo
+    SELECT. Retorna {pedido_id: {material_id: necessidade}}.
+    """
+    resultado = {}
+    somas = linhas.values('pedido_id', 'material_id', 'material__name', 'material__unidade_medida').annotate(
+        total=Sum('quantidade')
+    ).order_by('pedido_id', 'material_id')
+    for linha in somas:
+        resultado.setdefault(linha['pedido_id'], {})[linha['material_id']] = {
+            'material_id': linha['material_id'],
+            'nome': linha['material__name'],
+            'unidade': UNIDADES_MEDIDA.get(linha['material__unidade_medida'], linha['material__unidade_medida']),
+            'quantidade': linha['total'],
+        }
+    return resultado
+
+
+def calcular_necessidades(pedidos):
+    """
+    Necessidades consolidadas de um PedidoVenda ou de uma lista de pedidos
+    (instâncias ou ids), somadas em SQL sobre NecessidadeMaterial. Retorna
+    {pedido_id: {material_id: necessidade}}, com uma entrada (possivelmente
+    vazia) para cada pedido informado.
+    """
+    from .models import NecessidadeMaterial
+
+    ids = _ids_pedidos(pedidos)
+    if not ids:
+        return {}
+
+    resultado = somar_necessidades(NecessidadeMaterial.objects.filter(pedido_id__in=ids))
+    return {pedido_id: resultado.get(pedido_id, {}) for pedido_id in ids}
+
+
+def calcular_materiais_itens(itens):
+    """
+    Preenche ItemPedido.materiais de vários itens em memória, carregando as
+    fichas técnicas de todos eles de uma só vez.
+    """
+    fichas = obter_fichas({item.modelo_base_id for item in itens})
+    for item in itens:
+        ficha = fichas.get(item.modelo_base_id)
+        item.materiais = ficha.calcular(item.tamanhos) if ficha and item.tamanhos else []
+    return itens
+
+
+def sincronizar_necessidades(itens, novos=False):
+    """
+    Regrava as linhas de NecessidadeMaterial dos itens (já salvos) a partir
+    da grade e da ficha compilada, com um delete filtrado e um bulk_create.
+    Com novos=True os itens acabaram de ser criados e o delete é dispensado.
+    """
+    from .models import NecessidadeMaterial
+
+    itens = list(itens)
+    if not itens:
+        return
+    if not novos:
+        NecessidadeMaterial.objects.filter(item_id__in=[item.id for item in itens]).delete()
+
+    fichas = obter_fichas({item.modelo_base_id for item in itens})
+    linhas = []
+    for item in itens:
+        ficha = fichas.get(item.modelo_base_id)
+        if ficha is None:
+            continue
+        linhas += [
+            NecessidadeMaterial(item_id=item.id, pedido_id=item.pedido_id, material_id=material_id, quantidade=quantidade)
+            for material_id, quantidade in ficha.multiplicar(normalizar_grade(item.tamanhos)).items()
+        ]
+    NecessidadeMaterial.objects.bulk_create(linhas)
+
+
+def serializar_necessidades(necessidades):
+    """
+    Converte as necessidades de um pedido para o formato JSON gravado em
+    PedidoVenda.materiais_necessarios, em ordem de material.
+    """
+    return [
+        {
+            'material_id': material_id,
+            'nome': dados['nome'],
+            'quantidade': float(dados['quantidade']),
+            'unidade': dados['unidade'],
+        }
+        for material_id, dados in sorted(necessidades.items())
+    ]
@@ -0,0 +1,232 @@
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .necessidades import calcular_materiais_itens, calcular_necessidades, serializar_necessidades, sincronizar_necessidades
+from .versoes import chave_versao_pedido, invalidar_versao
+
+# Quantidade de itens (ou pedidos) carregados e gravados por vez no recálculo
+# disparado por uma mudança de ficha técnica ou de material.
+TAMANHO_LOTE_RECALCULO = 500
+
+# Estado por thread: pedidos, modelos e materiais marcados como sujos na
+# transação corrente, o callback de on_commit pendente de cada processamento
+# e profundidade dos blocos em que o recálculo automático está suspenso.
+_estado = threading.local()
+
+
+def _agendado(processar):
+    """
+    Se o callback de `processar` da transação corrente ainda está pendente.
+    O estado guarda só uma referência fraca ao callback: no commit ele mesmo
+    a remove (_executado) e, no rollback, o Django descarta o callback e a
+    referência morre junto, sem que a fila do on_commit precise ser lida.
+    """
+    referencia = getattr(_estado, 'agendados', {}).get(processar)
+    return (
+        referencia is not None
+        and referencia() is not None
+        and transaction.get_connection().in_atomic_block
+    )
+
+
+def _agendar(processar, limpar):
+    """
+    Registra `processar` no on_commit uma única vez por transação. Sem
+    callback pendente, a transação em que os ids foram marcados já terminou:
+    no commit eles foram consumidos e, no rollback (total ou do savepoint em
+    que foram marcados), não valem mais. Nesse caso `limpar` zera os
+    conjuntos antes da nova marcação. Retorna uma função que registra o
+    callback depois de os ids entrarem nos conjuntos, porque fora de uma
+    transação on_commit executa na hora.
+    """
+    if _agendado(processar):
+        return lambda: None
+    limpar()
+
+    def registrar():
+        # Um callback novo por transação; o on_commit guarda a única
+        # referência forte a ele
+        callback = partial(processar)
+        if not hasattr(_estado, 'agendados'):
+            _estado.agendados = {}
+        _estado.agendados[processar] = weakref.ref(callback)
+        transaction.on_commit(callback)
+    return registrar
+
+
+def _executado(processar):
+    getattr(_estado, 'agendados', {}).pop(processar, None)
+
+
+def _limpar_pendentes():
+    _estado.pedidos = set()
+
+
+def _limpar_dependencias():
+    _estado.modelos, _estado.materiais = set(), set()
+
+
+def _pendentes():
+    if not hasattr(_estado, 'pedidos'):
+        _limpar_pendentes()
+    return _estado.pedidos
+
+
+def _dependencias_pendentes():
+    if not hasattr(_estado, 'modelos'):
+        _limpar_dependencias()
+    return _estado.modelos, _estado.materiais
+
+
+def recalculo_suspenso_ativo():
+    return getattr(_estado, 'suspenso', 0) > 0
+
+
+@contextmanager
+def recalculo_suspenso():
+    """
+    Suspende o recálculo disparado pelos signals de ItemPedido. Usado pelos
+    caminhos em lote, que chamam recalcular_pedidos() explicitamente ao final.
+    """
+    _estado.suspenso = getattr(_estado, 'suspenso', 0) + 1
+    try:
+        yield
+    finally:
+        _estado.suspenso -= 1
+
+
+def marcar_pedido(pedido_id):
+    """
+    Marca o pedido como sujo. Cada pedido marcado é recalculado uma única vez,
+    no commit da transação corrente (ou imediatamente, fora de uma transação).
+    """
+    if recalculo_suspenso_ativo():
+        return
+    invalidar_versao(chave_versao_pedido(pedido_id))
+    registrar = _agendar(_processar_pendentes, _limpar_pendentes)
+    _pendentes().add(pedido_id)
+    registrar()
+
+
+def _processar_pendentes():
+    _executado(_processar_pendentes)
+    pedido_ids = _pendentes()
+    _limpar_pendentes()
+    if pedido_ids:
+        recalcular_pedidos(pedido_ids)
+
+
+def recalcular_pedidos(pedido_ids):
+    """
+    Recalcula PedidoVenda.materiais_necessarios dos pedidos informados e grava
+    apenas os que mudaram, em um único bulk_update.
+    """
+    from .models import PedidoVenda
+
+    pedido_ids = list(pedido_ids)
+    if not pedido_ids:
+        return []
+
+    necessidades = calcular_necessidades(pedido_ids)
+    agora = timezone.now()
+    alterados = []
+    for pedido in PedidoVenda.objects.filter(id__in=pedido_ids).only('id', 'materiais_necessarios'):
+        materiais_necessarios = serializar_necessidades(necessidades[pedido.id])
+        if materiais_necessarios != pedido.materiais_necessarios:
+            pedido.materiais_necessarios = materiais_necessarios
+            pedido.updated_at = agora
+            alterados.append(pedido)
+
+    if alterados:
+        PedidoVenda.objects.bulk_update(alterados, ['materiais_necessarios', 'updated_at'])
+    for pedido_id in pedido_ids:
+        invalidar_versao(chave_versao_pedido(pedido_id))
+    return alterados
+
+
+def marcar_modelos(modelo_ids):
+    """
+    Marca fichas técnicas alteradas. No commit, os itens de pedidos em aberto
+    desses modelos (e os seus pedidos) são recalculados, em lotes.
+    """
+    registrar = _agendar(_processar_dependencias, _limpar_dependencias)
+    modelos, _ = _dependencias_pendentes()
+    modelos.update(modelo_ids)
+    registrar()
+
+
+def marcar_materiais(material_ids):
+    """
+    Marca materiais cujo nome ou unidade mudou. No commit, os modelos que usam
+    esses materiais são recalculados como em marcar_modelos().
+    """
+    registrar = _agendar(_processar_dependencias, _limpar_dependencias)
+    _, materiais = _dependencias_pendentes()
+    materiais.update(material_ids)
+    registrar()
+
+
+def _processar_dependencias():
+    _executado(_processar_dependencias)
+    modelos, materiais = _dependencias_pendentes()
+    _limpar_dependencias()
+    if modelos or materiais:
+        recalcular_dependentes(modelo_ids=modelos, material_ids=materiais)
+
+
+def itens_afetados(modelo_ids=(), material_ids=()):
+    """
+    Índice reverso material → modelos → itens: os itens de pedidos em aberto
+    cujo modelo é um dos informados ou consome um dos materiais informados.
+    Usa os índices de ConsumoMaterial.material e ItemPedido.modelo_base.
+    """
+    from .models import ConsumoMaterial, ItemPedido
+    from .mrp import STATUS_ENCERRADOS
+
+    modelos = Q(modelo_base_id__in=list(modelo_ids))
+    if material_ids:
+        modelos |= Q(modelo_base_id__in=ConsumoMaterial.objects.filter(
+            material_id__in=list(material_ids)
+        ).values('modelo_id'))
+    return ItemPedido.objects.filter(modelos, pedido__materiais_baixados=False).exclude(
+        pedido__status__in=STATUS_ENCERRADOS
+    )
+
+
+def recalcular_dependentes(modelo_ids=(), material_ids=()):
+    """
+    Recalcula ItemPedido.materiais dos itens afetados por uma mudança de ficha
+    técnica ou de material e o agregado dos seus pedidos. Os itens são lidos e
+    gravados em lotes de TAMANHO_LOTE_RECALCULO; só os que mudaram são gravados
+    e só os seus pedidos são recalculados. Retorna os ids dos pedidos afetados.
+    """
+    from .models import ItemPedido
+
+    item_ids = list(itens_afetados(modelo_ids, material_ids).order_by('id').values_list('id', flat=True))
+    agora = timezone.now()
+    pedido_ids = set()
+    for inicio in range(0, len(item_ids), TAMANHO_LOTE_RECALCULO):
+        itens = list(ItemPedido.objects.filter(
+            id__in=item_ids[inicio:inicio + TAMANHO_LOTE_RECALCULO]
+        ).only('id', 'pedido_id', 'modelo_base_id', 'tamanhos', 'materiais'))
+        anteriores = {item.id: item.materiais for item in itens}
+        calcular_materiais_itens(itens)
+
+        alterados = [item for item in itens if item.materiais != anteriores[item.id]]
+        for item in alterados:
+            item.updated_at = agora
+        if alterados:
+            ItemPedido.objects.bulk_update(alterados, ['materiais', 'updated_at'])
+            sincronizar_necessidades(alterados)
+        pedido_ids.update(item.pedido_id for item in alterados)
+
+    pedido_ids = sorted(pedido_ids)
+    for inicio in range(0, len(pedido_ids), TAMANHO_LOTE_RECALCULO):
+        recalcular_pedidos(pedido_ids[inicio:inicio + TAMANHO_LOTE_RECALCULO])
+    return pedido_ids
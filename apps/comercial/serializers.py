@@ -1,8 +1,67 @@
 from rest_framework import serializers
-from .models import PedidoVenda, Orcamento, Vendedor, Comissao, ItemPedido, ModeloProduto, ConsumoMaterial
+from rest_framework.validators import UniqueValidator
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
+from .models import PedidoVenda, Orcamento, Vendedor, Comissao, ResumoVendedorMensal, ItemPedido, ModeloProduto, ConsumoMaterial
+from .campos import CamposDinamicosMixin
+from .carregadores import obter_carregadores, registrar_itens
+from .fichas import gravar_consumos
+from .grades import AGRUPAMENTOS_PECAS
+from .gravacao import criar_pedido, atualizar_pedido
+from .importacao import FORMATOS_IMPORTACAO
+from apps.clientes.serializers import ClienteResumoSerializer
 from apps.estoque.models import MateriaPrima
 from apps.estoque.serializers import MateriaPrimaSerializer
 
+class PrimaryKeyPreCarregadoField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que consulta primeiro os objetos pré-carregados pela
+    lista que o contém (PreCarregamentoListSerializer), em vez de fazer uma
+    consulta por item validado.
+    """
+
+    def to_internal_value(self, data):
+        pre_carregados = getattr(self, 'pre_carregados', None)
+        if pre_carregados is not None and not isinstance(data, bool):
+            try:
+                return pre_carregados[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class PreCarregamentoListSerializer(serializers.ListSerializer):
+    """
+    Antes de validar os itens, carrega com um único in_bulk os objetos
+    referenciados por cada PrimaryKeyPreCarregadoField do serializer filho.
+    Na leitura, deixa o filho registrar nos carregadores da requisição o que
+    todos os itens da lista vão consultar (registrar_dependencias).
+    """
+
+    def to_representation(self, data):
+        itens = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        registrar = getattr(self.child, 'registrar_dependencias', None)
+        if registrar is not None:
+            registrar(itens)
+        return super().to_representation(itens)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for nome, campo in self.child.fields.items():
+                if not isinstance(campo, PrimaryKeyPreCarregadoField) or campo.read_only:
+                    continue
+                pks = set()
+                for item in data:
+                    valor = item.get(nome) if isinstance(item, dict) else None
+                    if valor is not None and not isinstance(valor, bool):
+                        try:
+                            pks.add(int(valor))
+                        except (TypeError, ValueError):
+                            pass
+                campo.pre_carregados = campo.get_queryset().in_bulk(pks) if pks else {}
+        return super().to_internal_value(data)
+
+
 class MaterialPedidoSerializer(serializers.Serializer):
     material_id = serializers.IntegerField()
     quantidade = serializers.FloatField()
@@ -10,12 +69,9 @@ class MaterialPedidoSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         # instance is a dict like {'material_id': 1, 'quantidade': 2.5}
-        try:
-            material_obj = MateriaPrima.objects.get(id=instance['material_id'])
-            material_data = MateriaPrimaSerializer(material_obj).data
-        except MateriaPrima.DoesNotExist:
-            material_data = None # Or a default representation indicating missing material
-        
+        material_obj = obter_carregadores(self.context).materiais.obter(instance['material_id'])
+        material_data = MateriaPrimaSerializer(material_obj).data if material_obj is not None else None
+
         return {
             'material_id': instance['material_id'],
             'quantidade': instance['quantidade'],
@@ -23,7 +79,7 @@ class MaterialPedidoSerializer(serializers.Serializer):
         }
 
 class ConsumoMaterialSerializer(serializers.ModelSerializer):
-    material_id = serializers.PrimaryKeyRelatedField(
+    material_id = PrimaryKeyPreCarregadoField(
         queryset=MateriaPrima.objects.all(), source='material', write_only=True
     )
     material = MateriaPrimaSerializer(read_only=True)
@@ -32,73 +88,111 @@ class ConsumoMaterialSerializer(serializers.ModelSerializer):
         model = ConsumoMaterial
         fields = ['id', 'tamanho', 'material_id', 'material', 'quantidade']
         read_only_fields = ['id', 'material'] # 'material' is read-only for output
+        list_serializer_class = PreCarregamentoListSerializer
+
+class ConsumoMatrizSerializer(serializers.Serializer):
+    """
+    Ficha técnica no formato de matriz usado pela engenharia de produto (o
+    mesmo da migração 0017): a lista de materiais e, por tamanho, o consumo de
+    cada material na mesma ordem. Consumo vazio ou zero significa que o
+    material não é usado naquele tamanho.
+
+        {"materiais": [12, 15], "tamanhos": {"P": [1.10, 3], "M": [1.20, 3]}}
+    """
+    materiais = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    tamanhos = serializers.DictField(
+        child=serializers.ListField(
+            child=serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0, allow_null=True)
+        )
+    )
+
+    def validate(self, attrs):
+        material_ids = attrs['materiais']
+        if len(set(material_ids)) != len(material_ids):
+            raise serializers.ValidationError({'materiais': 'Material repetido na matriz.'})
+        materiais = MateriaPrima.objects.in_bulk(material_ids)
+        desconhecidos = [material_id for material_id in material_ids if material_id not in materiais]
+        if desconhecidos:
+            raise serializers.ValidationError({'materiais': f'Materiais inexistentes: {desconhecidos}'})
+
+        tamanhos_validos = dict(ConsumoMaterial.TAMANHO_CHOICES)
+        consumos = []
+        for tamanho, quantidades in attrs['tamanhos'].items():
+            if tamanho not in tamanhos_validos:
+                raise serializers.ValidationError({'tamanhos': f'Tamanho inválido: {tamanho}'})
+            if len(quantidades) != len(material_ids):
+                raise serializers.ValidationError({
+                    'tamanhos': f'O tamanho {tamanho} tem {len(quantidades)} valores para {len(material_ids)} materiais.'
+                })
+            for material_id, quantidade in zip(material_ids, quantidades):
+                if quantidade:
+                    consumos.append({'tamanho': tamanho, 'material': materiais[material_id], 'quantidade': quantidade})
+        return consumos
 
 class ModeloProdutoSerializer(serializers.ModelSerializer):
     consumo_materiais = ConsumoMaterialSerializer(many=True, required=False)
+    consumo_matriz = ConsumoMatrizSerializer(write_only=True, required=False)
 
     class Meta:
         model = ModeloProduto
-        fields = ['id', 'nome', 'tipo', 'consumo_materiais']
+        fields = ['id', 'nome', 'tipo', 'consumo_materiais', 'consumo_matriz']
+
+    def validate(self, attrs):
+        if 'consumo_matriz' in attrs:
+            if 'consumo_materiais' in attrs:
+                raise serializers.ValidationError('Informe consumo_materiais ou consumo_matriz, não os dois.')
+            attrs['consumo_materiais'] = attrs.pop('consumo_matriz')
+
+        chaves = set()
+        for consumo in attrs.get('consumo_materiais', []):
+            chave = (consumo['tamanho'], consumo['material'].pk)
+            if chave in chaves:
+                raise serializers.ValidationError({
+                    'consumo_materiais': f'Material {chave[1]} repetido no tamanho {chave[0]}.'
+                })
+            chaves.add(chave)
+        return attrs
+
+    def to_representation(self, instance):
+        # Depois de uma gravação o DRF descarta os objetos pré-buscados; busca o
+        # consumo com os materiais de uma vez em vez de um material por linha
+        if 'consumo_materiais' not in getattr(instance, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([instance], 'consumo_materiais__material')
+        return super().to_representation(instance)
 
     def create(self, validated_data):
         consumo_materiais_data = validated_data.pop('consumo_materiais', [])
-        modelo_produto = ModeloProduto.objects.create(**validated_data)
-        for consumo_data in consumo_materiais_data:
-            ConsumoMaterial.objects.create(modelo=modelo_produto, **consumo_data)
+        with transaction.atomic():
+            modelo_produto = ModeloProduto.objects.create(**validated_data)
+            gravar_consumos(modelo_produto, consumo_materiais_data)
         return modelo_produto
 
     def update(self, instance, validated_data):
         consumo_materiais_data = validated_data.pop('consumo_materiais', None)
 
-        instance.nome = validated_data.get('nome', instance.nome)
-        instance.tipo = validated_data.get('tipo', instance.tipo)
-        instance.save()
-
-        if consumo_materiais_data is not None:
-            # Get existing consumo_materiais for the instance
-            existing_consumo_materiais = list(instance.consumo_materiais.all())
-            existing_ids = {cm.id for cm in existing_consumo_materiais}
-            
-            # Separate incoming data into updates and creations
-            consumo_materiais_to_update = []
-            consumo_materiais_to_create = []
-            incoming_ids = set()
-
-            for item_data in consumo_materiais_data:
-                item_id = item_data.get('id')
-                if item_id and item_id in existing_ids:
-                    consumo_materiais_to_update.append(item_data)
-                    incoming_ids.add(item_id)
-                else:
-                    consumo_materiais_to_create.append(item_data)
-            
-            # Delete items not in the incoming data
-            for cm_instance in existing_consumo_materiais:
-                if cm_instance.id not in incoming_ids:
-                    cm_instance.delete()
-            
-            # Update existing items
-            for item_data in consumo_materiais_to_update:
-                cm_instance = ConsumoMaterial.objects.get(id=item_data['id'], modelo=instance)
-                for attr, value in item_data.items():
-                    if attr != 'id':
-                        setattr(cm_instance, attr, value)
-                cm_instance.save()
-            
-            # Create new items
-            for item_data in consumo_materiais_to_create:
-                ConsumoMaterial.objects.create(modelo=instance, **item_data)
+        with transaction.atomic():
+            instance.nome = validated_data.get('nome', instance.nome)
+            instance.tipo = validated_data.get('tipo', instance.tipo)
+            instance.save()
+
+            if consumo_materiais_data is not None:
+                gravar_consumos(instance, consumo_materiais_data)
 
         return instance
 
-class ItemPedidoSerializer(serializers.ModelSerializer):
-    modelo_base = serializers.PrimaryKeyRelatedField(
+class ItemPedidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # Blocos que só entram na leitura quando pedidos em ?expand (ou sem ?expand)
+    CAMPOS_EXPANSIVEIS = ('modelo_base_data', 'materiais')
+
+    # Gravável para que o update do pedido identifique os itens existentes
+    id = serializers.IntegerField(required=False)
+    modelo_base = PrimaryKeyPreCarregadoField(
         queryset=ModeloProduto.objects.all(),
         write_only=True,
         required=False,
         allow_null=True
     )
-    modelo_base_data = ModeloProdutoSerializer(source='modelo_base', read_only=True)
+    modelo_base_data = serializers.SerializerMethodField()
     materiais = MaterialPedidoSerializer(many=True, read_only=True) # Mark as read-only
 
     class Meta:
@@ -108,69 +202,110 @@ class ItemPedidoSerializer(serializers.ModelSerializer):
             'corpo_costa', 'bordado', 'materiais', 'tamanhos',
             'descricao', 'preco_unitario'
         ]
-        
-class PedidoVendaSerializer(serializers.ModelSerializer):
+        list_serializer_class = PreCarregamentoListSerializer
+
+    def registrar_dependencias(self, itens):
+        registrar_itens(self.context, itens)
+
+    def get_modelo_base_data(self, obj):
+        if obj.modelo_base_id is None:
+            return None
+        modelo = obter_carregadores(self.context).modelos.obter(obj.modelo_base_id)
+        return ModeloProdutoSerializer(modelo, context=self.context).data if modelo is not None else None
+
+
+class PedidosListSerializer(serializers.ListSerializer):
+    """
+    Registra de uma vez os modelos e materiais de todos os itens da página, de
+    forma que a página inteira é servida por uma consulta de materiais e uma
+    de modelos (com o consumo pré-buscado), qualquer que seja o tamanho.
+    """
+
+    def to_representation(self, data):
+        pedidos = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'itens' in self.child.fields:
+            registrar_itens(self.context, (item for pedido in pedidos for item in pedido.itens.all()))
+        return super().to_representation(pedidos)
+
+class PedidoVendaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    CAMPOS_EXPANSIVEIS = ('itens',)
+
     itens = ItemPedidoSerializer(many=True)
+    # Resumo do cliente lido do select_related do viewset, para o front-end
+    # não precisar baixar a lista de clientes e cruzar os ids
+    cliente_resumo = ClienteResumoSerializer(source='cliente', read_only=True)
+
+    # Campos do pedido que o update aplica; os demais são calculados ou imutáveis
+    CAMPOS_ATUALIZAVEIS = ['cliente', 'vendedor', 'prazo', 'prioridade', 'quantidade_pecas', 'valor_total', 'status']
 
     class Meta:
         model = PedidoVenda
         fields = [
-            'id', 'cliente', 'data_pedido', 'prazo', 'prioridade',
+            'id', 'cliente', 'cliente_resumo', 'vendedor', 'data_pedido', 'prazo', 'prioridade',
             'quantidade_pecas', 'valor_total', 'status', 'etapas',
             'itens', 'created_at', 'updated_at', 'materiais_necessarios'
         ]
+        list_serializer_class = PedidosListSerializer
 
     def create(self, validated_data):
         itens_data = validated_data.pop('itens')
-        pedido = PedidoVenda.objects.create(**validated_data)
-        for item_data in itens_data:
-            # Remove 'materiais' from item_data as it's a calculated field
-            item_data.pop('materiais', None)
-            item = ItemPedido.objects.create(pedido=pedido, **item_data)
-            # The .save() method of ItemPedido will automatically call calcular_materiais()
-            item.save()
-        return pedido
+        return criar_pedido(validated_data, itens_data)
 
     def update(self, instance, validated_data):
         itens_data = validated_data.pop('itens', None)
-        
-        # Update PedidoVenda fields
-        instance.cliente = validated_data.get('cliente', instance.cliente)
-        instance.prazo = validated_data.get('prazo', instance.prazo)
-        instance.prioridade = validated_data.get('prioridade', instance.prioridade)
-        instance.quantidade_pecas = validated_data.get('quantidade_pecas', instance.quantidade_pecas)
-        instance.valor_total = validated_data.get('valor_total', instance.valor_total)
-        instance.status = validated_data.get('status', instance.status)
-        instance.save()
-
-        if itens_data is not None:
-            # Efficient update: map existing items by ID
-            existing_items = {item.id: item for item in instance.itens.all()}
-            
-            for item_data in itens_data:
-                item_id = item_data.get('id')
-                if item_id and item_id in existing_items:
-                    # Update existing item
-                    item_instance = existing_items.pop(item_id)
-                    # Update fields...
-                    # Remove 'materiais' from item_data as it's a calculated field
-                    item_data.pop('materiais', None)
-                    # Update other fields
-                    for attr, value in item_data.items():
-                        setattr(item_instance, attr, value)
-                    item_instance.save()
-                else:
-                    # Create new item
-                    # Remove 'materiais' from item_data as it's a calculated field
-                    item_data.pop('materiais', None)
-                    new_item = ItemPedido.objects.create(pedido=instance, **item_data)
-                    new_item.save()
-
-            # Remove old items that were not in the update
-            for item_instance in existing_items.values():
-                item_instance.delete()
+        dados_pedido = {
+            campo: validated_data[campo]
+            for campo in self.CAMPOS_ATUALIZAVEIS
+            if campo in validated_data
+        }
+        return atualizar_pedido(instance, dados_pedido, itens_data)
 
-        return instance
+class AprovacaoLoteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+
+class FiltrosPedidosSerializer(serializers.Serializer):
+    """Filtros de pedidos lidos da query string (exportação e somas de peças)."""
+    status = serializers.CharField(required=False, help_text="Status separados por vírgula")
+    cliente = serializers.IntegerField(required=False, min_value=1)
+    data_inicio = serializers.DateField(required=False)
+    data_fim = serializers.DateField(required=False)
+
+    def validate_status(self, valor):
+        status = [parte.strip() for parte in valor.split(',') if parte.strip()]
+        validos = dict(PedidoVenda.STATUS_CHOICES)
+        invalidos = [parte for parte in status if parte not in validos]
+        if invalidos:
+            raise serializers.ValidationError(f"Status inválidos: {', '.join(invalidos)}.")
+        return status
+
+    def validate(self, data):
+        if data.get('data_inicio') and data.get('data_fim') and data['data_inicio'] > data['data_fim']:
+            raise serializers.ValidationError("data_inicio deve ser anterior ou igual a data_fim.")
+        return data
+
+class PecasGradeSerializer(FiltrosPedidosSerializer):
+    agrupar = serializers.CharField(required=False, default='modelo,tamanho', help_text="modelo, tamanho e/ou mes, separados por vírgula")
+    data = serializers.ChoiceField(choices=['pedido', 'prazo'], default='pedido', help_text="Data usada no período e no agrupamento por mês")
+    modelo = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_agrupar(self, valor):
+        agrupar = [parte.strip() for parte in valor.split(',') if parte.strip()]
+        invalidos = [parte for parte in agrupar if parte not in AGRUPAMENTOS_PECAS]
+        if invalidos or not agrupar:
+            raise serializers.ValidationError(f"Use um ou mais de: {', '.join(AGRUPAMENTOS_PECAS)}.")
+        return agrupar
+
+class ImportacaoPedidosSerializer(serializers.Serializer):
+    arquivo = serializers.FileField()
+    formato = serializers.ChoiceField(choices=FORMATOS_IMPORTACAO, required=False)
+
+    def validate(self, data):
+        if 'formato' not in data:
+            extensao = data['arquivo'].name.rsplit('.', 1)[-1].lower()
+            if extensao not in FORMATOS_IMPORTACAO:
+                raise serializers.ValidationError({'formato': "Informe o formato (csv ou jsonl)."})
+            data['formato'] = extensao
+        return data
 
 class OrcamentoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -185,4 +320,29 @@ class VendedorSerializer(serializers.ModelSerializer):
 class ComissaoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comissao
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        # Calculados a partir do pedido e da taxa do vendedor
+        read_only_fields = ['valor', 'taxa', 'valor_pedido', 'competencia']
+        extra_kwargs = {
+            'pedido': {'validators': [UniqueValidator(Comissao.objects.all(), message="Este pedido já tem comissão.")]},
+        }
+
+class CalculoComissoesSerializer(serializers.Serializer):
+    inicio = serializers.DateField()
+    fim = serializers.DateField()
+    vendedores = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+    def validate(self, data):
+        if data['inicio'] > data['fim']:
+            raise serializers.ValidationError("inicio deve ser anterior ou igual a fim.")
+        return data
+
+class ResumoVendedorMensalSerializer(serializers.ModelSerializer):
+    vendedor_nome = serializers.CharField(source='vendedor.nome', read_only=True)
+
+    class Meta:
+        model = ResumoVendedorMensal
+        fields = [
+            'vendedor', 'vendedor_nome', 'competencia', 'total_vendas', 'total_comissao',
+            'pedidos', 'meta', 'percentual_meta',
+        ]
\ No newline at end of file
@@ -1,62 +1,17 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.db import transaction
-from decimal import Decimal
-from .models import PedidoVenda, ItemPedido
-from apps.estoque.models import MateriaPrima, HistoricoUsoMaterial
+from .models import PedidoVenda, ItemPedido, ConsumoMaterial
+from .bom import invalidar_bom
+from .grades import sincronizar_grades
+from .necessidades import sincronizar_necessidades
+from .recalculo import marcar_materiais, marcar_modelos, marcar_pedido
+from .versoes import CHAVE_VERSAO_ESTOQUE, invalidar_versao
+from apps.estoque.models import MateriaPrima
+from apps.estoque.reservas import liberar_reservas
+
+# Campos de MateriaPrima que fazem parte da ficha técnica compilada.
+CAMPOS_MATERIAL_BOM = {'name', 'unidade_medida', 'tipo_produto', 'cor'}
 
-# @receiver(post_save, sender=PedidoVenda)
-def baixar_estoque_materiais(sender, instance, **kwargs):
-    """
-    Signal para baixar o estoque de matéria-prima quando o status do pedido
-    de venda for alterado para 'Materiais Confirmados'.
-    A baixa só ocorre uma vez, controlada pelo campo 'materiais_baixados'.
-    """
-    if instance.status == 'MATERIAIS_CONFIRMADOS' and not instance.materiais_baixados:
-        try:
-            with transaction.atomic():
-                materiais_a_processar = {}
-
-                # 1. Agrupa e soma todas as quantidades necessárias por material
-                for item in instance.itens.all():
-                    for material_info in item.materiais:
-                        material_id = material_info.get('material_id')
-                        quantidade_necessaria = Decimal(material_info.get('quantidade', 0))
-
-                        if not material_id or quantidade_necessaria <= 0:
-                            continue
-                        
-                        materiais_a_processar[material_id] = materiais_a_processar.get(material_id, 0) + quantidade_necessaria
-
-                # 2. Processa a baixa para cada material
-                for material_id, total_necessario in materiais_a_processar.items():
-                    try:
-                        # Bloqueia a linha para evitar condições de corrida
-                        material = MateriaPrima.objects.select_for_update().get(id=material_id)
-                        
-                        if material.quantity < total_necessario:
-                            raise Exception(f"Estoque insuficiente para {material.name}. Necessário: {total_necessario}, Disponível: {material.quantity}")
-
-                        # Atualiza a quantidade diretamente no banco de dados para contornar o save()
-                        nova_quantidade = material.quantity - total_necessario
-                        MateriaPrima.objects.filter(id=material_id).update(quantity=nova_quantidade)
-
-                        # Cria o registro no histórico
-                        HistoricoUsoMaterial.objects.create(
-                            material=material,
-                            pedido_venda=instance,
-                            quantidade_utilizada=total_necessario
-                        )
-
-                    except MateriaPrima.DoesNotExist:
-                        raise Exception(f"Matéria-prima com ID {material_id} não encontrada.")
-
-                # 3. Marca o pedido como processado para evitar nova baixa
-                instance.materiais_baixados = True
-                instance.save(update_fields=['materiais_baixados', 'updated_at'])
-
-        except Exception as e:
-            print(f"ERRO na transação ao baixar estoque para o pedido {instance.id}: {e}")
 
 @receiver(post_save, sender=ItemPedido)
 @receiver(post_delete, sender=ItemPedido)
@@ -64,27 +19,83 @@ def atualizar_materiais_pedido_venda(sender, instance, **kwargs):
     """
     Signal para atualizar o campo 'materiais_necessarios' no PedidoVenda
     sempre que um ItemPedido associado for salvo ou deletado.
+    O recálculo é adiado para o commit e feito uma única vez por pedido.
+    """
+    marcar_pedido(instance.pedido_id)
+
+
+@receiver(post_save, sender=ItemPedido)
+def sincronizar_linhas_item(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Mantém as linhas de GradeItemPedido e NecessidadeMaterial do item salvo
+    individualmente; as gravações em lote de gravacao.py e recalculo.py
+    sincronizam essas linhas por conta própria.
+    """
+    if update_fields is not None and not {'tamanhos', 'modelo_base', 'materiais'}.intersection(update_fields):
+        return
+    sincronizar_grades([instance], novos=created)
+    sincronizar_necessidades([instance], novos=created)
+
+
+@receiver(pre_delete, sender=PedidoVenda)
+def liberar_reservas_pedido_excluido(sender, instance, **kwargs):
+    """
+    Devolve ao disponível as reservas de um pedido excluído antes que a
+    exclusão em cascata apague as linhas de reserva.
+    """
+    liberar_reservas([instance.id])
+
+
+@receiver(post_save, sender=ConsumoMaterial)
+@receiver(post_delete, sender=ConsumoMaterial)
+def invalidar_bom_consumo(sender, instance, **kwargs):
     """
-    pedido_venda = instance.pedido
-
-    # Agrega todos os materiais de todos os itens do pedido
-    materiais_agregados = {}
-    for item in pedido_venda.itens.all():
-        for material_info in item.materiais:
-            material_id = material_info.get('material_id')
-            quantidade = material_info.get('quantidade', 0)
-            nome = material_info.get('nome', 'Desconhecido')
-            unidade = material_info.get('unidade', '')
-
-            if material_id:
-                if material_id not in materiais_agregados:
-                    materiais_agregados[material_id] = {
-                        'material_id': material_id,
-                        'nome': nome,
-                        'quantidade': 0,
-                    }
-                materiais_agregados[material_id]['quantidade'] += quantidade
-    
-    # Converte o dicionário de volta para uma lista de dicionários
-    pedido_venda.materiais_necessarios = list(materiais_agregados.values())
-    pedido_venda.save(update_fields=['materiais_necessarios', 'updated_at'])
\ No newline at end of file
+    Invalida as fichas técnicas compiladas quando o consumo de um modelo muda e
+    agenda o recálculo dos itens em aberto desse modelo.
+    """
+    invalidar_bom()
+    marcar_modelos([instance.modelo_id])
+
+
+@receiver(post_save, sender=MateriaPrima)
+@receiver(post_delete, sender=MateriaPrima)
+def invalidar_versao_estoque(sender, instance, **kwargs):
+    """
+    Invalida os resultados derivados do estoque, como o endpoint de materiais do pedido.
+    """
+    invalidar_versao(CHAVE_VERSAO_ESTOQUE)
+
+
+@receiver(pre_save, sender=MateriaPrima)
+def detectar_alteracao_bom_material(sender, instance, update_fields=None, **kwargs):
+    """
+    Compara os campos da ficha técnica com os gravados, para que o post_save só
+    invalide as fichas (e recalcule pedidos) quando nome ou unidade mudarem.
+    """
+    instance._bom_alterado = False
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not CAMPOS_MATERIAL_BOM.intersection(update_fields):
+        return
+    anteriores = MateriaPrima.objects.filter(pk=instance.pk).values(*CAMPOS_MATERIAL_BOM).first()
+    instance._bom_alterado = anteriores is None or any(
+        getattr(instance, campo) != valor for campo, valor in anteriores.items()
+    )
+
+
+@receiver(post_save, sender=MateriaPrima)
+def invalidar_bom_material(sender, instance, created, **kwargs):
+    """
+    Invalida as fichas técnicas compiladas e agenda o recálculo dos itens em
+    aberto que usam o material quando o nome ou a unidade dele mudaram.
+    Materiais novos ainda não constam em fichas.
+    """
+    if created or not getattr(instance, '_bom_alterado', True):
+        return
+    invalidar_bom()
+    marcar_materiais([instance.id])
+
+
+@receiver(post_delete, sender=MateriaPrima)
+def invalidar_bom_material_removido(sender, instance, **kwargs):
+    invalidar_bom()
@@ -1,3 +1,1223 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from apps.clientes.models import Cliente
+from apps.pcp.models import OrdemProducao
+from apps.estoque.models import MateriaPrima, HistoricoUsoMaterial
+from apps.estoque.movimentacao import EstoqueInsuficiente
+from apps.comercial import aprovacao
+from apps.comercial.aprovacao import aprovar_pedidos
+from apps.comercial.baixa import baixar_materiais_pedido
+from apps.comercial.bom import invalidar_bom
+from apps.comercial.comissoes import calcular_comissoes
+from apps.comercial.exportacao import filtrar_pedidos, linhas_exportacao
+from apps.comercial.importacao import importar_pedidos
+from apps.comercial.models import (
+    PedidoVenda, ItemPedido, GradeItemPedido, NecessidadeMaterial, ModeloProduto, ConsumoMaterial, Vendedor, Comissao, ResumoVendedorMensal,
+    VersaoCache,
+)
+from apps.comercial.necessidades import calcular_materiais_itens, calcular_necessidades
+from apps.comercial import recalculo
+from apps.comercial.recalculo import (
+    marcar_materiais, marcar_modelos, marcar_pedido, recalcular_dependentes, recalcular_pedidos, recalculo_suspenso,
+)
+from apps.comercial.serializers import PedidoVendaSerializer
+from apps.comercial.versoes import CHAVE_VERSAO_BOM, CHAVE_VERSAO_ESTOQUE
+
+
+class ComercialTestMixin:
+    """
+    Creates a small technical sheet (two materials, three sizes) shared by the tests.
+    """
+
+    def criar_dados(self):
+        # Run the recalculation scheduled by the fixtures, as their commit would;
+        # TransactionTestCase has no outer atomic, so callbacks already run
+        if not hasattr(self, 'captureOnCommitCallbacks'):
+            return self._criar_dados()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._criar_dados()
+
+    def _criar_dados(self):
+        invalidar_bom()
+        self.user = User.objects.create_user(username='comercial', password='senha-teste')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.cliente = Cliente.objects.create(nome='Cliente Teste', cpf_cnpj='00.000.000/0001-00', tipo='PJ')
+        self.tecido = MateriaPrima.objects.create(name='Tecido Teste', unidade_medida='METRO', quantity=Decimal('100'))
+        self.botao = MateriaPrima.objects.create(name='Botão Teste', tipo_produto='BOTAO', unidade_medida='UNIDADE', quantity=Decimal('500'))
+        self.modelo = ModeloProduto.objects.create(nome='Camisa Teste')
+
+        consumo = {
+            'P': (Decimal('1.100'), Decimal('3')),
+            'M': (Decimal('1.200'), Decimal('3')),
+            'G': (Decimal('1.300'), Decimal('4')),
+        }
+        for tamanho, (tecido, botao) in consumo.items():
+            ConsumoMaterial.objects.create(modelo=self.modelo, tamanho=tamanho, material=self.tecido, quantidade=tecido)
+            ConsumoMaterial.objects.create(modelo=self.modelo, tamanho=tamanho, material=self.botao, quantidade=botao)
+
+    def criar_pedido(self, tamanhos=None, **kwargs):
+        pedido = PedidoVenda.objects.create(cliente=self.cliente, **kwargs)
+        ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos=tamanhos or {'P': 10, 'M': 5})
+        return pedido
+
+
+class FichaCompiladaTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_calcular_materiais_uses_warm_cache(self):
+        """
+        Once the technical sheet is compiled, computing an item's materials only reads the BOM version.
+        """
+        item = ItemPedido(modelo_base_id=self.modelo.id, tamanhos={'P': 10, 'M': 5, 'G': 0})
+        item.calcular_materiais()
+
+        with self.assertNumQueries(1):
+            item.calcular_materiais()
+
+        materiais = {m['material_id']: m for m in item.materiais}
+        self.assertAlmostEqual(materiais[self.tecido.id]['quantidade'], 17.0)
+        self.assertEqual(materiais[self.botao.id]['quantidade'], 45.0)
+        self.assertEqual(materiais[self.tecido.id]['unidade'], 'Metro')
+
+    def test_consumo_change_invalidates_cache(self):
+        """
+        Editing a consumption row is reflected in the next computation.
+        """
+        item = ItemPedido(modelo_base_id=self.modelo.id, tamanhos={'P': 10})
+        item.calcular_materiais()
+
+        ConsumoMaterial.objects.filter(modelo=self.modelo, tamanho='P', material=self.tecido).get().delete()
+        item.calcular_materiais()
+
+        self.assertEqual([m['material_id'] for m in item.materiais], [self.botao.id])
+
+    def test_invalidation_by_another_process_is_seen(self):
+        item = ItemPedido(modelo_base_id=self.modelo.id, tamanhos={'P': 10})
+        item.calcular_materiais()
+
+        # Another worker commits an edit: the data and the stored version change,
+        # this process's compiled sheets do not
+        ConsumoMaterial.objects.filter(modelo=self.modelo, tamanho='P', material=self.tecido).update(quantidade=Decimal('2'))
+        VersaoCache.objects.filter(chave=CHAVE_VERSAO_BOM).update(versao='outro-processo')
+        item.calcular_materiais()
+
+        materiais = {m['material_id']: m['quantidade'] for m in item.materiais}
+        self.assertEqual(materiais[self.tecido.id], 20.0)
+
+    def test_rolled_back_edit_is_not_cached(self):
+        item = ItemPedido(modelo_base_id=self.modelo.id, tamanhos={'P': 10})
+        consumo = ConsumoMaterial.objects.get(modelo=self.modelo, tamanho='P', material=self.tecido)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                consumo.quantidade = Decimal('9')
+                consumo.save()
+                item.calcular_materiais()
+                raise RuntimeError()
+
+        item.calcular_materiais()
+        materiais = {m['material_id']: m['quantidade'] for m in item.materiais}
+        self.assertEqual(materiais[self.tecido.id], 11.0)
+
+    def test_material_rename_invalidates_cache(self):
+        item = ItemPedido(modelo_base_id=self.modelo.id, tamanhos={'M': 1})
+        item.calcular_materiais()
+
+        self.tecido.name = 'Tecido Renomeado'
+        self.tecido.save()
+        item.calcular_materiais()
+
+        nomes = {m['material_id']: m['nome'] for m in item.materiais}
+        self.assertEqual(nomes[self.tecido.id], 'Tecido Renomeado')
+
+    def test_verificar_estoque(self):
+        url = f'/api/comercial/modelos-produto/{self.modelo.id}/verificar_estoque/'
+        response = self.client.post(url, {'tamanhos': {'G': 100}}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        resultado = {m['material_id']: m for m in response.data}
+        self.assertEqual(resultado[self.tecido.id]['quantidade_necessaria'], Decimal('130.000'))
+        self.assertFalse(resultado[self.tecido.id]['suficiente'])
+        self.assertTrue(resultado[self.botao.id]['suficiente'])
+
+
+class NecessidadesTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_calcular_necessidades_for_many_orders(self):
+        """
+        Items sharing a model are summed before the matrix product, and every order gets an entry.
+        """
+        pedido = self.criar_pedido({'P': 10, 'M': 5})
+        ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'P': 2})
+        vazio = PedidoVenda.objects.create(cliente=self.cliente)
+
+        resultado = calcular_necessidades([pedido, vazio.id])
+
+        self.assertEqual(resultado[vazio.id], {})
+        self.assertEqual(resultado[pedido.id][self.tecido.id]['quantidade'], Decimal('19.200'))
+        self.assertEqual(resultado[pedido.id][self.botao.id]['quantidade'], Decimal('51'))
+
+    def test_materiais_necessarios_follow_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = self.criar_pedido({'G': 2})
+        pedido.refresh_from_db()
+        self.assertEqual(
+            {m['material_id']: m['quantidade'] for m in pedido.materiais_necessarios},
+            {self.tecido.id: 2.6, self.botao.id: 8.0},
+        )
+
+    def test_materiais_endpoint(self):
+        pedido = self.criar_pedido({'P': 100})
+        response = self.client.get(f'/api/comercial/pedidos/{pedido.id}/materiais/')
+        self.assertEqual(response.status_code, 200)
+
+        resultado = {m['material_id']: m for m in response.data}
+        self.assertEqual(resultado[self.tecido.id]['quantidade_necessaria'], 110.0)
+        self.assertFalse(resultado[self.tecido.id]['suficiente'])
+        self.assertTrue(resultado[self.botao.id]['suficiente'])
+
+    def test_materiais_endpoint_is_read_only(self):
+        pedido = self.criar_pedido({'P': 1})
+        url = f'/api/comercial/pedidos/{pedido.id}/materiais/'
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        escritas = [q['sql'] for q in consultas.captured_queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual(escritas, [])
+
+    def test_materiais_endpoint_etag(self):
+        pedido = self.criar_pedido({'P': 1})
+        url = f'/api/comercial/pedidos/{pedido.id}/materiais/'
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.tecido.quantity = Decimal('1')
+        self.tecido.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'G': 1})
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual({m['quantidade_necessaria'] for m in response.data}, {2.4, 7.0})
+
+    def test_materiais_etag_is_shared_across_processes(self):
+        pedido = self.criar_pedido({'P': 1})
+        url = f'/api/comercial/pedidos/{pedido.id}/materiais/'
+        etag = self.client.get(url)['ETag']
+
+        # A worker with an empty local cache computes the same ETag
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A stock write committed by another worker changes it
+        VersaoCache.objects.update_or_create(chave=CHAVE_VERSAO_ESTOQUE, defaults={'versao': 'outro-processo'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_materiais_endpoint_unknown_order(self):
+        response = self.client.get('/api/comercial/pedidos/999999/materiais/')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecalculoTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_order_recomputed_once_on_commit(self):
+        """
+        Saving many items in one transaction re-aggregates materiais_necessarios exactly once.
+        """
+        pedido = PedidoVenda.objects.create(cliente=self.cliente)
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for _ in range(5):
+                        ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'P': 1, 'M': 2})
+
+        atualizacoes = [
+            q['sql'] for q in consultas.captured_queries
+            if q['sql'].startswith('UPDATE "comercial_pedidovenda"')
+        ]
+        self.assertEqual(len(atualizacoes), 1)
+
+        pedido.refresh_from_db()
+        quantidades = {m['material_id']: m['quantidade'] for m in pedido.materiais_necessarios}
+        self.assertAlmostEqual(quantidades[self.tecido.id], 17.5)
+        self.assertEqual(quantidades[self.botao.id], 45.0)
+
+    def test_suspended_recalculation(self):
+        pedido = PedidoVenda.objects.create(cliente=self.cliente)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with recalculo_suspenso():
+                ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'P': 1})
+        self.assertEqual(callbacks, [])
+
+        recalcular_pedidos([pedido.id])
+        pedido.refresh_from_db()
+        self.assertEqual(len(pedido.materiais_necessarios), 2)
+
+    def test_callback_registered_once_per_transaction(self):
+        pedido = PedidoVenda.objects.create(cliente=self.cliente)
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(3):
+                ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'P': 1})
+            marcar_modelos([self.modelo.id])
+            marcar_materiais([self.tecido.id])
+        funcoes = [getattr(callback, 'func', None) for callback in callbacks]
+        self.assertEqual(funcoes.count(recalculo._processar_pendentes), 1)
+        self.assertEqual(funcoes.count(recalculo._processar_dependencias), 1)
+
+    def test_rolled_back_marks_do_not_leak_into_next_commit(self):
+        descartado = PedidoVenda.objects.create(cliente=self.cliente)
+        pedido = PedidoVenda.objects.create(cliente=self.cliente)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                marcar_pedido(descartado.id)
+                marcar_modelos([self.modelo.id])
+                raise RuntimeError()
+
+        with mock.patch('apps.comercial.recalculo.recalcular_pedidos') as recalcular, \
+                mock.patch('apps.comercial.recalculo.recalcular_dependentes') as dependentes:
+            with self.captureOnCommitCallbacks(execute=True):
+                marcar_pedido(pedido.id)
+                marcar_materiais([self.tecido.id])
+        recalcular.assert_called_once_with({pedido.id})
+        dependentes.assert_called_once_with(modelo_ids=set(), material_ids={self.tecido.id})
+
+
+class GravacaoEmLoteTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def itens(self, quantidade):
+        return [{'modelo_base': self.modelo.id, 'tamanhos': {'P': 1, 'G': 2}} for _ in range(quantidade)]
+
+    def contar_consultas(self, funcao):
+        with CaptureQueriesContext(connection) as consultas:
+            funcao()
+        return len(consultas.captured_queries)
+
+    def criar_via_serializer(self, quantidade):
+        serializer = PedidoVendaSerializer(data={'cliente': self.cliente.id, 'itens': self.itens(quantidade)})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_create_query_count_is_constant(self):
+        """
+        Validating and creating an order costs the same number of queries for 2 or 30 items.
+        """
+        self.criar_via_serializer(1)  # aquece a ficha compilada
+
+        poucos = self.contar_consultas(lambda: self.criar_via_serializer(2))
+        muitos = self.contar_consultas(lambda: self.criar_via_serializer(30))
+        self.assertEqual(poucos, muitos)
+
+        pedido = PedidoVenda.objects.latest('id')
+        self.assertEqual(pedido.itens.count(), 30)
+        quantidades = {m['material_id']: m['quantidade'] for m in pedido.materiais_necessarios}
+        self.assertAlmostEqual(quantidades[self.tecido.id], 30 * (1.1 + 2 * 1.3))
+
+    def test_update_query_count_is_constant(self):
+        """
+        Updating, creating and deleting items in one payload costs a constant number of queries.
+        """
+        def atualizar(quantidade):
+            pedido = self.criar_via_serializer(quantidade)
+            existentes = list(pedido.itens.values_list('id', flat=True))
+            itens = [{'id': item_id, 'tamanhos': {'M': 3}} for item_id in existentes[:quantidade // 2]]
+            itens += self.itens(quantidade)
+            serializer = PedidoVendaSerializer(pedido, data={'itens': itens}, partial=True)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            return self.contar_consultas(serializer.save), pedido
+
+        poucos, _ = atualizar(2)
+        muitos, pedido = atualizar(20)
+        self.assertEqual(poucos, muitos)
+
+        self.assertEqual(pedido.itens.count(), 30)
+        self.assertEqual(pedido.itens.filter(tamanhos={'M': 3}).count(), 10)
+        quantidades = {m['material_id']: m['quantidade'] for m in pedido.materiais_necessarios}
+        self.assertEqual(quantidades[self.botao.id], 10 * 9 + 20 * 11)
+
+    def test_create_via_api(self):
+        response = self.client.post('/api/comercial/pedidos/', {'cliente': self.cliente.id, 'itens': self.itens(3)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['itens']), 3)
+        self.assertEqual(len(response.data['itens'][0]['materiais']), 2)
+
+
+class MRPTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_first_shortage_follows_due_dates(self):
+        hoje = date.today()
+        tardio = self.criar_pedido({'P': 50}, prazo=hoje + timedelta(days=10))
+        self.criar_pedido({'P': 50}, prazo=hoje + timedelta(days=5))
+        self.criar_pedido({'P': 500}, status='CONCLUIDO')
+
+        response = self.client.get('/api/comercial/pedidos/mrp/', {'apenas_faltas': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+        tecido = response.data[0]
+        self.assertEqual(tecido['material_id'], self.tecido.id)
+        self.assertEqual(tecido['demanda_total'], Decimal('110.000'))
+        self.assertEqual(tecido['primeira_falta_pedido_id'], tardio.id)
+        self.assertEqual(tecido['primeira_falta_prazo'], tardio.prazo)
+        self.assertEqual(tecido['deficit'], Decimal('10.000'))
+
+
+class ReservaTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_approval_reserves_and_cancel_releases(self):
+        pedido = self.criar_pedido({'P': 10, 'M': 5}, prazo=date.today())
+        outro = self.criar_pedido({'P': 50})
+
+        response = self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'APROVADO'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.reserved, Decimal('17.00'))
+        self.assertEqual(self.tecido.available, Decimal('83.00'))
+
+        # The approved order still sees its own reservation as available
+        materiais = {m['material_id']: m for m in self.client.get(f'/api/comercial/pedidos/{pedido.id}/materiais/').data}
+        self.assertEqual(materiais[self.tecido.id]['quantidade_disponivel'], Decimal('100.00'))
+        materiais = {m['material_id']: m for m in self.client.get(f'/api/comercial/pedidos/{outro.id}/materiais/').data}
+        self.assertEqual(materiais[self.tecido.id]['quantidade_disponivel'], Decimal('83.00'))
+
+        response = self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'CANCELADO'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.reserved, Decimal('0'))
+        self.assertFalse(pedido.reservas_materiais.exists())
+
+    def test_material_save_keeps_reserved_counter(self):
+        pedido = self.criar_pedido({'P': 10}, prazo=date.today())
+        material = MateriaPrima.objects.get(id=self.tecido.id)
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'APROVADO'}, format='json')
+
+        # A stale instance saved after the reservation must not reset the counter
+        material.name = 'Tecido Renomeado'
+        material.save()
+        material.refresh_from_db()
+        self.assertEqual(material.reserved, Decimal('11.00'))
+
+    def test_deleting_order_releases_reservations(self):
+        pedido = self.criar_pedido({'P': 10}, prazo=date.today())
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'APROVADO'}, format='json')
+        pedido.delete()
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.reserved, Decimal('0'))
+
+    def test_command_reserves_orders_approved_before_reservations(self):
+        aprovado = self.criar_pedido({'P': 10}, prazo=date.today())
+        baixado = self.criar_pedido({'P': 20}, prazo=date.today())
+        # Approved before reservations existed: no ReservaMaterial rows
+        PedidoVenda.objects.filter(id=aprovado.id).update(status='APROVADO')
+        PedidoVenda.objects.filter(id=baixado.id).update(status='APROVADO', materiais_baixados=True)
+
+        call_command('reservar_pedidos_aprovados', stdout=io.StringIO())
+        call_command('reservar_pedidos_aprovados', stdout=io.StringIO())
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.reserved, Decimal('11.00'))
+        self.assertFalse(baixado.reservas_materiais.exists())
+
+
+class BaixaEstoqueTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_issue_is_idempotent(self):
+        pedido = self.criar_pedido({'P': 10, 'M': 5})
+        url = f'/api/comercial/pedidos/{pedido.id}/baixar-estoque/'
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['baixa_realizada'])
+        self.assertEqual(len(response.data['materiais']), 2)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['baixa_realizada'])
+
+        self.tecido.refresh_from_db()
+        self.botao.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('83.00'))
+        self.assertEqual(self.botao.quantity, Decimal('455.00'))
+        self.assertEqual(HistoricoUsoMaterial.objects.filter(pedido_venda=pedido).count(), 2)
+
+    def test_insufficient_stock_changes_nothing(self):
+        pedido = self.criar_pedido({'P': 10, 'G': 100})
+
+        response = self.client.post(f'/api/comercial/pedidos/{pedido.id}/baixar-estoque/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([falta['material_id'] for falta in response.data['faltas']], [self.tecido.id])
+
+        self.botao.refresh_from_db()
+        pedido.refresh_from_db()
+        self.assertEqual(self.botao.quantity, Decimal('500.00'))
+        self.assertFalse(pedido.materiais_baixados)
+        self.assertFalse(HistoricoUsoMaterial.objects.exists())
+
+    def test_status_transition_issues_and_releases_reservation(self):
+        pedido = self.criar_pedido({'P': 10}, prazo=date.today())
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'APROVADO'}, format='json')
+
+        response = self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'MATERIAIS_CONFIRMADOS'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('89.00'))
+        self.assertEqual(self.tecido.reserved, Decimal('0'))
+        pedido.refresh_from_db()
+        self.assertTrue(pedido.materiais_baixados)
+
+    def test_status_transition_rejected_without_stock(self):
+        pedido = self.criar_pedido({'G': 100})
+        response = self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'MATERIAIS_CONFIRMADOS'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, 'PENDENTE')
+
+
+# Attempts per parallel issue while the database rejects the concurrent writer
+TENTATIVAS_BLOQUEIO = 500
+
+
+class BaixaEstoqueConcorrenteTests(ComercialTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def executar_em_paralelo(self, pedidos):
+        barreira = threading.Barrier(len(pedidos))
+        resultados, erros = [], []
+
+        def baixar(pedido):
+            try:
+                barreira.wait()
+                for _ in range(TENTATIVAS_BLOQUEIO):
+                    try:
+                        resultados.append(baixar_materiais_pedido(pedido) is not None)
+                        break
+                    except OperationalError:
+                        # SQLite has no row locks and rejects concurrent
+                        # writers; the transaction was rolled back, retry it
+                        time.sleep(0.01)
+                    except EstoqueInsuficiente:
+                        resultados.append(False)
+                        break
+                else:
+                    erros.append(pedido.id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=baixar, args=(pedido,)) for pedido in pedidos]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(erros, [], "Baixas que não terminaram após todas as tentativas")
+        self.assertEqual(len(resultados), len(pedidos))
+        return resultados
+
+    def test_parallel_issues_never_oversell(self):
+        # Each order needs 66 of the 100 units of fabric: only one can be served
+        pedidos = [self.criar_pedido({'P': 60}) for _ in range(4)]
+        resultados = self.executar_em_paralelo(pedidos)
+
+        self.assertEqual(resultados.count(True), 1)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('34'))
+        self.assertEqual(HistoricoUsoMaterial.objects.filter(material=self.tecido).count(), 1)
+        usado = HistoricoUsoMaterial.objects.filter(material=self.tecido).aggregate(total=Sum('quantidade_utilizada'))['total']
+        self.assertEqual(usado, Decimal('66'))
+        self.assertEqual(PedidoVenda.objects.filter(materiais_baixados=True).count(), 1)
+
+    def test_parallel_issues_of_same_order_debit_once(self):
+        pedido = self.criar_pedido({'P': 10})
+        resultados = self.executar_em_paralelo([PedidoVenda.objects.get(id=pedido.id) for _ in range(4)])
+
+        self.assertEqual(resultados.count(True), 1)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('89'))
+        self.assertEqual(HistoricoUsoMaterial.objects.filter(material=self.tecido).count(), 1)
+
+
+class SerializacaoPedidosTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.outro_modelo = ModeloProduto.objects.create(nome='Calça Teste')
+        ConsumoMaterial.objects.create(modelo=self.outro_modelo, tamanho='P', material=self.tecido, quantidade=Decimal('2'))
+
+    def criar_pedidos(self, quantidade):
+        for _ in range(quantidade):
+            pedido = self.criar_pedido({'P': 2, 'G': 1})
+            ItemPedido.objects.create(pedido=pedido, modelo_base=self.outro_modelo, tamanhos={'P': 3})
+
+    def contar_consultas_listagem(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/comercial/pedidos/')
+        self.assertEqual(response.status_code, 200)
+        return len(consultas), response
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        self.criar_pedidos(2)
+        poucos, _ = self.contar_consultas_listagem()
+        self.criar_pedidos(6)
+        muitos, response = self.contar_consultas_listagem()
+        self.assertEqual(poucos, muitos)
+
+        pedidos = response.data['results'] if isinstance(response.data, dict) else response.data
+        item = pedidos[0]['itens'][0]
+        self.assertEqual(item['modelo_base_data']['nome'], 'Camisa Teste')
+        self.assertEqual(len(item['modelo_base_data']['consumo_materiais']), 6)
+        self.assertEqual(item['materiais'][0]['material']['id'], self.tecido.id)
+
+    def test_retrieve_batches_item_lookups(self):
+        self.criar_pedidos(1)
+        pedido = PedidoVenda.objects.get()
+        for _ in range(4):
+            ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'M': 1})
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(f'/api/comercial/pedidos/{pedido.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['itens']), 6)
+        consultas_material = [q for q in consultas.captured_queries if 'estoque_materiaprima' in q['sql']]
+        self.assertLessEqual(len(consultas_material), 2)
+
+
+class FichaTecnicaEmLoteTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.materiais = [self.tecido, self.botao] + [
+            MateriaPrima.objects.create(name=f'Aviamento {indice}', unidade_medida='UNIDADE', quantity=Decimal('100'))
+            for indice in range(6)
+        ]
+        self.url = f'/api/comercial/modelos-produto/{self.modelo.id}/'
+
+    def matriz(self, base):
+        return {
+            'materiais': [material.id for material in self.materiais],
+            'tamanhos': {
+                tamanho: [str(base + indice + desvio) for indice in range(len(self.materiais))]
+                for desvio, tamanho in enumerate(['P', 'M', 'G', 'GG', 'XG'])
+            },
+        }
+
+    def test_matrix_payload_replaces_sheet(self):
+        response = self.client.patch(self.url, {'consumo_matriz': self.matriz(1)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ConsumoMaterial.objects.filter(modelo=self.modelo).count(), 40)
+        consumo = ConsumoMaterial.objects.get(modelo=self.modelo, tamanho='GG', material=self.botao)
+        self.assertEqual(consumo.quantidade, Decimal('5'))
+        self.assertEqual(len(response.data['consumo_materiais']), 40)
+
+        # The compiled sheet must see the new consumption
+        pedido = self.criar_pedido({'XG': 1})
+        self.assertEqual(calcular_necessidades(pedido)[pedido.id][self.tecido.id]['quantidade'], Decimal('5'))
+
+    def test_edit_query_count_is_constant(self):
+        self.client.patch(self.url, {'consumo_matriz': self.matriz(1)}, format='json')
+        matriz = self.matriz(1)
+        matriz['tamanhos']['P'] = ['9'] * len(self.materiais)
+        matriz['tamanhos'].pop('XG')
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.patch(self.url, {'consumo_matriz': matriz}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(consultas), 20)
+        self.assertEqual(ConsumoMaterial.objects.filter(modelo=self.modelo).count(), 32)
+        self.assertEqual(ConsumoMaterial.objects.filter(modelo=self.modelo, tamanho='P', quantidade=9).count(), 8)
+
+    def test_row_payload_is_diffed_by_size_and_material(self):
+        consumo_m = ConsumoMaterial.objects.get(modelo=self.modelo, tamanho='M', material=self.tecido)
+        payload = {'consumo_materiais': [
+            {'tamanho': 'M', 'material_id': self.tecido.id, 'quantidade': '2.500'},
+            {'tamanho': 'GG', 'material_id': self.botao.id, 'quantidade': '5'},
+        ]}
+        response = self.client.patch(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        consumos = ConsumoMaterial.objects.filter(modelo=self.modelo)
+        self.assertEqual(consumos.count(), 2)
+        # The existing row was updated in place, not recreated
+        self.assertEqual(consumos.get(tamanho='M').id, consumo_m.id)
+        self.assertEqual(consumos.get(tamanho='M').quantidade, Decimal('2.500'))
+
+    def test_invalid_matrix_is_rejected(self):
+        matriz = {'materiais': [self.tecido.id, self.botao.id], 'tamanhos': {'P': ['1']}}
+        response = self.client.patch(self.url, {'consumo_matriz': matriz}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ConsumoMaterial.objects.filter(modelo=self.modelo).count(), 6)
+
+
+class DependenciasFichaTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.aberto = self.criar_pedido({'P': 10})
+            self.concluido = self.criar_pedido({'P': 10}, status='CONCLUIDO')
+
+    def quantidades(self, pedido):
+        pedido.refresh_from_db()
+        return {m['material_id']: m for m in pedido.materiais_necessarios}
+
+    def test_consumption_change_recomputes_open_orders_only(self):
+        consumo = ConsumoMaterial.objects.get(modelo=self.modelo, tamanho='P', material=self.tecido)
+        consumo.quantidade = Decimal('2.000')
+        with self.captureOnCommitCallbacks(execute=True):
+            consumo.save()
+
+        self.assertEqual(self.quantidades(self.aberto)[self.tecido.id]['quantidade'], 20.0)
+        self.assertEqual(self.aberto.itens.get().materiais[0]['quantidade'], 20.0)
+        self.assertEqual(self.quantidades(self.concluido)[self.tecido.id]['quantidade'], 11.0)
+
+    def test_material_rename_recomputes_stored_names(self):
+        self.tecido.name = 'Tecido Renomeado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tecido.save()
+        self.assertEqual(self.quantidades(self.aberto)[self.tecido.id]['nome'], 'Tecido Renomeado')
+        self.assertEqual(self.quantidades(self.concluido)[self.tecido.id]['nome'], 'Tecido Teste')
+
+    def test_stock_only_change_does_not_recompute(self):
+        self.tecido.quantity = Decimal('50')
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tecido.save()
+        self.assertFalse([q for q in consultas.captured_queries if 'comercial_itempedido' in q['sql']])
+
+    def test_bulk_sheet_edit_recomputes_open_orders(self):
+        matriz = {'materiais': [self.tecido.id], 'tamanhos': {'P': ['3']}}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/comercial/modelos-produto/{self.modelo.id}/', {'consumo_matriz': matriz}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        quantidades = self.quantidades(self.aberto)
+        self.assertEqual(quantidades[self.tecido.id]['quantidade'], 30.0)
+        self.assertNotIn(self.botao.id, quantidades)
+
+    def test_recompute_runs_in_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(4):
+                self.criar_pedido({'M': 1})
+        with mock.patch('apps.comercial.recalculo.TAMANHO_LOTE_RECALCULO', 2):
+            pedido_ids = recalcular_dependentes(material_ids=[self.tecido.id])
+        self.assertEqual(pedido_ids, [])
+
+        ConsumoMaterial.objects.filter(material=self.botao).update(quantidade=Decimal('7'))
+        invalidar_bom()
+        with mock.patch('apps.comercial.recalculo.TAMANHO_LOTE_RECALCULO', 2):
+            pedido_ids = recalcular_dependentes(material_ids=[self.botao.id])
+        self.assertEqual(len(pedido_ids), 5)
+        self.assertEqual(self.quantidades(self.aberto)[self.botao.id]['quantidade'], 70.0)
+
+
+class AprovacaoLoteTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def test_batch_approval_is_idempotent(self):
+        pendentes = [self.criar_pedido({'P': 1}, prioridade='URGENTE') for _ in range(5)]
+        cancelado = self.criar_pedido({'P': 1}, status='CANCELADO')
+        ids = [pedido.id for pedido in pendentes] + [cancelado.id, 999999]
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post('/api/comercial/pedidos/aprovar-lote/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['aprovados']), sorted(pedido.id for pedido in pendentes))
+        self.assertEqual(response.data['ordens_criadas'], 5)
+        self.assertEqual(response.data['ignorados'], [{'id': cancelado.id, 'status': 'CANCELADO'}])
+        self.assertEqual(response.data['nao_encontrados'], [999999])
+        self.assertLess(len(consultas), 20)
+
+        self.assertEqual(PedidoVenda.objects.filter(status='APROVADO').count(), 5)
+        self.assertEqual(OrdemProducao.objects.filter(priority='URGENTE').count(), 5)
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.reserved, Decimal('5.50'))
+
+        response = self.client.post('/api/comercial/pedidos/aprovar-lote/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['aprovados'], [])
+        self.assertEqual(len(response.data['ja_aprovados']), 5)
+        self.assertEqual(response.data['ordens_criadas'], 0)
+        self.assertEqual(OrdemProducao.objects.count(), 5)
+
+    def test_reports_only_orders_actually_inserted(self):
+        pedidos = [self.criar_pedido({'P': 1}) for _ in range(2)]
+        # Another request creates the first order after this one checked for it
+        OrdemProducao.objects.create(
+            pedido_venda=pedidos[0], client=self.cliente.nome, start_date=date.today(), estimated_end_date=date.today(),
+        )
+        consultar = aprovacao._pedidos_com_ordem
+        leituras = [set()]
+
+        def leitura(pedido_ids):
+            return leituras.pop() if leituras else consultar(pedido_ids)
+
+        with mock.patch('apps.comercial.aprovacao._pedidos_com_ordem', side_effect=leitura):
+            resumo = aprovar_pedidos([pedido.id for pedido in pedidos])
+        self.assertEqual(resumo['ordens_criadas'], 1)
+        self.assertEqual(OrdemProducao.objects.filter(pedido_venda__in=pedidos).count(), 2)
+
+    def test_patch_creates_production_order_once(self):
+        pedido = self.criar_pedido({'P': 1})
+        url = f'/api/comercial/pedidos/{pedido.id}/'
+        self.client.patch(url, {'status': 'APROVADO'}, format='json')
+        self.client.patch(url, {'prazo': str(date.today())}, format='json')
+        self.assertEqual(OrdemProducao.objects.filter(pedido_venda=pedido).count(), 1)
+
+
+class CamposDinamicosTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        for _ in range(3):
+            self.criar_pedido({'P': 2})
+
+    def listar(self, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/comercial/pedidos/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], consultas
+
+    def test_default_shape_is_unchanged(self):
+        pedidos, _ = self.listar()
+        self.assertIn('modelo_base_data', pedidos[0]['itens'][0])
+        self.assertIn('materiais', pedidos[0]['itens'][0])
+
+    def test_sparse_fieldset_skips_items(self):
+        pedidos, consultas = self.listar(fields='id,cliente,status,prazo,prioridade')
+        self.assertEqual(set(pedidos[0]), {'id', 'cliente', 'status', 'prazo', 'prioridade'})
+        self.assertFalse([q for q in consultas.captured_queries if 'comercial_itempedido' in q['sql']])
+
+    def test_expand_controls_nested_blocks(self):
+        pedidos, consultas = self.listar(expand='itens')
+        item = pedidos[0]['itens'][0]
+        self.assertIn('tamanhos', item)
+        self.assertNotIn('modelo_base_data', item)
+        self.assertNotIn('materiais', item)
+        self.assertFalse([q for q in consultas.captured_queries if 'estoque_materiaprima' in q['sql']])
+
+        pedidos, _ = self.listar(expand='itens,itens.materiais', fields='id,itens.id,itens.materiais')
+        self.assertEqual(set(pedidos[0]['itens'][0]), {'id', 'materiais'})
+
+    def test_writes_ignore_field_selection(self):
+        pedido = PedidoVenda.objects.first()
+        response = self.client.patch(
+            f'/api/comercial/pedidos/{pedido.id}/?fields=id', {'prioridade': 'URGENTE'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.prioridade, 'URGENTE')
+
+
+    def test_client_summary_is_joined_in_the_list_query(self):
+        pedidos, consultas = self.listar(fields='id,cliente_resumo')
+        self.assertEqual(pedidos[0]['cliente_resumo'], {'id': self.cliente.id, 'nome': self.cliente.nome, 'tipo': 'PJ'})
+        # The client comes from the order SELECT itself, not a separate query
+        self.assertFalse([
+            q for q in consultas.captured_queries
+            if 'clientes_cliente' in q['sql'] and 'comercial_pedidovenda' not in q['sql']
+        ])
+
+        pedidos, consultas = self.listar(fields='id,status')
+        self.assertFalse([q for q in consultas.captured_queries if 'clientes_cliente' in q['sql']])
+
+
+class PaginacaoCursorTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.pedidos = [PedidoVenda.objects.create(cliente=self.cliente) for _ in range(5)]
+
+    def test_cursor_walks_all_orders_without_count(self):
+        vistos = []
+        url = '/api/comercial/pedidos/?page_size=2&fields=id'
+        while url:
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([q for q in consultas.captured_queries if 'COUNT(' in q['sql']])
+            self.assertNotIn('count', response.data)
+            vistos += [pedido['id'] for pedido in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(vistos, sorted((pedido.id for pedido in self.pedidos), reverse=True))
+
+    def test_page_size_is_capped(self):
+        with mock.patch('proindustria360.pagination.PaginacaoPorCursor.max_page_size', 3):
+            response = self.client.get('/api/comercial/pedidos/', {'page_size': 1000, 'fields': 'id'})
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class ExportacaoPedidosTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.aprovados = [self.criar_pedido({'P': 2, 'M': 1}, status='APROVADO') for _ in range(3)]
+        self.pendente = self.criar_pedido(status='PENDENTE')
+        self.sem_itens = PedidoVenda.objects.create(cliente=self.cliente, status='APROVADO')
+
+    def exportar(self, **params):
+        response = self.client.get('/api/comercial/pedidos/exportar/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_export_writes_one_row_per_item_with_grid_and_materials(self):
+        linhas = self.exportar(status='APROVADO')
+        self.assertEqual([int(linha['pedido_id']) for linha in linhas], [p.id for p in self.aprovados] + [self.sem_itens.id])
+
+        linha = linhas[0]
+        self.assertEqual(linha['cliente'], 'Cliente Teste')
+        self.assertEqual(linha['modelo_base'], 'Camisa Teste')
+        self.assertEqual(linha['grade'], 'P:2;M:1')
+        self.assertEqual(linha['quantidade_item'], '3')
+        self.assertIn('Tecido Teste:3.4', linha['materiais'])
+        # An order without items still gets a row, with blank item columns
+        self.assertEqual(linhas[-1]['item_id'], '')
+
+    def test_export_reads_items_per_chunk(self):
+        queryset = filtrar_pedidos()
+        with self.assertNumQueries(2):
+            list(linhas_exportacao(queryset))
+        # The orders are streamed from one cursor; each chunk adds one item query
+        with self.assertNumQueries(4):
+            list(linhas_exportacao(queryset, tamanho_bloco=2))
+
+    def test_export_rejects_invalid_filters(self):
+        response = self.client.get('/api/comercial/pedidos/exportar/', {'status': 'INEXISTENTE'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/comercial/pedidos/exportar/', {'data_inicio': '2025-02-01', 'data_fim': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_csv(self):
+        saida = io.StringIO()
+        call_command('exportar_pedidos', '--status', 'PENDENTE', stdout=saida)
+        linhas = list(csv.DictReader(io.StringIO(saida.getvalue())))
+        self.assertEqual([int(linha['pedido_id']) for linha in linhas], [self.pendente.id])
+
+
+class ImportacaoPedidosTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def importar(self, conteudo, nome='pedidos.csv'):
+        arquivo = SimpleUploadedFile(nome, conteudo.encode(), content_type='text/plain')
+        return self.client.post('/api/comercial/pedidos/importar/', {'arquivo': arquivo}, format='multipart')
+
+    def test_csv_rows_are_grouped_into_orders_with_materials(self):
+        response = self.importar(
+            'pedido,cpf_cnpj,modelo,P,M,G,preco_unitario\n'
+            'A1,00.000.000/0001-00,Camisa Teste,10,5,,20.00\n'
+            'A1,00.000.000/0001-00,camisa teste,,,2,25.00\n'
+            'A2,00.000.000/0001-00,Camisa Teste,1,,,\n'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['pedidos_criados'], 2)
+        self.assertEqual(response.data['itens_criados'], 3)
+        self.assertEqual(response.data['erros'], [])
+
+        pedido = PedidoVenda.objects.get(id=response.data['ids'][0])
+        self.assertEqual(pedido.itens.count(), 2)
+        self.assertEqual(pedido.quantidade_pecas, 17)
+        self.assertEqual(pedido.valor_total, Decimal('350.00'))
+        materiais = {m['material_id']: m['quantidade'] for m in pedido.materiais_necessarios}
+        self.assertAlmostEqual(materiais[self.tecido.id], 19.6)
+        self.assertIsNone(PedidoVenda.objects.get(id=response.data['ids'][1]).valor_total)
+
+    def test_invalid_rows_reject_only_their_order(self):
+        response = self.importar(
+            'pedido,cpf_cnpj,modelo,P\n'
+            'A1,00.000.000/0001-00,Camisa Teste,3\n'
+            'B1,99.999.999/9999-99,Camisa Teste,3\n'
+            'C1,00.000.000/0001-00,Modelo Inexistente,3\n'
+            'C1,00.000.000/0001-00,Camisa Teste,3\n'
+        )
+        self.assertEqual(response.data['pedidos_criados'], 1)
+        self.assertEqual(response.data['pedidos_rejeitados'], 2)
+        self.assertEqual([erro['linha'] for erro in response.data['erros']], [3, 4])
+        self.assertEqual(PedidoVenda.objects.count(), 1)
+
+    def test_chunks_compute_materials_once(self):
+        linhas = [(numero, {'pedido': str(numero), 'cpf_cnpj': self.cliente.cpf_cnpj, 'modelo': 'Camisa Teste', 'tamanhos': {'M': 2}})
+                  for numero in range(1, 7)]
+        with mock.patch('apps.comercial.gravacao.calcular_materiais_itens', wraps=calcular_materiais_itens) as calcular:
+            relatorio = importar_pedidos(iter(linhas), tamanho_lote=4)
+        self.assertEqual(relatorio['pedidos_criados'], 6)
+        self.assertEqual(calcular.call_count, 2)
+
+    def test_jsonl_file_and_invalid_lines(self):
+        response = self.importar(
+            '{"cpf_cnpj": "00.000.000/0001-00", "modelo": "Camisa Teste", "tamanhos": {"G": 4}, "prazo": "2030-01-10"}\n'
+            'não é json\n',
+            nome='pedidos.jsonl',
+        )
+        self.assertEqual(response.data['pedidos_criados'], 1)
+        self.assertEqual(response.data['erros'][0]['linha'], 2)
+        self.assertEqual(PedidoVenda.objects.get().prazo, date(2030, 1, 10))
+
+    def test_command_reports_errors(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as arquivo:
+            arquivo.write('cpf_cnpj,modelo,P\n00.000.000/0001-00,Camisa Teste,x\n')
+        self.addCleanup(os.remove, arquivo.name)
+        saida = io.StringIO()
+        call_command('importar_pedidos', arquivo.name, stdout=saida)
+        self.assertIn('Linha 2', saida.getvalue())
+        self.assertFalse(PedidoVenda.objects.exists())
+
+
+class ComissaoTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+        self.ana = Vendedor.objects.create(nome='Ana', email='ana@teste.com', meta_mensal=Decimal('1000'), taxa_comissao=Decimal('5'))
+        self.beto = Vendedor.objects.create(nome='Beto', email='beto@teste.com', meta_mensal=Decimal('0'), taxa_comissao=Decimal('3.5'))
+        self.hoje = timezone.localdate()
+
+    def pedido(self, vendedor, valor, status='APROVADO'):
+        return PedidoVenda.objects.create(cliente=self.cliente, vendedor=vendedor, valor_total=Decimal(valor), status=status)
+
+    def test_engine_creates_commissions_and_rollups_in_one_pass(self):
+        self.pedido(self.ana, '300.00')
+        self.pedido(self.ana, '199.99', status='PRODUCAO')
+        self.pedido(self.beto, '100.00')
+        self.pedido(self.ana, '500.00', status='CANCELADO')
+        self.pedido(None, '500.00')
+
+        comissoes = calcular_comissoes(self.hoje, self.hoje)
+        self.assertEqual(len(comissoes), 3)
+        self.assertEqual(Comissao.objects.get(pedido__valor_total=Decimal('199.99')).valor, Decimal('10.00'))
+
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.ana)
+        self.assertEqual(resumo.total_vendas, Decimal('499.99'))
+        self.assertEqual(resumo.total_comissao, Decimal('25.00'))
+        self.assertEqual(resumo.pedidos, 2)
+        self.assertEqual(resumo.percentual_meta, Decimal('50.00'))
+        self.assertEqual(ResumoVendedorMensal.objects.get(vendedor=self.beto).total_comissao, Decimal('3.50'))
+
+        # Running again only picks up new orders, incrementally
+        self.pedido(self.ana, '500.01')
+        self.assertEqual(len(calcular_comissoes(self.hoje, self.hoje)), 1)
+        resumo.refresh_from_db()
+        self.assertEqual(resumo.total_vendas, Decimal('1000.00'))
+        self.assertEqual(resumo.percentual_meta, Decimal('100.00'))
+
+    def test_manual_commission_uses_decimal_rate_and_updates_rollup(self):
+        pedido = self.pedido(self.beto, '123.45')
+        response = self.client.post('/api/comercial/comissoes/', {'vendedor': self.beto.id, 'pedido': pedido.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['valor']), Decimal('4.32'))
+        self.assertEqual(ResumoVendedorMensal.objects.get(vendedor=self.beto).total_vendas, Decimal('123.45'))
+        repetida = self.client.post('/api/comercial/comissoes/', {'vendedor': self.ana.id, 'pedido': pedido.id}, format='json')
+        self.assertEqual(repetida.status_code, 400)
+
+        response = self.client.delete(f"/api/comercial/comissoes/{response.data['id']}/")
+        self.assertEqual(response.status_code, 204)
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.beto)
+        self.assertEqual((resumo.total_vendas, resumo.pedidos), (Decimal('0'), 0))
+
+    def test_cancelling_an_order_reverses_its_commission(self):
+        pedido = self.pedido(self.ana, '200.00')
+        calcular_comissoes(self.hoje, self.hoje)
+        response = self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'status': 'CANCELADO'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Comissao.objects.exists())
+        self.assertEqual(ResumoVendedorMensal.objects.get(vendedor=self.ana).total_vendas, Decimal('0'))
+
+    def test_reversal_subtracts_the_amount_that_was_added(self):
+        pedido = self.pedido(self.ana, '200.00')
+        calcular_comissoes(self.hoje, self.hoje)
+        # Value change and cancellation in the same request
+        response = self.client.patch(
+            f'/api/comercial/pedidos/{pedido.id}/', {'valor_total': '350.00', 'status': 'CANCELADO'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.ana)
+        self.assertEqual((resumo.total_vendas, resumo.total_comissao, resumo.pedidos), (Decimal('0'), Decimal('0'), 0))
+
+    def test_order_value_and_seller_changes_update_commission(self):
+        pedido = self.pedido(self.ana, '200.00')
+        calcular_comissoes(self.hoje, self.hoje)
+
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'valor_total': '300.00'}, format='json')
+        comissao = Comissao.objects.get()
+        self.assertEqual((comissao.valor_pedido, comissao.valor), (Decimal('300.00'), Decimal('15.00')))
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.ana)
+        self.assertEqual((resumo.total_vendas, resumo.total_comissao, resumo.pedidos), (Decimal('300.00'), Decimal('15.00'), 1))
+
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {'vendedor': self.beto.id}, format='json')
+        comissao.refresh_from_db()
+        self.assertEqual((comissao.vendedor_id, comissao.valor), (self.beto.id, Decimal('10.50')))
+        resumo.refresh_from_db()
+        self.assertEqual((resumo.total_vendas, resumo.pedidos), (Decimal('0'), 0))
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.beto)
+        self.assertEqual((resumo.total_vendas, resumo.total_comissao, resumo.pedidos), (Decimal('300.00'), Decimal('10.50'), 1))
+
+    def test_ranking_reads_only_the_rollup_table(self):
+        self.pedido(self.ana, '100.00')
+        self.pedido(self.beto, '400.00')
+        response = self.client.post('/api/comercial/comissoes/calcular/', {'inicio': self.hoje, 'fim': self.hoje}, format='json')
+        self.assertEqual(response.data['comissoes_criadas'], 2)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/comercial/vendedores/ranking/', {'mes': self.hoje.strftime('%Y-%m')})
+        self.assertEqual([linha['vendedor_nome'] for linha in response.data], ['Beto', 'Ana'])
+        self.assertFalse([q for q in consultas.captured_queries if 'comercial_pedidovenda' in q['sql']])
+
+        response = self.client.get('/api/comercial/vendedores/ranking/', {'ordenar': 'meta'})
+        self.assertEqual(response.data[0]['vendedor_nome'], 'Ana')
+
+    def test_target_change_updates_current_month(self):
+        self.pedido(self.ana, '300.00')
+        calcular_comissoes(self.hoje, self.hoje)
+        response = self.client.patch(f'/api/comercial/vendedores/{self.ana.id}/', {'meta_mensal': '600.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ResumoVendedorMensal.objects.get(vendedor=self.ana).percentual_meta, Decimal('50.00'))
+
+    def test_migration_backfills_local_month_and_rollups(self):
+        migracao = importlib.import_module('apps.comercial.migrations.0024_comissoes_resumo_mensal')
+        pedido = self.pedido(self.ana, '300.00')
+        # 01:00 UTC on the 1st is still the previous month in São Paulo
+        PedidoVenda.objects.filter(id=pedido.id).update(data_pedido=datetime(2026, 10, 1, 1, tzinfo=dt_timezone.utc))
+        Comissao.objects.create(vendedor=self.ana, pedido=pedido, valor=Decimal('15.00'))
+
+        with timezone.override('America/Sao_Paulo'):
+            migracao.preparar_comissoes(django_apps, None)
+        self.assertEqual(Comissao.objects.get().competencia, date(2026, 9, 1))
+
+        migracao.preencher_resumos(django_apps, None)
+        resumo = ResumoVendedorMensal.objects.get(vendedor=self.ana)
+        self.assertEqual((resumo.competencia, resumo.total_vendas, resumo.pedidos), (date(2026, 9, 1), Decimal('300.00'), 1))
+        self.assertEqual(resumo.percentual_meta, Decimal('30.00'))
+
+
+class GradeItemPedidoTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def grade(self, item):
+        return dict(GradeItemPedido.objects.filter(item=item).values_list('tamanho', 'quantidade'))
+
+    def test_grid_rows_follow_item_writes(self):
+        response = self.client.post('/api/comercial/pedidos/', {
+            'cliente': self.cliente.id,
+            'itens': [{'modelo_base': self.modelo.id, 'tamanhos': {'P': 3, 'M': 0, 'G': 2}}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        item = ItemPedido.objects.get(pedido_id=response.data['id'])
+        self.assertEqual(self.grade(item), {'P': 3, 'G': 2})
+        # The JSON grid is still served as before
+        self.assertEqual(response.data['itens'][0]['tamanhos'], {'P': 3, 'M': 0, 'G': 2})
+
+        response = self.client.patch(f"/api/comercial/pedidos/{response.data['id']}/", {
+            'itens': [{'id': item.id, 'modelo_base': self.modelo.id, 'tamanhos': {'M': 7}}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.grade(item), {'M': 7})
+
+        item.tamanhos = {'GG': 1}
+        item.save()
+        self.assertEqual(self.grade(item), {'GG': 1})
+
+    def test_piece_counts_are_summed_in_sql(self):
+        outro = ModeloProduto.objects.create(nome='Calça Teste', tipo='CALCA')
+        self.criar_pedido({'P': 10, 'M': 5}, status='APROVADO')
+        pedido = self.criar_pedido({'M': 4}, status='APROVADO')
+        ItemPedido.objects.create(pedido=pedido, modelo_base=outro, tamanhos={'G': 6})
+        self.criar_pedido({'M': 100}, status='CANCELADO')
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/comercial/pedidos/pecas/', {'status': 'APROVADO'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(linha['modelo'], linha['tamanho'], linha['pecas']) for linha in response.data],
+            [('Camisa Teste', 'M', 9), ('Camisa Teste', 'P', 10), ('Calça Teste', 'G', 6)],
+        )
+        self.assertFalse([q for q in consultas.captured_queries if 'comercial_itempedido' in q['sql']])
+
+        response = self.client.get('/api/comercial/pedidos/pecas/', {'agrupar': 'tamanho,mes', 'modelo': self.modelo.id})
+        self.assertEqual([linha['pecas'] for linha in response.data], [109, 10])
+        self.assertEqual(response.data[0]['mes'].day, 1)
+
+        self.assertEqual(self.client.get('/api/comercial/pedidos/pecas/', {'agrupar': 'cor'}).status_code, 400)
+
+
+class NecessidadeMaterialTests(ComercialTestMixin, APITestCase):
+    def setUp(self):
+        self.criar_dados()
+
+    def linhas(self, pedido):
+        return dict(NecessidadeMaterial.objects.filter(pedido=pedido).values_list('material_id', 'quantidade'))
+
+    def test_lines_follow_item_writes_and_sheet_changes(self):
+        response = self.client.post('/api/comercial/pedidos/', {
+            'cliente': self.cliente.id, 'itens': [{'modelo_base': self.modelo.id, 'tamanhos': {'P': 10, 'M': 5}}],
+        }, format='json')
+        pedido = PedidoVenda.objects.get(id=response.data['id'])
+        self.assertEqual(self.linhas(pedido), {self.tecido.id: Decimal('17.000'), self.botao.id: Decimal('45.000')})
+
+        item = pedido.itens.get()
+        self.client.patch(f'/api/comercial/pedidos/{pedido.id}/', {
+            'itens': [{'id': item.id, 'modelo_base': self.modelo.id, 'tamanhos': {'G': 1}}],
+        }, format='json')
+        self.assertEqual(self.linhas(pedido), {self.tecido.id: Decimal('1.300'), self.botao.id: Decimal('4.000')})
+
+        consumo = ConsumoMaterial.objects.get(modelo=self.modelo, tamanho='G', material=self.tecido)
+        consumo.quantidade = Decimal('2.000')
+        with self.captureOnCommitCallbacks(execute=True):
+            consumo.save()
+        self.assertEqual(self.linhas(pedido)[self.tecido.id], Decimal('2.000'))
+
+    def test_requirements_are_summed_in_one_query(self):
+        pedido = self.criar_pedido({'P': 10})
+        ItemPedido.objects.create(pedido=pedido, modelo_base=self.modelo, tamanhos={'P': 10})
+        with self.assertNumQueries(1):
+            necessidades = calcular_necessidades([pedido.id])[pedido.id]
+        self.assertEqual(necessidades[self.tecido.id]['quantidade'], Decimal('22.000'))
+        self.assertEqual(necessidades[self.tecido.id]['unidade'], 'Metro')
+
+    def test_open_demand_joins_stock(self):
+        self.criar_pedido({'G': 50}, status='APROVADO')
+        self.criar_pedido({'G': 50})
+        self.criar_pedido({'G': 500}, status='CONCLUIDO')
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/comercial/pedidos/demanda-materiais/')
+        self.assertEqual(len(consultas), 1)
+        demanda = {linha['material_id']: linha for linha in response.data}
+        self.assertEqual(demanda[self.tecido.id]['demanda'], Decimal('130.000'))
+        self.assertEqual(demanda[self.tecido.id]['falta'], Decimal('30.000'))
+        self.assertEqual(demanda[self.botao.id]['pedidos'], 2)
+
+        response = self.client.get('/api/comercial/pedidos/demanda-materiais/', {'apenas_faltas': 'true'})
+        self.assertEqual([linha['material_id'] for linha in response.data], [self.tecido.id])
@@ -0,0 +1,67 @@
+import uuid
+
+# Versões dos dados derivados, gravadas em VersaoCache. A versão é um token
+# aleatório trocado na própria transação que altera os dados: os outros
+# processos só enxergam o token novo junto com o commit, e o token de uma
+# transação desfeita nunca volta a ser usado, de modo que nada guardado sob
+# ele é servido depois do rollback.
+VERSAO_INICIAL = '0'
+
+CHAVE_VERSAO_BOM = 'comercial:bom:versao'
+CHAVE_VERSAO_ESTOQUE = 'comercial:estoque:versao'
+
+
+def chave_versao_pedido(pedido_id):
+    return f'comercial:pedido:{pedido_id}:versao'
+
+
+def obter_versoes(chaves):
+    """
+    Retorna {chave: versão} das chaves informadas, em uma única consulta.
+    Chaves nunca invalidadas ficam com VERSAO_INICIAL.
+    """
+    from .models import VersaoCache
+
+    versoes = dict(VersaoCache.objects.filter(chave__in=list(chaves)).values_list('chave', 'versao'))
+    return {chave: versoes.get(chave, VERSAO_INICIAL) for chave in chaves}
+
+
+def obter_versao(chave):
+    """
+    Retorna a versão atual associada à chave.
+    """
+    return obter_versoes([chave])[chave]
+
+
+def incrementar_versao(chave):
+    """
+    Troca a versão da chave por um token novo, invalidando tudo o que foi
+    derivado dela. Dentro de uma transação, a troca só vale no commit.
+    """
+    from .models import VersaoCache
+
+    versao = uuid.uuid4().hex
+    VersaoCache.objects.bulk_create(
+        [VersaoCache(chave=chave, versao=versao)],
+        update_conflicts=True, unique_fields=['chave'], update_fields=['versao'],
+    )
+    return versao
+
+
+def invalidar_versao(chave):
+    """
+    Invalida a chave na transação corrente: a própria transação passa a ver a
+    versão nova de imediato e os demais processos a partir do commit.
+    """
+    return incrementar_versao(chave)
+
+
+def versao_materiais_pedido(pedido_id):
+    """
+    Versão dos materiais de um pedido: muda sempre que os itens do pedido, as
+    fichas técnicas ou o estoque de matéria-prima mudam. As três versões vêm
+    do banco, em uma consulta, e valem igualmente para todos os processos.
+    """
+    chaves = [chave_versao_pedido(pedido_id), CHAVE_VERSAO_BOM, CHAVE_VERSAO_ESTOQUE]
+    versoes = obter_versoes(chaves)
+    return '.'.join(versoes[chave] for chave in chaves)
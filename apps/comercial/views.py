@@ -1,21 +1,54 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from .models import PedidoVenda, Orcamento, Vendedor, Comissao, ModeloProduto
-from .serializers import PedidoVendaSerializer, OrcamentoSerializer, VendedorSerializer, ComissaoSerializer, ModeloProdutoSerializer, ConsumoMaterialSerializer
-from apps.pcp.models import OrdemProducao
+from .serializers import AprovacaoLoteSerializer, CalculoComissoesSerializer, FiltrosPedidosSerializer, ImportacaoPedidosSerializer, PecasGradeSerializer, PedidoVendaSerializer, OrcamentoSerializer, ResumoVendedorMensalSerializer, VendedorSerializer, ComissaoSerializer, ModeloProdutoSerializer, ConsumoMaterialSerializer
+from .aprovacao import aprovar_pedidos, gerar_ordens_producao
+from .baixa import baixar_materiais_pedido
+from .bom import obter_ficha
+from .campos import filtrar_campos
+from .comissoes import acumular_resumos, atualizar_meta, calcular_comissoes, estornar_comissoes, inicio_do_mes, ranking, reajustar_comissoes, valor_comissao
+from .exportacao import filtrar_pedidos, gerar_csv
+from .grades import somar_pecas
+from .importacao import importar_pedidos, ler_linhas
+from .mrp import calcular_mrp, demanda_em_aberto
+from .necessidades import calcular_necessidades
+from .versoes import versao_materiais_pedido
 from apps.estoque.models import MateriaPrima # Import MateriaPrima
-from collections import defaultdict
+from apps.estoque.movimentacao import EstoqueInsuficiente
+from apps.estoque.reservas import liberar_reservas, reservar_pedidos, reservas_do_pedido
+from apps.estoque.serializers import MateriaPrimaSerializer
+from proindustria360.pagination import PaginacaoPedidos
+import io
 import logging
+from datetime import date
+from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
+# As entradas são endereçadas pela versão de materiais do pedido, então o
+# timeout só limita quanto tempo uma versão antiga ocupa o cache.
+TIMEOUT_CACHE_MATERIAIS = 60 * 60
+
+# ?ordenar do ranking de vendedores → campo do resumo mensal
+ORDENACAO_RANKING = {'vendas': 'total_vendas', 'comissao': 'total_comissao', 'meta': 'percentual_meta'}
+
+# Status em que o pedido deixa de reter materiais reservados
+STATUS_LIBERAM_RESERVAS = ('CANCELADO', 'REJEITADO')
+
 class PedidoVendaViewSet(viewsets.ModelViewSet):
     queryset = PedidoVenda.objects.all()
     serializer_class = PedidoVendaSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacaoPedidos
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['cliente', 'status', 'prioridade']
 
@@ -24,88 +57,214 @@ class PedidoVendaViewSet(viewsets.ModelViewSet):
         Sobrescreve o queryset para otimizar as consultas ao banco de dados,
         pré-buscando os itens e os detalhes do cliente para evitar o problema N+1.
         """
-        return PedidoVenda.objects.prefetch_related('itens', 'cliente').all()
+        if self.action in ('materiais', 'baixar_estoque'):
+            return PedidoVenda.objects.all()
+        queryset = PedidoVenda.objects.all()
+        # O cliente e os itens só são carregados quando a resposta vai
+        # incluí-los (?fields / ?expand); o cliente vem no mesmo SELECT
+        incluidos = filtrar_campos(
+            self.request, (), ['cliente_resumo', 'itens'], PedidoVendaSerializer.CAMPOS_EXPANSIVEIS
+        )
+        if 'cliente_resumo' in incluidos:
+            queryset = queryset.select_related('cliente')
+        if 'itens' in incluidos:
+            queryset = queryset.prefetch_related('itens')
+        return queryset
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            instance = serializer.save()
+            if instance.status == 'APROVADO':
+                reservar_pedidos(instance)
 
     def perform_update(self, serializer):
-        instance = serializer.save()
-        if instance.status == 'APROVADO':
-            priority_map = {
-                'BAIXA': 'BAIXA',
-                'NORMAL': 'MEDIA',
-                'ALTA': 'ALTA',
-            }
-            pcp_priority = priority_map.get(instance.prioridade, 'MEDIA')
-
-            OrdemProducao.objects.create(
-                client=instance.cliente.nome,
-                start_date=instance.data_pedido.date(),
-                estimated_end_date=instance.prazo,
-                status='PENDENTE',
-                priority=pcp_priority
-            )
+        status_anterior = serializer.instance.status
+        valor_anterior, vendedor_anterior = serializer.instance.valor_total, serializer.instance.vendedor_id
+        with transaction.atomic():
+            instance = serializer.save()
+            self._atualizar_reservas(instance, status_anterior, 'itens' in serializer.validated_data)
+            if instance.status in STATUS_LIBERAM_RESERVAS and status_anterior not in STATUS_LIBERAM_RESERVAS:
+                # Pedido cancelado ou rejeitado não rende comissão
+                estornar_comissoes(instance.comissoes.all())
+            elif instance.valor_total != valor_anterior or instance.vendedor_id != vendedor_anterior:
+                reajustar_comissoes(instance, vendedor_alterado=instance.vendedor_id != vendedor_anterior)
+            if instance.status == 'APROVADO' and status_anterior != 'APROVADO':
+                gerar_ordens_producao([instance])
+            if instance.status == 'MATERIAIS_CONFIRMADOS' and status_anterior != 'MATERIAIS_CONFIRMADOS':
+                try:
+                    baixar_materiais_pedido(instance)
+                except EstoqueInsuficiente as e:
+                    # Desfaz também a mudança de status
+                    raise ValidationError({'status': str(e), 'faltas': e.faltas})
+
+    def _atualizar_reservas(self, pedido, status_anterior, itens_alterados):
+        """
+        Reserva os materiais quando o pedido é aprovado (ou quando os itens de
+        um pedido com reservas mudam) e libera as reservas no cancelamento ou
+        na rejeição. Pedidos com materiais já baixados não têm reservas.
+        """
+        if pedido.materiais_baixados:
+            return
+        if pedido.status in STATUS_LIBERAM_RESERVAS:
+            if status_anterior not in STATUS_LIBERAM_RESERVAS:
+                liberar_reservas([pedido.id])
+        elif pedido.status == 'APROVADO' and status_anterior != 'APROVADO':
+            reservar_pedidos(pedido)
+        elif itens_alterados and pedido.reservas_materiais.exists():
+            reservar_pedidos(pedido)
 
     @action(detail=True, methods=['get'])
     def materiais(self, request, pk=None):
-        logger.info(f"Accessing materials for PedidoVenda ID: {pk}")
+        """
+        Lista a necessidade consolidada de materiais do pedido e a disponibilidade
+        em estoque. É uma leitura pura: o resultado fica em cache pela versão de
+        materiais do pedido, exposta como ETag, e If-None-Match retorna 304.
+        """
+        pedido = self.get_object()
+        etag = quote_etag(f'pedido-{pedido.id}-materiais-{versao_materiais_pedido(pedido.id)}')
+        cabecalhos = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=cabecalhos)
+
+        chave_cache = f'comercial:materiais:{etag}'
+        lista_materiais = cache.get(chave_cache)
+        if lista_materiais is None:
+            try:
+                lista_materiais = self._listar_materiais(pedido)
+            except Exception as e:
+                logger.exception(f"Erro ao processar materiais para o pedido {pk}: {e}")
+                return Response({"error": "Ocorreu um erro ao processar os materiais."}, status=500)
+            cache.set(chave_cache, lista_materiais, timeout=TIMEOUT_CACHE_MATERIAIS)
+
+        return Response(lista_materiais, headers=cabecalhos)
+
+    @action(detail=False, methods=['post'], url_path='aprovar-lote')
+    def aprovar_lote(self, request):
+        """
+        Aprova de uma vez os pedidos informados em {"ids": [...]} e gera as
+        ordens de produção que faltam. Repetir a chamada não duplica ordens.
+        """
+        serializer = AprovacaoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(aprovar_pedidos(serializer.validated_data['ids']))
+
+    @action(detail=True, methods=['post'], url_path='baixar-estoque')
+    def baixar_estoque(self, request, pk=None):
+        """
+        Baixa do estoque os materiais necessários do pedido. É idempotente:
+        se os materiais já foram baixados, nada é alterado e a resposta traz
+        baixa_realizada=false. Sem saldo suficiente, retorna 400 com as faltas.
+        """
+        pedido = self.get_object()
         try:
-            pedido = self.get_object()
-            logger.info(f"PedidoVenda found: {pedido.id}")
-            logger.info(f"Number of items in pedido: {pedido.itens.count()}")
-
-            necessidades_agregadas = defaultdict(lambda: {'quantidade': 0, 'unidade': 'N/A'})
-
-            for item in pedido.itens.all():
-                logger.info(f"Processing ItemPedido {item.id}. Modelo Base: {item.modelo_base}, Tamanhos: {item.tamanhos}")
-                # Recalculate materials for each item to ensure it's up-to-date
-                item.calcular_materiais()
-                item.save() # Save the item to persist the calculated materials
-                logger.info(f"ItemPedido {item.id} materials after calculation and save: {item.materiais}")
-                
-                if isinstance(item.materiais, list):
-                    for material_info in item.materiais:
-                        if isinstance(material_info, dict) and 'material_id' in material_info:
-                            material_id = material_info['material_id']
-                            quantidade = material_info.get('quantidade', 0)
-                            
-                            # Use the name and unit from the dict, which comes from the calculation
-                            nome = material_info.get('nome', f'Material ID {material_id}')
-                            unidade = material_info.get('unidade', 'N/A')
-
-                            necessidades_agregadas[material_id]['quantidade'] += float(quantidade)
-                            necessidades_agregadas[material_id]['nome'] = nome
-                            necessidades_agregadas[material_id]['unidade'] = unidade
-                            # Initialize quantidade_disponivel if not already present
-                            if 'quantidade_disponivel' not in necessidades_agregadas[material_id]:
-                                necessidades_agregadas[material_id]['quantidade_disponivel'] = 0
-
-            logger.info(f"Aggregated necessities before fetching available quantities: {necessidades_agregadas}")
-
-            lista_materiais = []
-            for material_id, data in necessidades_agregadas.items():
-                try:
-                    material_obj = MateriaPrima.objects.get(id=material_id)
-                    quantidade_disponivel = material_obj.quantity
-                    logger.info(f"Material {material_obj.name} (ID: {material_id}) found. Available quantity: {quantidade_disponivel}")
-                except MateriaPrima.DoesNotExist:
-                    quantidade_disponivel = 0 # Or handle as appropriate if material not found
-                    logger.warning(f"Material with ID {material_id} not found in MateriaPrima. Setting available quantity to 0.")
-
-                lista_materiais.append({
-                    'nome': data['nome'],
-                    'quantidade_necessaria': data['quantidade'], # Renamed for clarity
-                    'unidade': data['unidade'],
-                    'quantidade_disponivel': quantidade_disponivel,
-                    'suficiente': quantidade_disponivel >= data['quantidade'] # Add sufficiency check
-                })
-            
-            logger.info(f"Final list of materials to be returned: {lista_materiais}")
-            return Response(lista_materiais)
-
-        except PedidoVenda.DoesNotExist:
-            return Response({"error": "Pedido não encontrado."}, status=404)
-        except Exception as e:
-            logger.exception(f"Erro ao processar materiais para o pedido {pk}: {e}")
-            return Response({"error": "Ocorreu um erro ao processar os materiais."}, status=500)
+            historico = baixar_materiais_pedido(pedido)
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e), 'faltas': e.faltas}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'pedido_id': pedido.id,
+            'baixa_realizada': historico is not None,
+            'materiais': [
+                {'material_id': registro.material_id, 'quantidade_utilizada': registro.quantidade_utilizada}
+                for registro in historico or []
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta pedidos, itens, grade e materiais em CSV, uma linha por item.
+        Filtros: ?status=APROVADO,PRODUCAO, ?cliente=<id>, ?data_inicio= e
+        ?data_fim= (AAAA-MM-DD). A resposta é gerada à medida que é enviada.
+        """
+        filtros = FiltrosPedidosSerializer(data=request.query_params)
+        filtros.is_valid(raise_exception=True)
+        resposta = StreamingHttpResponse(
+            gerar_csv(filtrar_pedidos(**filtros.validated_data)), content_type='text/csv; charset=utf-8'
+        )
+        resposta['Content-Disposition'] = 'attachment; filename="pedidos.csv"'
+        return resposta
+
+    @action(detail=False, methods=['post'])
+    def importar(self, request):
+        """
+        Importa pedidos de um arquivo (campo multipart 'arquivo', CSV ou jsonl)
+        com uma linha por item. O arquivo é lido em fluxo e gravado em lotes;
+        pedidos com linhas inválidas são descartados sem interromper os demais,
+        e a resposta traz o relatório com os erros por linha.
+        """
+        serializer = ImportacaoPedidosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        arquivo = serializer.validated_data['arquivo']
+        texto = io.TextIOWrapper(arquivo.file, encoding='utf-8-sig', newline='')
+        try:
+            relatorio = importar_pedidos(ler_linhas(texto, serializer.validated_data['formato']))
+        except UnicodeDecodeError:
+            raise ValidationError({'arquivo': "O arquivo deve estar em UTF-8."})
+        finally:
+            texto.detach()
+        codigo = status.HTTP_201_CREATED if relatorio['pedidos_criados'] else status.HTTP_200_OK
+        return Response(relatorio, status=codigo)
+
+    @action(detail=False, methods=['get'])
+    def pecas(self, request):
+        """
+        Soma as peças das grades dos itens no banco, agrupadas por
+        ?agrupar=modelo,tamanho,mes (padrão: modelo,tamanho). O período
+        (?data_inicio, ?data_fim) e o mês usam a data do pedido ou, com
+        ?data=prazo, o prazo. Aceita também ?status, ?cliente e ?modelo.
+        """
+        filtros = PecasGradeSerializer(data=request.query_params)
+        filtros.is_valid(raise_exception=True)
+        return Response(somar_pecas(**filtros.validated_data))
+
+    @action(detail=False, methods=['get'])
+    def mrp(self, request):
+        """
+        Planejamento de necessidades de materiais: confronta a demanda acumulada
+        de todos os pedidos em aberto, na ordem de prazo e prioridade, com o estoque.
+        Use ?apenas_faltas=true para listar só os materiais que vão faltar.
+        """
+        resultado = calcular_mrp()
+        if request.query_params.get('apenas_faltas', '').lower() in ('1', 'true', 'sim'):
+            resultado = [linha for linha in resultado if linha['primeira_falta_pedido_id'] is not None]
+        return Response(resultado)
+
+    @action(detail=False, methods=['get'], url_path='demanda-materiais')
+    def demanda_materiais(self, request):
+        """
+        Demanda total de cada material nos pedidos em aberto frente ao estoque,
+        somada no banco. Use ?apenas_faltas=true para listar só os que faltam.
+        """
+        apenas_faltas = request.query_params.get('apenas_faltas', '').lower() in ('1', 'true', 'sim')
+        return Response(demanda_em_aberto(apenas_faltas))
+
+    def _listar_materiais(self, pedido):
+        necessidades = calcular_necessidades(pedido)[pedido.id]
+        estoque = {
+            material_id: (quantidade, reservado)
+            for material_id, quantidade, reservado in MateriaPrima.objects.filter(
+                id__in=list(necessidades)
+            ).values_list('id', 'quantity', 'reserved')
+        }
+        # As reservas do próprio pedido continuam disponíveis para ele
+        reservas_proprias = reservas_do_pedido(pedido.id)
+
+        lista_materiais = []
+        for material_id, dados in necessidades.items():
+            quantidade_em_estoque, reservado = estoque.get(material_id, (0, 0))
+            quantidade_disponivel = quantidade_em_estoque - reservado + reservas_proprias.get(material_id, 0)
+            lista_materiais.append({
+                'material_id': material_id,
+                'nome': dados['nome'],
+                'quantidade_necessaria': float(dados['quantidade']),
+                'unidade': dados['unidade'],
+                'quantidade_em_estoque': quantidade_em_estoque,
+                'quantidade_disponivel': quantidade_disponivel,
+                'suficiente': quantidade_disponivel >= dados['quantidade'],
+            })
+        return lista_materiais
 
 class OrcamentoViewSet(viewsets.ModelViewSet):
     queryset = Orcamento.objects.all()
@@ -117,31 +276,111 @@ class VendedorViewSet(viewsets.ModelViewSet):
     serializer_class = VendedorSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_update(self, serializer):
+        meta_anterior = serializer.instance.meta_mensal
+        with transaction.atomic():
+            vendedor = serializer.save()
+            if vendedor.meta_mensal != meta_anterior:
+                atualizar_meta(vendedor)
+
+    @action(detail=False, methods=['get'])
+    def ranking(self, request):
+        """
+        Ranking dos vendedores em um mês (?mes=AAAA-MM, padrão: mês atual),
+        lido dos resumos mensais. ?ordenar=vendas|comissao|meta e ?limite=N.
+        """
+        try:
+            mes = date.fromisoformat(f"{request.query_params['mes']}-01") if 'mes' in request.query_params else timezone.now()
+        except ValueError:
+            raise ValidationError({'mes': "Use o formato AAAA-MM."})
+        ordenar = ORDENACAO_RANKING.get(request.query_params.get('ordenar', 'vendas'))
+        if ordenar is None:
+            raise ValidationError({'ordenar': f"Use um de: {', '.join(ORDENACAO_RANKING)}."})
+        try:
+            limite = int(request.query_params.get('limite', 0)) or None
+        except ValueError:
+            raise ValidationError({'limite': "Informe um número inteiro."})
+        return Response(ResumoVendedorMensalSerializer(ranking(mes, ordenar, limite), many=True).data)
+
 class ComissaoViewSet(viewsets.ModelViewSet):
     queryset = Comissao.objects.all()
     serializer_class = ComissaoSerializer
     permission_classes = [IsAuthenticated]
 
+    def _valores(self, dados):
+        pedido, vendedor = dados['pedido'], dados['vendedor']
+        if pedido.valor_total is None:
+            raise ValidationError({'pedido': "O pedido não tem valor total."})
+        return {
+            'valor': valor_comissao(pedido.valor_total, vendedor.taxa_comissao),
+            'taxa': vendedor.taxa_comissao,
+            'valor_pedido': pedido.valor_total,
+            'competencia': inicio_do_mes(pedido.data_pedido),
+        }
+
     def perform_create(self, serializer):
-        # Example business logic for calculating commission
-        # This could be more complex, e.g., based on seller's commission rate, product type, etc.
-        pedido_venda = serializer.validated_data['pedido']
-        valor_comissao = pedido_venda.valor_total * 0.05  # 5% commission example
-        serializer.save(valor=valor_comissao)
+        with transaction.atomic():
+            comissao = serializer.save(**self._valores(serializer.validated_data))
+            acumular_resumos([comissao])
+
+    def perform_update(self, serializer):
+        dados = {campo: serializer.validated_data.get(campo, getattr(serializer.instance, campo)) for campo in ('pedido', 'vendedor')}
+        with transaction.atomic():
+            acumular_resumos([Comissao.objects.get(pk=serializer.instance.pk)], sinal=-1)
+            comissao = serializer.save(**self._valores(dados))
+            acumular_resumos([comissao])
+
+    def perform_destroy(self, instance):
+        estornar_comissoes([instance])
+
+    @action(detail=False, methods=['post'])
+    def calcular(self, request):
+        """
+        Gera as comissões de todos os pedidos elegíveis do período
+        {"inicio": "AAAA-MM-DD", "fim": "AAAA-MM-DD", "vendedores": [ids]} e
+        atualiza os resumos mensais. Pedidos que já têm comissão são ignorados.
+        """
+        serializer = CalculoComissoesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        comissoes = calcular_comissoes(dados['inicio'], dados['fim'], dados.get('vendedores'))
+        return Response({
+            'comissoes_criadas': len(comissoes),
+            'valor_total': sum((comissao.valor for comissao in comissoes), Decimal('0')),
+        }, status=status.HTTP_201_CREATED if comissoes else status.HTTP_200_OK)
 
 class ModeloProdutoViewSet(viewsets.ModelViewSet):
     queryset = ModeloProduto.objects.prefetch_related('consumo_materiais__material').all()
     serializer_class = ModeloProdutoSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # As ações de ficha técnica leem a ficha compilada em cache; pré-buscar
+        # o consumo aqui só repetiria as consultas.
+        if self.action in ('ficha_tecnica', 'verificar_estoque'):
+            return ModeloProduto.objects.all()
+        return super().get_queryset()
+
     @action(detail=True, methods=['get'])
     def ficha_tecnica(self, request, pk=None):
         """
         Retorna a ficha técnica (lista de materiais) para um modelo de produto específico.
         """
         modelo = self.get_object()
-        serializer = ConsumoMaterialSerializer(modelo.consumo_materiais.all(), many=True)
-        return Response(serializer.data)
+        ficha = obter_ficha(modelo.id)
+        materiais = MateriaPrima.objects.in_bulk(list(ficha.materiais))
+        campo_quantidade = ConsumoMaterialSerializer().fields['quantidade']
+
+        resultado = []
+        for linha in ficha.linhas:
+            material = materiais.get(linha['material_id'])
+            resultado.append({
+                'id': linha['id'],
+                'tamanho': linha['tamanho'],
+                'material': MateriaPrimaSerializer(material).data if material else None,
+                'quantidade': campo_quantidade.to_representation(linha['quantidade']),
+            })
+        return Response(resultado)
 
     @action(detail=True, methods=['post'])
     def verificar_estoque(self, request, pk=None):
@@ -156,34 +395,38 @@ class ModeloProdutoViewSet(viewsets.ModelViewSet):
         except (ValueError, TypeError):
             return Response({'error': 'Dados de entrada inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        necessidades_agregadas = {}
-        
+        # Ignora tamanhos com quantidade inválida
+        tamanhos = {
+            tamanho: quantidade_pecas for tamanho, quantidade_pecas in tamanhos.items()
+            if isinstance(quantidade_pecas, int) and quantidade_pecas >= 0
+        }
+
+        ficha = obter_ficha(modelo.id)
+        necessidades = {}
         for tamanho, quantidade_pecas in tamanhos.items():
-            if not isinstance(quantidade_pecas, int) or quantidade_pecas < 0:
-                continue # Ignora tamanhos com quantidade inválida
-
-            consumo_por_tamanho = modelo.consumo_materiais.filter(tamanho=tamanho).select_related('material')
-
-            for consumo in consumo_por_tamanho:
-                material = consumo.material
-                quantidade_necessaria = consumo.quantidade * quantidade_pecas
-                
-                if material.id not in necessidades_agregadas:
-                    necessidades_agregadas[material.id] = {
-                        'material_id': material.id,
-                        'nome': material.name,
-                        'tipo_produto': material.tipo_produto,
-                        'unidade_medida': 'Metro' if material.unidade_medida in ['ROLO', 'TUBO'] else material.get_unidade_medida_display(), # Show 'Metro' for ROLO and TUBO
-                        'cor': material.cor, # Add material color
-                        'quantidade_necessaria': 0,
-                        'quantidade_disponivel': material.quantity,
-                    }
-                
-                necessidades_agregadas[material.id]['quantidade_necessaria'] += quantidade_necessaria
+            for material_id, consumo in ficha.consumo.get(tamanho, ()):
+                necessidades[material_id] = necessidades.get(material_id, 0) + consumo * quantidade_pecas
+
+        disponiveis = {
+            material_id: quantidade - reservado
+            for material_id, quantidade, reservado in MateriaPrima.objects.filter(
+                id__in=list(necessidades)
+            ).values_list('id', 'quantity', 'reserved')
+        }
 
         resultado_final = []
-        for mat_id, dados in necessidades_agregadas.items():
-            dados['suficiente'] = dados['quantidade_disponivel'] >= dados['quantidade_necessaria']
-            resultado_final.append(dados)
+        for material_id, quantidade_necessaria in necessidades.items():
+            material = ficha.materiais[material_id]
+            quantidade_disponivel = disponiveis.get(material_id, 0)
+            resultado_final.append({
+                'material_id': material_id,
+                'nome': material['nome'],
+                'tipo_produto': material['tipo_produto'],
+                'unidade_medida': 'Metro' if material['unidade_medida'] in ['ROLO', 'TUBO'] else material['unidade'], # Show 'Metro' for ROLO and TUBO
+                'cor': material['cor'],
+                'quantidade_necessaria': quantidade_necessaria,
+                'quantidade_disponivel': quantidade_disponivel,
+                'suficiente': quantidade_disponivel >= quantidade_necessaria,
+            })
 
         return Response(resultado_final)
@@ -0,0 +1,139 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import HistoricoUsoMaterial, ConsumoDiario, ConsumoPedido
+
+# Valores aceitos em ?agrupar na série de consumo
+AGRUPAMENTOS_CONSUMO = {'dia': None, 'semana': TruncWeek, 'mes': TruncMonth}
+
+TAMANHO_LOTE_CONSUMO = 2000
+
+
+def _somar(modelo, campo, deltas):
+    """
+    Soma {(material_id, chave): (quantidade, registros)} às linhas de `modelo`
+    identificadas por material e `campo`. As linhas que faltam são criadas
+    zeradas e todas recebem a diferença em um único UPDATE com F(), sem ler os
+    valores atuais.
+    """
+    if not deltas:
+        return
+    modelo.objects.bulk_create(
+        [modelo(material_id=material_id, **{campo: chave}) for material_id, chave in deltas],
+        ignore_conflicts=True,
+    )
+
+    def caso(indice, coluna, saida):
+        return Case(
+            *[
+                When(material_id=material_id, **{campo: chave}, then=F(coluna) + Value(delta[indice]))
+                for (material_id, chave), delta in deltas.items()
+            ],
+            default=F(coluna),
+            output_field=saida,
+        )
+
+    guarda = Q()
+    for material_id, chave in deltas:
+        guarda |= Q(material_id=material_id, **{campo: chave})
+    modelo.objects.filter(guarda).update(
+        quantidade=caso(0, 'quantidade', DecimalField(max_digits=14, decimal_places=2)),
+        registros=caso(1, 'registros', IntegerField()),
+    )
+
+
+def acumular_consumo(historico):
+    """
+    Soma registros recém-gravados de HistoricoUsoMaterial aos acumulados por
+    material × dia e por pedido × material. Chamado por debitar_materiais()
+    na mesma transação que grava o histórico.
+    """
+    diarios, pedidos = {}, {}
+    for registro in historico:
+        for deltas, chave in (
+            (diarios, (registro.material_id, timezone.localdate(registro.data_utilizacao))),
+            (pedidos, (registro.material_id, registro.pedido_venda_id)),
+        ):
+            if chave[1] is None:
+                continue
+            quantidade, registros = deltas.get(chave, (Decimal('0'), 0))
+            deltas[chave] = (quantidade + registro.quantidade_utilizada, registros + 1)
+    _somar(ConsumoDiario, 'dia', diarios)
+    _somar(ConsumoPedido, 'pedido_venda_id', pedidos)
+
+
+def reconstruir_consumo():
+    """
+    Recalcula os acumulados a partir de todo o histórico, com duas consultas
+    agrupadas no banco. Retorna (linhas_diarias, linhas_por_pedido).
+    """
+    historico = HistoricoUsoMaterial.objects.order_by()
+    totais = {'quantidade': Sum('quantidade_utilizada'), 'registros': Count('id')}
+    diarios = historico.annotate(dia=TruncDate('data_utilizacao')).values('material_id', 'dia').annotate(**totais)
+    pedidos = historico.filter(pedido_venda__isnull=False).values('material_id', 'pedido_venda_id').annotate(**totais)
+
+    with transaction.atomic():
+        ConsumoDiario.objects.all().delete()
+        ConsumoPedido.objects.all().delete()
+        criados_diarios = ConsumoDiario.objects.bulk_create(
+            [ConsumoDiario(**linha) for linha in diarios.iterator(chunk_size=TAMANHO_LOTE_CONSUMO)],
+            batch_size=TAMANHO_LOTE_CONSUMO,
+        )
+        criados_pedidos = ConsumoPedido.objects.bulk_create(
+            [ConsumoPedido(**linha) for linha in pedidos.iterator(chunk_size=TAMANHO_LOTE_CONSUMO)],
+            batch_size=TAMANHO_LOTE_CONSUMO,
+        )
+    return len(criados_diarios), len(criados_pedidos)
+
+
+def serie_consumo(agrupar='dia', inicio=None, fim=None, material_ids=None):
+    """
+    Consumo por período (dia, semana ou mês) e material, lido dos acumulados
+    diários. Retorna uma lista de dicts ordenada por período e material.
+    """
+    linhas = ConsumoDiario.objects.all()
+    if inicio:
+        linhas = linhas.filter(dia__gte=inicio)
+    if fim:
+        linhas = linhas.filter(dia__lte=fim)
+    if material_ids is not None:
+        linhas = linhas.filter(material_id__in=list(material_ids))
+
+    truncar = AGRUPAMENTOS_CONSUMO[agrupar]
+    linhas = linhas.annotate(periodo=truncar('dia') if truncar else F('dia'))
+    resultado = linhas.values('periodo', 'material_id', 'material__name', 'material__unidade_medida').annotate(
+        quantidade=Sum('quantidade'), registros=Sum('registros'),
+    ).order_by('periodo', 'material_id')
+    return [
+        {
+            'periodo': linha['periodo'],
+            'material_id': linha['material_id'],
+            'nome': linha['material__name'],
+            'unidade_medida': linha['material__unidade_medida'],
+            'quantidade': linha['quantidade'],
+            'registros': linha['registros'],
+        }
+        for linha in resultado
+    ]
+
+
+def consumo_por_pedido(pedido_ids):
+    """Consumo acumulado de cada material pelos pedidos informados."""
+    linhas = ConsumoPedido.objects.filter(pedido_venda_id__in=list(pedido_ids)).values(
+        'pedido_venda_id', 'material_id', 'material__name', 'material__unidade_medida', 'quantidade', 'registros',
+    ).order_by('pedido_venda_id', 'material_id')
+    return [
+        {
+            'pedido_id': linha['pedido_venda_id'],
+            'material_id': linha['material_id'],
+            'nome': linha['material__name'],
+            'unidade_medida': linha['material__unidade_medida'],
+            'quantidade': linha['quantidade'],
+            'registros': linha['registros'],
+        }
+        for linha in linhas
+    ]
@@ -0,0 +1,31 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.estoque.previsao import (
+    CICLO_REPOSICAO_DIAS, FATOR_SERVICO, JANELA_PREVISAO_DIAS, PRAZO_REPOSICAO_DIAS, calcular_previsoes,
+)
+
+
+def _fator(valor):
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        raise CommandError(f"Fator inválido: {valor}.")
+
+
+class Command(BaseCommand):
+    help = "Recalcula a demanda média, a cobertura e o ponto de pedido de todas as matérias-primas (execução noturna)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--janela', type=int, default=JANELA_PREVISAO_DIAS, help="Dias de consumo considerados.")
+        parser.add_argument('--prazo', type=int, default=PRAZO_REPOSICAO_DIAS, help="Prazo de reposição em dias.")
+        parser.add_argument('--ciclo', type=int, default=CICLO_REPOSICAO_DIAS, help="Dias de demanda cobertos por uma compra.")
+        parser.add_argument('--fator', type=_fator, default=FATOR_SERVICO, help="Fator z do estoque de segurança.")
+
+    def handle(self, *args, **options):
+        if min(options['janela'], options['prazo'], options['ciclo']) < 1:
+            raise CommandError("--janela, --prazo e --ciclo devem ser maiores que zero.")
+
+        total = calcular_previsoes(options['janela'], options['prazo'], options['ciclo'], options['fator'])
+        self.stdout.write(self.style.SUCCESS(f"Previsões recalculadas para {total} material(is)."))
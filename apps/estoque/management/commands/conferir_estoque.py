@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.estoque.razao import conferir_projecao
+
+
+class Command(BaseCommand):
+    help = "Confere se a quantidade de cada matéria-prima é igual ao saldo do razão de estoque."
+
+    def handle(self, *args, **options):
+        divergencias = conferir_projecao()
+        for divergencia in divergencias:
+            self.stdout.write(self.style.ERROR(
+                f"{divergencia['nome']} (id {divergencia['material_id']}): quantity {divergencia['quantity']}, "
+                f"razão {divergencia['saldo_razao']}."
+            ))
+        if divergencias:
+            raise CommandError(f"{len(divergencias)} material(is) divergente(s) do razão.")
+        self.stdout.write(self.style.SUCCESS("Quantidades conferem com o razão."))
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.estoque.razao import MARGEM_SNAPSHOT, gerar_snapshots
+
+
+def _instante(valor):
+    try:
+        instante = datetime.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Instante inválido: {valor} (use AAAA-MM-DD ou AAAA-MM-DDTHH:MM).")
+    return timezone.make_aware(instante) if timezone.is_naive(instante) else instante
+
+
+class Command(BaseCommand):
+    help = "Grava o saldo do razão de cada matéria-prima em um instante (snapshot), para consultas de saldo por data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corte', type=_instante, help="Instante do snapshot (padrão: agora menos a margem de segurança).")
+
+    def handle(self, *args, **options):
+        corte = options['corte'] or timezone.now() - MARGEM_SNAPSHOT
+        try:
+            total = gerar_snapshots(corte)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"{total} snapshot(s) gravado(s) em {corte:%d/%m/%Y %H:%M}."))
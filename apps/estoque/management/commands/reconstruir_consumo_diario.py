@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.estoque.consumo import reconstruir_consumo
+
+
+class Command(BaseCommand):
+    help = "Recalcula os acumulados de consumo por dia e por pedido a partir de todo o histórico de uso de materiais."
+
+    def handle(self, *args, **options):
+        diarios, pedidos = reconstruir_consumo()
+        self.stdout.write(self.style.SUCCESS(
+            f"{diarios} linha(s) de consumo diário e {pedidos} de consumo por pedido gravadas."
+        ))
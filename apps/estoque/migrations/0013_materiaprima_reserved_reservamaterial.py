@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0022_pedidovenda_materiais_necessarios'),
+        ('estoque', '0012_alter_materiaprima_tipo_produto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materiaprima',
+            name='reserved',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Soma das reservas de pedidos aprovados ainda não consumidas (mantida por apps.estoque.reservas)', max_digits=10, verbose_name='Quantidade reservada'),
+        ),
+        migrations.CreateModel(
+            name='ReservaMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='estoque.materiaprima')),
+                ('pedido_venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_materiais', to='comercial.pedidovenda')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Material',
+                'verbose_name_plural': 'Reservas de Materiais',
+                'ordering': ['-created_at'],
+                'unique_together': {('material', 'pedido_venda')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0013_materiaprima_reserved_reservamaterial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequisicaoConsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chave', models.CharField(max_length=255, unique=True, verbose_name='Chave de idempotência')),
+                ('resposta', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'verbose_name': 'Requisição de Consumo',
+                'verbose_name_plural': 'Requisições de Consumo',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
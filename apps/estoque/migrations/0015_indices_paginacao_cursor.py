@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0023_indices_paginacao_cursor'),
+        ('estoque', '0014_requisicaoconsumo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicousomaterial',
+            index=models.Index(fields=['-data_utilizacao', '-id'], name='estoque_his_data_ut_cd0147_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def abrir_razao(apps, schema_editor):
+    """Lança o saldo atual de cada material como SALDO_INICIAL do razão."""
+    MateriaPrima = apps.get_model('estoque', 'MateriaPrima')
+    MovimentoEstoque = apps.get_model('estoque', 'MovimentoEstoque')
+    agora = django.utils.timezone.now()
+    MovimentoEstoque.objects.bulk_create(
+        [
+            MovimentoEstoque(material_id=material_id, tipo='SALDO_INICIAL', quantidade=quantidade, data=agora)
+            for material_id, quantidade in MateriaPrima.objects.exclude(quantity=0).values_list('id', 'quantity')
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0026_necessidade_material'),
+        ('estoque', '0015_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('SALDO_INICIAL', 'Saldo inicial'), ('ENTRADA', 'Entrada'), ('CONSUMO', 'Consumo'), ('AJUSTE', 'Ajuste')], max_length=20)),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+                ('observacao', models.CharField(blank=True, default='', max_length=255)),
+                ('historico', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimento', to='estoque.historicousomaterial')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos', to='estoque.materiaprima')),
+                ('pedido_venda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos_estoque', to='comercial.pedidovenda')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Estoque',
+                'verbose_name_plural': 'Movimentos de Estoque',
+                'ordering': ['-data', '-id'],
+                'indexes': [models.Index(fields=['material', 'data'], name='estoque_mov_materia_b55594_idx'), models.Index(fields=['-data', '-id'], name='estoque_mov_data_5c985a_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField()),
+                ('quantidade', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='estoque.materiaprima')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Estoque',
+                'verbose_name_plural': 'Snapshots de Estoque',
+                'ordering': ['-data'],
+                'unique_together': {('material', 'data')},
+            },
+        ),
+        migrations.RunPython(abrir_razao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def preencher_consumo(apps, schema_editor):
+    """Soma o histórico de uso existente nos acumulados diários e por pedido."""
+    HistoricoUsoMaterial = apps.get_model('estoque', 'HistoricoUsoMaterial')
+    ConsumoDiario = apps.get_model('estoque', 'ConsumoDiario')
+    ConsumoPedido = apps.get_model('estoque', 'ConsumoPedido')
+
+    historico = HistoricoUsoMaterial.objects.order_by()
+    totais = {'quantidade': Sum('quantidade_utilizada'), 'registros': Count('id')}
+    ConsumoDiario.objects.bulk_create(
+        [
+            ConsumoDiario(**linha)
+            for linha in historico.annotate(dia=TruncDate('data_utilizacao')).values('material_id', 'dia').annotate(**totais)
+        ],
+        batch_size=2000,
+    )
+    ConsumoPedido.objects.bulk_create(
+        [
+            ConsumoPedido(**linha)
+            for linha in historico.filter(pedido_venda__isnull=False).values('material_id', 'pedido_venda_id').annotate(**totais)
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0026_necessidade_material'),
+        ('estoque', '0016_razao_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('registros', models.PositiveIntegerField(default=0)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumo_diario', to='estoque.materiaprima')),
+            ],
+            options={
+                'verbose_name': 'Consumo Diário',
+                'verbose_name_plural': 'Consumos Diários',
+                'ordering': ['-dia', 'material'],
+                'indexes': [models.Index(fields=['dia', 'material'], name='estoque_con_dia_7e263f_idx')],
+                'unique_together': {('material', 'dia')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsumoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('registros', models.PositiveIntegerField(default=0)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumo_pedidos', to='estoque.materiaprima')),
+                ('pedido_venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumo_materiais', to='comercial.pedidovenda')),
+            ],
+            options={
+                'verbose_name': 'Consumo por Pedido',
+                'verbose_name_plural': 'Consumos por Pedido',
+                'ordering': ['pedido_venda', 'material'],
+                'unique_together': {('pedido_venda', 'material')},
+            },
+        ),
+        migrations.RunPython(preencher_consumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0017_consumo_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('janela_dias', models.PositiveIntegerField()),
+                ('demanda_media_diaria', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('desvio_padrao_diario', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('dias_cobertura', models.DecimalField(blank=True, decimal_places=1, help_text='Dias até o disponível acabar na demanda média (vazio sem consumo na janela)', max_digits=10, null=True)),
+                ('estoque_seguranca', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ponto_pedido', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantidade_sugerida', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('calculado_em', models.DateTimeField()),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='previsao', to='estoque.materiaprima')),
+            ],
+            options={
+                'verbose_name': 'Previsão de Material',
+                'verbose_name_plural': 'Previsões de Materiais',
+                'ordering': ['dias_cobertura', 'material'],
+                'indexes': [models.Index(fields=['dias_cobertura'], name='estoque_pre_dias_co_5bddc1_idx')],
+            },
+        ),
+    ]
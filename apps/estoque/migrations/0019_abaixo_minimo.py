@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:33
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def marcar_abaixo_minimo(apps, schema_editor):
+    """Marca os materiais que já estão abaixo do mínimo."""
+    MateriaPrima = apps.get_model('estoque', 'MateriaPrima')
+    MateriaPrima.objects.filter(quantity__lt=F('minimum_stock')).update(abaixo_minimo=True, abaixo_minimo_desde=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0018_previsao_material'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materiaprima',
+            name='abaixo_minimo',
+            field=models.BooleanField(default=False, editable=False, help_text='quantity < minimum_stock (mantido por save() e por MateriaPrimaQuerySet.update)'),
+        ),
+        migrations.AddField(
+            model_name='materiaprima',
+            name='abaixo_minimo_desde',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Quando o material cruzou o mínimo pela última vez; vazio quando está acima dele', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='materiaprima',
+            index=models.Index(fields=['abaixo_minimo', '-abaixo_minimo_desde', '-id'], name='estoque_mat_abaixo__9cce0a_idx'),
+        ),
+        migrations.RunPython(marcar_abaixo_minimo, migrations.RunPython.noop),
+    ]
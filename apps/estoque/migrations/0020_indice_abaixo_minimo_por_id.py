@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0019_abaixo_minimo'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='materiaprima',
+            name='estoque_mat_abaixo__9cce0a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='materiaprima',
+            index=models.Index(fields=['abaixo_minimo', '-id'], name='estoque_mat_abaixo__25a4b7_idx'),
+        ),
+    ]
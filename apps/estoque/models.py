@@ -1,4 +1,9 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import LessThan
+from django.utils import timezone
 from apps.pcp.models import OrdemProducao
 
 class BaseModel(models.Model):
@@ -8,6 +13,66 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+def estado_minimo(quantidade, minimo, agora=None):
+    """
+    Expressões de abaixo_minimo e abaixo_minimo_desde para um UPDATE que grava
+    `quantidade` e `minimo` (valores ou expressões). No SET, F() lê os valores
+    anteriores da linha, então abaixo_minimo_desde só recebe `agora` quando o
+    material cruza o mínimo e mantém a data enquanto continua abaixo.
+    """
+    quantidade = quantidade if hasattr(quantidade, 'resolve_expression') else Value(quantidade)
+    minimo = minimo if hasattr(minimo, 'resolve_expression') else Value(minimo)
+    abaixo = LessThan(quantidade, minimo)
+    return {
+        'abaixo_minimo': Case(When(abaixo, then=Value(True)), default=Value(False)),
+        'abaixo_minimo_desde': Case(
+            When(abaixo, then=Case(
+                When(abaixo_minimo=False, then=Value(agora or timezone.now())),
+                default=F('abaixo_minimo_desde'),
+            )),
+            default=Value(None),
+            output_field=models.DateTimeField(),
+        ),
+    }
+
+
+class MateriaPrimaQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # quantity é a projeção do razão de estoque: um UPDATE direto (ou um
+        # bulk_update, que passa por aqui) não lançaria o movimento.
+        if 'quantity' in kwargs:
+            raise ValueError(
+                "quantity não pode ser alterada por update() ou bulk_update(): use save(), "
+                "razao.registrar_entrada() ou movimentacao.debitar_materiais(), que lançam o movimento no razão."
+            )
+        return self._gravar(**kwargs)
+
+    def atualizar_saldo(self, quantity, **kwargs):
+        """
+        UPDATE de quantity para os serviços que lançam o movimento no razão na
+        mesma transação (razao.registrar_entrada e movimentacao.debitar_materiais).
+        """
+        return self._gravar(quantity=quantity, **kwargs)
+
+    def _gravar(self, **kwargs):
+        # Todo UPDATE de quantity ou minimum_stock (F(), Case, bulk_update)
+        # recalcula o estado de estoque abaixo do mínimo no mesmo comando.
+        if 'quantity' in kwargs or 'minimum_stock' in kwargs:
+            kwargs.update(estado_minimo(
+                kwargs.get('quantity', F('quantity')), kwargs.get('minimum_stock', F('minimum_stock'))
+            ))
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create não chama save(): o estado abaixo do mínimo é calculado aqui
+        objs = list(objs)
+        agora = timezone.now()
+        for material in objs:
+            material.abaixo_minimo = Decimal(material.quantity) < Decimal(material.minimum_stock)
+            material.abaixo_minimo_desde = agora if material.abaixo_minimo else None
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class MateriaPrima(BaseModel):
     UNIDADE_MEDIDA_CHOICES = [
         ('METRO', 'Metro'),
@@ -25,6 +90,10 @@ class MateriaPrima(BaseModel):
     cor = models.CharField(max_length=100, blank=True, default='')
     unidade_medida = models.CharField(max_length=20, choices=UNIDADE_MEDIDA_CHOICES, default='UNIDADE')
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Quantidade")
+    reserved = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, verbose_name="Quantidade reservada",
+        help_text="Soma das reservas de pedidos aprovados ainda não consumidas (mantida por apps.estoque.reservas)"
+    )
     
     LOCAL_CHOICES = [
         ('ALMOXARIFADO', 'Almoxarifado'),
@@ -33,6 +102,14 @@ class MateriaPrima(BaseModel):
     ]
     local = models.CharField(max_length=255, choices=LOCAL_CHOICES, default='ALMOXARIFADO')
     minimum_stock = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    abaixo_minimo = models.BooleanField(
+        default=False, editable=False,
+        help_text="quantity < minimum_stock (mantido por save() e por MateriaPrimaQuerySet.update)"
+    )
+    abaixo_minimo_desde = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        help_text="Quando o material cruzou o mínimo pela última vez; vazio quando está acima dele"
+    )
 
     # Campos específicos para Rolo
     quantidade_rolos = models.IntegerField(
@@ -66,19 +143,97 @@ class MateriaPrima(BaseModel):
         help_text="Metragem por tubo (preenchido apenas para unidade 'Tubo')"
     )
  
+    CAMPOS_ATUALIZADOS_ATOMICAMENTE = ('reserved',)
+    CAMPOS_ESTADO_MINIMO = ('abaixo_minimo', 'abaixo_minimo_desde')
+    # Unidade -> (quantidade de embalagens, conteúdo por embalagem)
+    CAMPOS_EMBALAGEM = {
+        'ROLO': ('quantidade_rolos', 'metragem_por_rolo'),
+        'CAIXA': ('quantidade_caixas', 'quantidade_por_caixa'),
+        'TUBO': ('quantidade_tubos', 'metros_por_tubo'),
+    }
+
+    objects = MateriaPrimaQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Matéria Prima"
         verbose_name_plural = "Matérias Primas"
         ordering = ['name']
+        indexes = [
+            # Lista e feed de materiais abaixo do mínimo
+            models.Index(fields=['abaixo_minimo', '-id']),
+        ]
+
+    @property
+    def available(self):
+        """
+        Quantidade disponível para novos pedidos: estoque menos reservas.
+        """
+        return self.quantity - self.reserved
 
     def save(self, *args, **kwargs):
-        if self.unidade_medida == 'ROLO' and self.quantidade_rolos is not None and self.metragem_por_rolo is not None:
-            self.quantity = self.quantidade_rolos * self.metragem_por_rolo
-        elif self.unidade_medida == 'CAIXA' and self.quantidade_caixas is not None and self.quantidade_por_caixa is not None:
-            self.quantity = self.quantidade_caixas * self.quantidade_por_caixa
-        elif self.unidade_medida == 'TUBO' and self.quantidade_tubos is not None and self.metros_por_tubo is not None:
-            self.quantity = self.quantidade_tubos * self.metros_por_tubo
-        super().save(*args, **kwargs)
+        # O contador de reservas só é alterado por updates atômicos; um save()
+        # de uma instância carregada antes não pode sobrescrevê-lo.
+        atualizacao = not self._state.adding and not kwargs.get('force_insert')
+        if atualizacao and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.CAMPOS_ATUALIZADOS_ATOMICAMENTE
+            ]
+
+        # Toda mudança de quantity passa pelo razão de estoque (MovimentoEstoque)
+        from .razao import registrar_ajuste
+        with transaction.atomic():
+            anterior = None
+            if atualizacao:
+                anterior = MateriaPrima.objects.select_for_update().filter(pk=self.pk).values(
+                    'quantity', 'unidade_medida', *self.CAMPOS_ESTADO_MINIMO,
+                    *{campo for campos in self.CAMPOS_EMBALAGEM.values() for campo in campos},
+                ).first()
+
+            campos = kwargs.get('update_fields')
+            if self._recalcular_quantidade(anterior) and campos is not None:
+                campos = [*campos, 'quantity']
+            grava_quantidade = campos is None or 'quantity' in campos
+            grava_minimo = grava_quantidade or 'minimum_stock' in campos
+            if campos is not None and grava_minimo:
+                kwargs['update_fields'] = list(dict.fromkeys([*campos, *self.CAMPOS_ESTADO_MINIMO]))
+
+            if grava_minimo:
+                self._atualizar_estado_minimo(anterior, grava_quantidade)
+            criado = self._state.adding
+            super().save(*args, **kwargs)
+            if criado:
+                registrar_ajuste(self, Decimal('0'), tipo=MovimentoEstoque.TIPO_SALDO_INICIAL)
+            elif anterior is not None and grava_quantidade:
+                registrar_ajuste(self, anterior['quantity'])
+
+    def _recalcular_quantidade(self, anterior):
+        """
+        Recalcula quantity a partir das embalagens (rolos, caixas ou tubos)
+        apenas na criação ou quando a unidade ou um campo de embalagem mudou.
+        As baixas só alteram quantity; recalcular a cada save() desfaria os
+        consumos registrados desde a última contagem das embalagens.
+        """
+        campos = self.CAMPOS_EMBALAGEM.get(self.unidade_medida)
+        if not campos or any(getattr(self, campo) is None for campo in campos):
+            return False
+        if anterior is not None and anterior['unidade_medida'] == self.unidade_medida and all(
+            anterior[campo] == getattr(self, campo) for campo in campos
+        ):
+            return False
+        embalagens, por_embalagem = (getattr(self, campo) for campo in campos)
+        self.quantity = embalagens * por_embalagem
+        return True
+
+    def _atualizar_estado_minimo(self, anterior, grava_quantidade):
+        quantidade = self.quantity if grava_quantidade or anterior is None else anterior['quantity']
+        self.abaixo_minimo = Decimal(quantidade) < Decimal(self.minimum_stock)
+        if not self.abaixo_minimo:
+            self.abaixo_minimo_desde = None
+        elif anterior is not None and anterior['abaixo_minimo']:
+            self.abaixo_minimo_desde = anterior['abaixo_minimo_desde']
+        else:
+            self.abaixo_minimo_desde = timezone.now()
 
     def __str__(self):
         if self.unidade_medida == 'ROLO':
@@ -132,6 +287,176 @@ class HistoricoUsoMaterial(BaseModel):
         verbose_name = "Histórico de Uso de Material"
         verbose_name_plural = "Históricos de Uso de Materiais"
         ordering = ['-data_utilizacao']
+        indexes = [
+            # Ordenação da paginação por cursor do histórico
+            models.Index(fields=['-data_utilizacao', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.material.name} - {self.quantidade_utilizada} {self.material.get_unidade_medida_display()} em {self.data_utilizacao.strftime('%d/%m/%Y %H:%M')}"
+
+
+class ReservaMaterial(BaseModel):
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='reservas')
+    pedido_venda = models.ForeignKey('comercial.PedidoVenda', on_delete=models.CASCADE, related_name='reservas_materiais')
+    quantidade = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Reserva de Material"
+        verbose_name_plural = "Reservas de Materiais"
+        unique_together = ('material', 'pedido_venda')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Reserva de {self.quantidade} de {self.material.name} para o pedido {self.pedido_venda_id}"
+
+
+class RequisicaoConsumo(BaseModel):
+    """
+    Registro de uma requisição de consumo em lote identificada por uma chave
+    de idempotência. Uma nova tentativa com a mesma chave devolve a resposta
+    gravada em vez de baixar o estoque de novo.
+    """
+    chave = models.CharField(max_length=255, unique=True, verbose_name="Chave de idempotência")
+    resposta = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Requisição de Consumo"
+        verbose_name_plural = "Requisições de Consumo"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Requisição de consumo {self.chave}"
+
+
+class MovimentoEstoque(models.Model):
+    """
+    Razão de estoque: um lançamento imutável por movimentação de matéria-prima,
+    com a quantidade com sinal (entradas positivas, saídas negativas).
+    MateriaPrima.quantity é a projeção da soma dos lançamentos do material.
+    """
+    TIPO_SALDO_INICIAL = 'SALDO_INICIAL'
+    TIPO_ENTRADA = 'ENTRADA'
+    TIPO_CONSUMO = 'CONSUMO'
+    TIPO_AJUSTE = 'AJUSTE'
+    TIPO_CHOICES = [
+        (TIPO_SALDO_INICIAL, 'Saldo inicial'),
+        (TIPO_ENTRADA, 'Entrada'),
+        (TIPO_CONSUMO, 'Consumo'),
+        (TIPO_AJUSTE, 'Ajuste'),
+    ]
+
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='movimentos')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    quantidade = models.DecimalField(max_digits=12, decimal_places=2)
+    data = models.DateTimeField(default=timezone.now)
+    pedido_venda = models.ForeignKey('comercial.PedidoVenda', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos_estoque')
+    historico = models.OneToOneField(HistoricoUsoMaterial, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimento')
+    observacao = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        verbose_name = "Movimento de Estoque"
+        verbose_name_plural = "Movimentos de Estoque"
+        ordering = ['-data', '-id']
+        indexes = [
+            # Saldo em uma data: um snapshot mais a cauda de movimentos do material
+            models.Index(fields=['material', 'data']),
+            # Paginação por cursor do razão
+            models.Index(fields=['-data', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} de {self.quantidade} em {self.material_id} ({self.data:%d/%m/%Y %H:%M})"
+
+
+class SnapshotEstoque(models.Model):
+    """
+    Saldo de um material em um instante, igual à soma dos movimentos com
+    data até esse instante. Consultas de saldo partem do snapshot mais recente
+    e somam só os movimentos posteriores a ele.
+    """
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='snapshots')
+    data = models.DateTimeField()
+    quantidade = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Snapshot de Estoque"
+        verbose_name_plural = "Snapshots de Estoque"
+        ordering = ['-data']
+        unique_together = ('material', 'data')
+
+    def __str__(self):
+        return f"{self.material_id} em {self.data:%d/%m/%Y %H:%M}: {self.quantidade}"
+
+
+class ConsumoDiario(models.Model):
+    """
+    Consumo de um material em um dia (fuso local), somado a partir de
+    HistoricoUsoMaterial à medida que o histórico é gravado. As séries de
+    consumo leem esta tabela em vez do histórico bruto.
+    """
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='consumo_diario')
+    dia = models.DateField()
+    quantidade = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    registros = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Consumo Diário"
+        verbose_name_plural = "Consumos Diários"
+        ordering = ['-dia', 'material']
+        unique_together = ('material', 'dia')
+        indexes = [
+            # Séries de todos os materiais em um intervalo de dias
+            models.Index(fields=['dia', 'material']),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} em {self.dia:%d/%m/%Y}: {self.quantidade}"
+
+
+class ConsumoPedido(models.Model):
+    """Consumo acumulado de um material por um pedido, mantido junto com ConsumoDiario."""
+    pedido_venda = models.ForeignKey('comercial.PedidoVenda', on_delete=models.CASCADE, related_name='consumo_materiais')
+    material = models.ForeignKey(MateriaPrima, on_delete=models.CASCADE, related_name='consumo_pedidos')
+    quantidade = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    registros = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Consumo por Pedido"
+        verbose_name_plural = "Consumos por Pedido"
+        ordering = ['pedido_venda', 'material']
+        unique_together = ('pedido_venda', 'material')
+
+    def __str__(self):
+        return f"Pedido {self.pedido_venda_id}, material {self.material_id}: {self.quantidade}"
+
+
+class PrevisaoMaterial(models.Model):
+    """
+    Previsão de consumo e ponto de pedido de um material, recalculada em lote
+    por apps.estoque.previsao a partir dos acumulados de ConsumoDiario.
+    """
+    material = models.OneToOneField(MateriaPrima, on_delete=models.CASCADE, related_name='previsao')
+    janela_dias = models.PositiveIntegerField()
+    demanda_media_diaria = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    desvio_padrao_diario = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    dias_cobertura = models.DecimalField(
+        max_digits=10, decimal_places=1, null=True, blank=True,
+        help_text="Dias até o disponível acabar na demanda média (vazio sem consumo na janela)"
+    )
+    estoque_seguranca = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ponto_pedido = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantidade_sugerida = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Previsão de Material"
+        verbose_name_plural = "Previsões de Materiais"
+        ordering = ['dias_cobertura', 'material']
+        indexes = [
+            models.Index(fields=['dias_cobertura']),
+        ]
+
+    def __str__(self):
+        return f"Previsão de {self.material_id}: ponto de pedido {self.ponto_pedido}"
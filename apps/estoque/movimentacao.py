@@ -0,0 +1,162 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Q, When
+
+from .models import MateriaPrima, HistoricoUsoMaterial, MovimentoEstoque, RequisicaoConsumo
+from .consumo import acumular_consumo
+from .reservas import invalidar_disponibilidade, quantizar
+
+
+class EstoqueInsuficiente(Exception):
+    """
+    Levantada quando um ou mais materiais não têm saldo para a baixa. `faltas`
+    lista, por material, a quantidade necessária e a disponível no momento.
+    """
+
+    def __init__(self, faltas):
+        self.faltas = faltas
+        nomes = ', '.join(falta['nome'] or str(falta['material_id']) for falta in faltas)
+        super().__init__(f"Estoque insuficiente para: {nomes}")
+
+
+class _BaixaConcorrente(Exception):
+    """Uma baixa concorrente consumiu o saldo entre a conferência e o débito."""
+
+
+def _totalizar(linhas):
+    totais = {}
+    for material_id, quantidade, _ in linhas:
+        totais[material_id] = totais.get(material_id, Decimal('0')) + quantidade
+    return totais
+
+
+def debitar_materiais(linhas):
+    """
+    Baixa do estoque as linhas (material_id, quantidade, pedido_venda_id) e
+    registra o histórico de uso, os movimentos CONSUMO do razão e os acumulados
+    de consumo, tudo ou nada.
+
+    A suficiência de todos os materiais é conferida com uma única consulta
+    travada e o débito é um único UPDATE condicional (quantity >= débito para
+    cada linha). Se o número de linhas alteradas não bater, outra baixa
+    concorrente consumiu o saldo e a transação inteira é desfeita.
+    """
+    linhas = [
+        (material_id, quantizar(quantidade), pedido_venda_id)
+        for material_id, quantidade, pedido_venda_id in linhas
+        if quantidade > 0
+    ]
+    totais = _totalizar(linhas)
+    if not totais:
+        return []
+
+    try:
+        with transaction.atomic():
+            historico = _debitar(linhas, totais)
+    except _BaixaConcorrente:
+        # Desfeita a transação, os saldos lidos agora são os reais
+        raise EstoqueInsuficiente(_faltas(totais, MateriaPrima.objects.filter(id__in=list(totais))))
+    invalidar_disponibilidade()
+    return historico
+
+
+def _faltas(totais, materiais):
+    estoque = {material_id: (nome, quantidade) for material_id, nome, quantidade in materiais.values_list('id', 'name', 'quantity')}
+    return [
+        {
+            'material_id': material_id,
+            'nome': estoque.get(material_id, (None, None))[0],
+            'quantidade_necessaria': total,
+            'quantidade_disponivel': estoque.get(material_id, (None, Decimal('0')))[1],
+        }
+        for material_id, total in totais.items()
+        if material_id not in estoque or estoque[material_id][1] < total
+    ]
+
+
+def _debitar(linhas, totais):
+    faltas = _faltas(totais, MateriaPrima.objects.select_for_update().filter(id__in=list(totais)))
+    if faltas:
+        raise EstoqueInsuficiente(faltas)
+
+    guarda = Q()
+    for material_id, total in totais.items():
+        guarda |= Q(id=material_id, quantity__gte=total)
+    alterados = MateriaPrima.objects.filter(guarda).atualizar_saldo(
+        Case(
+            *[When(id=material_id, then=F('quantity') - total) for material_id, total in totais.items()],
+            default=F('quantity'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+    if alterados != len(totais):
+        raise _BaixaConcorrente()
+
+    historico = HistoricoUsoMaterial.objects.bulk_create([
+        HistoricoUsoMaterial(material_id=material_id, quantidade_utilizada=quantidade, pedido_venda_id=pedido_venda_id)
+        for material_id, quantidade, pedido_venda_id in linhas
+    ])
+    MovimentoEstoque.objects.bulk_create([
+        MovimentoEstoque(
+            material_id=registro.material_id,
+            tipo=MovimentoEstoque.TIPO_CONSUMO,
+            quantidade=-registro.quantidade_utilizada,
+            data=registro.data_utilizacao,
+            pedido_venda_id=registro.pedido_venda_id,
+            historico=registro,
+        )
+        for registro in historico
+    ])
+    acumular_consumo(historico)
+    return historico
+
+
+def consumir_lote(linhas, chave=None):
+    """
+    Registra o consumo de várias linhas (material_id, quantidade,
+    pedido_venda_id) em uma única transação, via debitar_materiais().
+
+    Com `chave`, a requisição é idempotente: a chave é gravada na mesma
+    transação do débito e uma nova tentativa recebe a resposta original, sem
+    baixar o estoque de novo. Se o débito falhar, a chave também é desfeita e
+    a requisição pode ser repetida. Retorna (resposta, repetida).
+    """
+    if chave:
+        existente = RequisicaoConsumo.objects.filter(chave=chave).values_list('resposta', flat=True).first()
+        if existente is not None:
+            return existente, True
+
+    with transaction.atomic():
+        requisicao = None
+        if chave:
+            try:
+                with transaction.atomic():
+                    requisicao = RequisicaoConsumo.objects.create(chave=chave)
+            except IntegrityError:
+                # Outra tentativa com a mesma chave terminou primeiro
+                return RequisicaoConsumo.objects.get(chave=chave).resposta, True
+
+        historico = debitar_materiais(linhas)
+        saldos = dict(MateriaPrima.objects.filter(
+            id__in={registro.material_id for registro in historico}
+        ).values_list('id', 'quantity'))
+        resposta = {
+            'historico': [
+                {
+                    'id': registro.id,
+                    'material_id': registro.material_id,
+                    'pedido_id': registro.pedido_venda_id,
+                    'quantidade_utilizada': str(registro.quantidade_utilizada),
+                }
+                for registro in historico
+            ],
+            'saldos': [
+                {'material_id': material_id, 'quantity': str(quantidade)}
+                for material_id, quantidade in saldos.items()
+            ],
+        }
+        if requisicao is not None:
+            requisicao.resposta = resposta
+            requisicao.save(update_fields=['resposta', 'updated_at'])
+    return resposta, False
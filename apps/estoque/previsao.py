@@ -0,0 +1,114 @@
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, Round, Sqrt
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
+from django.utils import timezone
+
+from .models import MateriaPrima, PrevisaoMaterial
+
+# Parâmetros padrão do cálculo
+JANELA_PREVISAO_DIAS = 30
+PRAZO_REPOSICAO_DIAS = 7
+CICLO_REPOSICAO_DIAS = 30
+# Fator z do estoque de segurança; 1,65 cobre cerca de 95% da variação diária
+FATOR_SERVICO = Decimal('1.65')
+# Teto de dias_cobertura: com consumo ínfimo a divisão passaria do tamanho do
+# campo (max_digits=10), e acima disso a cobertura não muda a decisão de compra
+DIAS_COBERTURA_MAXIMO = 36500
+
+TAMANHO_LOTE_PREVISAO = 1000
+
+REAL = FloatField()
+
+
+def _decimal(expressao, casas, digitos=14):
+    """Arredonda `expressao` no banco e a devolve como Decimal com `casas` casas."""
+    return Cast(Round(expressao, casas), DecimalField(max_digits=digitos, decimal_places=casas))
+
+
+def _previsoes_na_janela(inicio, fim, janela, prazo, ciclo, fator):
+    """
+    Previsão de todos os materiais em uma única consulta agrupada sobre
+    ConsumoDiario entre `inicio` e `fim`, com a aritmética toda no banco:
+    demanda média e desvio padrão diários na janela (dias sem consumo contam
+    como zero), estoque de segurança (fator × desvio × √prazo), ponto de
+    pedido (demanda no prazo + segurança), quantidade sugerida para voltar a
+    ponto de pedido + um ciclo de demanda quando o disponível está no ponto de
+    pedido ou abaixo dele, e dias de cobertura do disponível (vazio sem
+    consumo, limitado a DIAS_COBERTURA_MAXIMO).
+    """
+    na_janela = Q(consumo_diario__dia__gte=inicio, consumo_diario__dia__lte=fim)
+    quantidade = Cast('consumo_diario__quantidade', REAL)
+    total = Coalesce(Sum(quantidade, filter=na_janela), Value(0.0))
+    quadrados = Coalesce(Sum(quantidade * quantidade, filter=na_janela), Value(0.0))
+
+    media = total / Value(float(janela))
+    desvio = Sqrt(Greatest(quadrados / Value(float(janela)) - media * media, Value(0.0)))
+    seguranca = Round(Value(float(fator) * math.sqrt(prazo)) * desvio, 2)
+    ponto_pedido = Round(media * Value(float(prazo)) + seguranca, 2)
+    disponivel = Cast(F('quantity') - F('reserved'), REAL)
+    com_consumo = GreaterThan(media, Value(0.0))
+
+    return MateriaPrima.objects.order_by().annotate(
+        previsao_demanda=_decimal(media, 4),
+        previsao_desvio=_decimal(desvio, 4),
+        previsao_cobertura=Case(
+            When(com_consumo, then=_decimal(
+                Least(Greatest(disponivel, Value(0.0)) / media, Value(float(DIAS_COBERTURA_MAXIMO))), 1, digitos=10,
+            )),
+            default=Value(None),
+            output_field=DecimalField(max_digits=10, decimal_places=1),
+        ),
+        previsao_seguranca=_decimal(seguranca, 2),
+        previsao_ponto=_decimal(ponto_pedido, 2),
+        previsao_sugerida=Case(
+            When(com_consumo & LessThanOrEqual(disponivel, ponto_pedido), then=_decimal(
+                ponto_pedido + media * Value(float(ciclo)) - disponivel, 2,
+            )),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    ).values_list(
+        'id', 'previsao_demanda', 'previsao_desvio', 'previsao_cobertura',
+        'previsao_seguranca', 'previsao_ponto', 'previsao_sugerida',
+    )
+
+
+def calcular_previsoes(
+    janela=JANELA_PREVISAO_DIAS, prazo=PRAZO_REPOSICAO_DIAS, ciclo=CICLO_REPOSICAO_DIAS, fator=FATOR_SERVICO, hoje=None,
+):
+    """
+    Recalcula a previsão de todos os materiais com os `janela` dias completos
+    anteriores a `hoje`. Consumo e fórmulas são resolvidos no banco por
+    _previsoes_na_janela(), sem aritmética por material em Python, e as
+    previsões são gravadas com bulk_create(update_conflicts), um INSERT ...
+    ON CONFLICT por lote. Retorna o número de materiais calculados.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio, fim = hoje - timedelta(days=janela), hoje - timedelta(days=1)
+    agora = timezone.now()
+
+    previsoes = [
+        PrevisaoMaterial(
+            material_id=material_id, janela_dias=janela, calculado_em=agora,
+            demanda_media_diaria=demanda, desvio_padrao_diario=desvio, dias_cobertura=cobertura,
+            estoque_seguranca=seguranca, ponto_pedido=ponto, quantidade_sugerida=sugerida,
+        )
+        for material_id, demanda, desvio, cobertura, seguranca, ponto, sugerida in _previsoes_na_janela(
+            inicio, fim, janela, prazo, ciclo, Decimal(fator),
+        )
+    ]
+    PrevisaoMaterial.objects.bulk_create(
+        previsoes,
+        batch_size=TAMANHO_LOTE_PREVISAO,
+        update_conflicts=True,
+        unique_fields=['material'],
+        update_fields=[
+            'janela_dias', 'demanda_media_diaria', 'desvio_padrao_diario', 'dias_cobertura',
+            'estoque_seguranca', 'ponto_pedido', 'quantidade_sugerida', 'calculado_em',
+        ],
+    )
+    return len(previsoes)
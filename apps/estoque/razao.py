@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import MateriaPrima, MovimentoEstoque, SnapshotEstoque
+from .reservas import invalidar_disponibilidade, quantizar
+
+# Corte usado para materiais ainda sem snapshot: todos os movimentos contam
+INICIO_RAZAO = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Distância mínima entre o corte de um snapshot e o momento em que ele é
+# gerado, maior que a duração de qualquer transação que grave movimentos
+MARGEM_SNAPSHOT = timedelta(minutes=10)
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def registrar_ajuste(material, anterior, tipo=MovimentoEstoque.TIPO_AJUSTE, observacao=''):
+    """
+    Lança no razão a diferença entre a quantidade atual do material e
+    `anterior`. Chamado por MateriaPrima.save() para que edições diretas de
+    quantity também fiquem registradas.
+    """
+    delta = quantizar(material.quantity) - quantizar(anterior)
+    if not delta:
+        return None
+    return MovimentoEstoque.objects.create(material=material, tipo=tipo, quantidade=delta, observacao=observacao)
+
+
+def registrar_entrada(material_id, quantidade, observacao=''):
+    """
+    Dá entrada de `quantidade` no material: soma a quantity com F(), sem ler o
+    valor atual, e lança o movimento ENTRADA na mesma transação.
+    """
+    quantidade = quantizar(quantidade)
+    with transaction.atomic():
+        MateriaPrima.objects.filter(id=material_id).atualizar_saldo(F('quantity') + quantidade)
+        movimento = MovimentoEstoque.objects.create(
+            material_id=material_id, tipo=MovimentoEstoque.TIPO_ENTRADA, quantidade=quantidade, observacao=observacao,
+        )
+    invalidar_disponibilidade()
+    return movimento
+
+
+def saldo_em(instante=None, material_ids=None):
+    """
+    Saldo de cada material em `instante` (ou o atual, sem ele), em uma única
+    consulta: parte do snapshot mais recente até o instante e soma só os
+    movimentos posteriores a ele. Retorna {material_id: Decimal}.
+    """
+    snapshots = SnapshotEstoque.objects.filter(material=OuterRef('pk'))
+    cauda = MovimentoEstoque.objects.filter(material=OuterRef('pk'), data__gt=OuterRef('corte'))
+    if instante is not None:
+        snapshots = snapshots.filter(data__lte=instante)
+        cauda = cauda.filter(data__lte=instante)
+    snapshots = snapshots.order_by('-data')
+    cauda = cauda.order_by().values('material').annotate(total=Sum('quantidade')).values('total')
+
+    materiais = MateriaPrima.objects.all()
+    if material_ids is not None:
+        materiais = materiais.filter(id__in=list(material_ids))
+    materiais = materiais.annotate(
+        corte=Coalesce(Subquery(snapshots.values('data')[:1]), Value(INICIO_RAZAO)),
+        base=Coalesce(Subquery(snapshots.values('quantidade')[:1]), ZERO),
+        cauda=Coalesce(Subquery(cauda), ZERO),
+    )
+    return {material_id: base + cauda for material_id, base, cauda in materiais.values_list('id', 'base', 'cauda')}
+
+
+def movimentacao_periodo(inicio, fim, material_ids=None):
+    """
+    Saldo inicial, entradas, consumos, ajustes e saldo final de cada material
+    entre `inicio` (exclusive) e `fim` (inclusive). O saldo inicial vem de
+    saldo_em(inicio) e os totais do período de uma consulta agrupada sobre os
+    movimentos do intervalo.
+    """
+    iniciais = saldo_em(inicio, material_ids)
+    movimentos = MovimentoEstoque.objects.filter(data__gt=inicio, data__lte=fim)
+    if material_ids is not None:
+        movimentos = movimentos.filter(material_id__in=list(material_ids))
+
+    def soma(*tipos):
+        return Coalesce(Sum('quantidade', filter=Q(tipo__in=tipos)), ZERO)
+
+    totais = {
+        linha['material_id']: linha
+        for linha in movimentos.order_by().values('material_id').annotate(
+            entradas=soma(MovimentoEstoque.TIPO_ENTRADA, MovimentoEstoque.TIPO_SALDO_INICIAL),
+            consumos=soma(MovimentoEstoque.TIPO_CONSUMO),
+            ajustes=soma(MovimentoEstoque.TIPO_AJUSTE),
+        )
+    }
+
+    resultado = []
+    for material_id, inicial in iniciais.items():
+        linha = totais.get(material_id, {})
+        entradas = linha.get('entradas', Decimal('0'))
+        consumos = linha.get('consumos', Decimal('0'))
+        ajustes = linha.get('ajustes', Decimal('0'))
+        resultado.append({
+            'material_id': material_id,
+            'saldo_inicial': inicial,
+            'entradas': entradas,
+            # Consumos ficam negativos no razão; aqui vão como quantidade consumida
+            'consumos': -consumos,
+            'ajustes': ajustes,
+            'saldo_final': inicial + entradas + consumos + ajustes,
+        })
+    return resultado
+
+
+def gerar_snapshots(corte=None):
+    """
+    Grava o saldo de todos os materiais em `corte` (padrão: agora menos
+    MARGEM_SNAPSHOT). O corte fica sempre pelo menos MARGEM_SNAPSHOT no
+    passado: um movimento com data anterior ao corte, gravado por uma
+    transação ainda aberta, ficaria fora do snapshot para sempre. Materiais
+    que já têm snapshot nesse corte são mantidos. Retorna quantos snapshots
+    foram gravados.
+    """
+    limite = timezone.now() - MARGEM_SNAPSHOT
+    corte = corte or limite
+    if corte > limite:
+        raise ValueError(f"O corte deve ser anterior a {limite:%d/%m/%Y %H:%M:%S} (margem de {MARGEM_SNAPSHOT}).")
+
+    existentes = set(SnapshotEstoque.objects.filter(data=corte).values_list('material_id', flat=True))
+    novos = [
+        SnapshotEstoque(material_id=material_id, data=corte, quantidade=saldo)
+        for material_id, saldo in saldo_em(corte).items()
+        if material_id not in existentes
+    ]
+    # ignore_conflicts só cobre uma execução concorrente no mesmo corte
+    SnapshotEstoque.objects.bulk_create(novos, ignore_conflicts=True)
+    return len(novos)
+
+
+def conferir_projecao(material_ids=None):
+    """
+    Compara MateriaPrima.quantity com o saldo do razão. Retorna os materiais
+    divergentes com a quantidade gravada e a do razão.
+    """
+    saldos = saldo_em(None, material_ids)
+    materiais = MateriaPrima.objects.filter(id__in=list(saldos)).values_list('id', 'name', 'quantity')
+    return [
+        {'material_id': material_id, 'nome': nome, 'quantity': quantidade, 'saldo_razao': saldos[material_id]}
+        for material_id, nome, quantidade in materiais
+        if quantidade != saldos[material_id]
+    ]
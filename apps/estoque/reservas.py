@@ -0,0 +1,93 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+
+from .models import MateriaPrima, ReservaMaterial
+
+CENTAVOS = Decimal('0.01')
+
+
+def quantizar(quantidade):
+    return Decimal(quantidade).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def _somar_reservado(deltas):
+    """
+    Aplica {material_id: delta} ao contador MateriaPrima.reserved em um único
+    UPDATE atômico, sem ler os valores atuais.
+    """
+    deltas = {material_id: delta for material_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    MateriaPrima.objects.filter(id__in=list(deltas)).update(
+        reserved=Case(
+            *[When(id=material_id, then=F('reserved') + Value(delta)) for material_id, delta in deltas.items()],
+            default=F('reserved'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+def invalidar_disponibilidade():
+    from apps.comercial.versoes import CHAVE_VERSAO_ESTOQUE, invalidar_versao
+    invalidar_versao(CHAVE_VERSAO_ESTOQUE)
+
+
+def _remover_reservas(pedido_ids):
+    """
+    Apaga as reservas dos pedidos e retorna o ajuste {material_id: delta} a ser
+    aplicado ao contador de reservado.
+    """
+    reservas = ReservaMaterial.objects.select_for_update().filter(pedido_venda_id__in=list(pedido_ids))
+    deltas = {}
+    ids = []
+    for reserva_id, material_id, quantidade in reservas.values_list('id', 'material_id', 'quantidade'):
+        deltas[material_id] = deltas.get(material_id, Decimal('0')) - quantidade
+        ids.append(reserva_id)
+    if ids:
+        ReservaMaterial.objects.filter(id__in=ids).delete()
+    return deltas
+
+
+def liberar_reservas(pedido_ids):
+    """
+    Remove as reservas dos pedidos e devolve as quantidades ao disponível.
+    Usado no consumo dos materiais e no cancelamento ou rejeição do pedido.
+    """
+    with transaction.atomic():
+        deltas = _remover_reservas(pedido_ids)
+        if deltas:
+            _somar_reservado(deltas)
+            invalidar_disponibilidade()
+    return deltas
+
+
+def reservar_pedidos(pedidos):
+    """
+    Reserva os materiais necessários de um ou mais pedidos, substituindo as
+    reservas que eles já tinham. O contador MateriaPrima.reserved recebe só a
+    diferença líquida, de forma que disponível = quantity - reserved continua
+    sendo a leitura de uma única linha.
+    """
+    from apps.comercial.necessidades import calcular_necessidades
+
+    necessidades = calcular_necessidades(pedidos)
+    with transaction.atomic():
+        deltas = _remover_reservas(necessidades.keys())
+        novas = []
+        for pedido_id, por_material in necessidades.items():
+            for material_id, dados in por_material.items():
+                quantidade = quantizar(dados['quantidade'])
+                if quantidade <= 0:
+                    continue
+                novas.append(ReservaMaterial(material_id=material_id, pedido_venda_id=pedido_id, quantidade=quantidade))
+                deltas[material_id] = deltas.get(material_id, Decimal('0')) + quantidade
+        ReservaMaterial.objects.bulk_create(novas)
+        _somar_reservado(deltas)
+        invalidar_disponibilidade()
+    return novas
+
+
+def reservas_do_pedido(pedido_id):
+    return dict(ReservaMaterial.objects.filter(pedido_venda_id=pedido_id).values_list('material_id', 'quantidade'))
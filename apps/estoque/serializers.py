@@ -1,7 +1,13 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import MateriaPrima, ProdutoProcesso, ProdutoAcabado, HistoricoUsoMaterial
+from .consumo import AGRUPAMENTOS_CONSUMO
+from .models import MateriaPrima, ProdutoProcesso, ProdutoAcabado, HistoricoUsoMaterial, MovimentoEstoque, PrevisaoMaterial
+from .previsao import JANELA_PREVISAO_DIAS, PRAZO_REPOSICAO_DIAS, CICLO_REPOSICAO_DIAS, FATOR_SERVICO
 
 class MateriaPrimaSerializer(serializers.ModelSerializer):
+    available = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
     class Meta:
         model = MateriaPrima
         fields = [
@@ -12,12 +18,18 @@ class MateriaPrimaSerializer(serializers.ModelSerializer):
             'cor',
             'unidade_medida',
             'quantity',
+            'reserved',
+            'available',
+            'minimum_stock',
+            'abaixo_minimo',
+            'abaixo_minimo_desde',
         ]
+        read_only_fields = ['reserved', 'abaixo_minimo', 'abaixo_minimo_desde']
 
 class HistoricoUsoMaterialSerializer(serializers.ModelSerializer):
     material_nome = serializers.CharField(source='material.name', read_only=True)
     unidade_medida = serializers.SerializerMethodField()
-    pedido_id = serializers.IntegerField(source='pedido_venda.id', read_only=True, allow_null=True)
+    pedido_id = serializers.IntegerField(source='pedido_venda_id', read_only=True, allow_null=True)
 
     class Meta:
         model = HistoricoUsoMaterial
@@ -36,6 +48,84 @@ class HistoricoUsoMaterialSerializer(serializers.ModelSerializer):
             return 'Unidades'
         return obj.material.get_unidade_medida_display()
 
+class LinhaConsumoSerializer(serializers.Serializer):
+    material_id = serializers.IntegerField()
+    quantidade_utilizada = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    pedido_id = serializers.IntegerField(required=False, allow_null=True)
+
+class ConsumoLoteSerializer(serializers.Serializer):
+    linhas = LinhaConsumoSerializer(many=True, allow_empty=False)
+    chave_idempotencia = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+class MovimentoEstoqueSerializer(serializers.ModelSerializer):
+    material_nome = serializers.CharField(source='material.name', read_only=True)
+    pedido_id = serializers.IntegerField(source='pedido_venda_id', read_only=True, allow_null=True)
+
+    class Meta:
+        model = MovimentoEstoque
+        fields = ('id', 'material', 'material_nome', 'tipo', 'quantidade', 'data', 'pedido_id', 'observacao')
+        read_only_fields = fields
+
+class AbaixoMinimoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MateriaPrima
+        fields = ('id', 'name', 'unidade_medida', 'local', 'quantity', 'minimum_stock', 'abaixo_minimo_desde')
+        read_only_fields = fields
+
+class FeedAbaixoMinimoSerializer(serializers.Serializer):
+    desde = serializers.DateTimeField(required=False)
+
+class EntradaEstoqueSerializer(serializers.Serializer):
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    observacao = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+class ConsultaSaldoSerializer(serializers.Serializer):
+    """Parâmetros de saldo-em (instante) e movimentacao (inicio e fim)."""
+    instante = serializers.DateTimeField(required=False)
+    inicio = serializers.DateTimeField(required=False)
+    fim = serializers.DateTimeField(required=False)
+    material = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if attrs.get('inicio') and attrs.get('fim') and attrs['inicio'] > attrs['fim']:
+            raise serializers.ValidationError({'fim': "fim deve ser posterior ou igual a inicio."})
+        return attrs
+
+class SerieConsumoSerializer(serializers.Serializer):
+    agrupar = serializers.ChoiceField(choices=list(AGRUPAMENTOS_CONSUMO), default='dia')
+    inicio = serializers.DateField(required=False)
+    fim = serializers.DateField(required=False)
+    material = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if attrs.get('inicio') and attrs.get('fim') and attrs['inicio'] > attrs['fim']:
+            raise serializers.ValidationError({'fim': "fim deve ser posterior ou igual a inicio."})
+        return attrs
+
+class ConsumoPedidoConsultaSerializer(serializers.Serializer):
+    pedido = serializers.IntegerField(min_value=1)
+
+class PrevisaoMaterialSerializer(serializers.ModelSerializer):
+    material_nome = serializers.CharField(source='material.name', read_only=True)
+    unidade_medida = serializers.CharField(source='material.unidade_medida', read_only=True)
+    quantity = serializers.DecimalField(source='material.quantity', max_digits=10, decimal_places=2, read_only=True)
+    minimum_stock = serializers.DecimalField(source='material.minimum_stock', max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = PrevisaoMaterial
+        fields = (
+            'material', 'material_nome', 'unidade_medida', 'quantity', 'minimum_stock', 'janela_dias',
+            'demanda_media_diaria', 'desvio_padrao_diario', 'dias_cobertura', 'estoque_seguranca',
+            'ponto_pedido', 'quantidade_sugerida', 'calculado_em',
+        )
+        read_only_fields = fields
+
+class CalculoPrevisaoSerializer(serializers.Serializer):
+    janela = serializers.IntegerField(min_value=7, max_value=365, default=JANELA_PREVISAO_DIAS)
+    prazo = serializers.IntegerField(min_value=1, max_value=365, default=PRAZO_REPOSICAO_DIAS)
+    ciclo = serializers.IntegerField(min_value=1, max_value=365, default=CICLO_REPOSICAO_DIAS)
+    fator = serializers.DecimalField(max_digits=4, decimal_places=2, min_value=Decimal('0'), max_value=Decimal('4'), default=FATOR_SERVICO)
+
 class ProdutoProcessoSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProdutoProcesso
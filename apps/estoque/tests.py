@@ -1,3 +1,464 @@
-from django.test import TestCase
+import io
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+
+from apps.clientes.models import Cliente
+from apps.comercial.models import PedidoVenda
+from apps.estoque.models import (
+    MateriaPrima, HistoricoUsoMaterial, RequisicaoConsumo, MovimentoEstoque, SnapshotEstoque, ConsumoDiario, ConsumoPedido,
+    PrevisaoMaterial,
+)
+from apps.estoque.previsao import DIAS_COBERTURA_MAXIMO, calcular_previsoes
+from apps.estoque.razao import conferir_projecao, gerar_snapshots, saldo_em
+
+
+class EstoqueTestMixin:
+    """
+    Authenticates the test client as a freshly created user.
+    """
+
+    def autenticar(self):
+        self.user = User.objects.create_user(username='estoque', password='senha-teste')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+class ConsumoMaterialTests(EstoqueTestMixin, APITestCase):
+    def setUp(self):
+        self.autenticar()
+
+        cliente = Cliente.objects.create(nome='Cliente Teste', cpf_cnpj='00.000.000/0001-00', tipo='PJ')
+        self.pedido = PedidoVenda.objects.create(cliente=cliente)
+        self.tecido = MateriaPrima.objects.create(
+            name='Tecido em Rolo', unidade_medida='ROLO', quantidade_rolos=2, metragem_por_rolo=Decimal('50')
+        )
+        self.linha = MateriaPrima.objects.create(name='Linha', unidade_medida='UNIDADE', quantity=Decimal('20'))
+
+    def test_single_consumption_is_not_undone_by_unit_recalculation(self):
+        response = self.client.post(
+            f'/api/estoque/materias-primas/{self.tecido.id}/utilizar-material/',
+            {'quantidade_utilizada': '30', 'pedido_id': self.pedido.id},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['quantity']), Decimal('70'))
+        self.assertEqual(HistoricoUsoMaterial.objects.get().pedido_venda_id, self.pedido.id)
+
+    def test_later_save_does_not_recount_packs(self):
+        self.client.post(
+            f'/api/estoque/materias-primas/{self.tecido.id}/utilizar-material/', {'quantidade_utilizada': '30'}, format='json'
+        )
+        tecido = MateriaPrima.objects.get(id=self.tecido.id)
+        tecido.name = 'Tecido Renomeado'
+        tecido.save()
+        tecido.refresh_from_db()
+        self.assertEqual(tecido.quantity, Decimal('70'))
+        self.assertFalse(MovimentoEstoque.objects.filter(material=tecido, tipo='AJUSTE').exists())
+
+        # A new roll count is a recount and replaces the quantity
+        tecido.quantidade_rolos = 3
+        tecido.save()
+        tecido.refresh_from_db()
+        self.assertEqual(tecido.quantity, Decimal('150'))
+        self.assertEqual(MovimentoEstoque.objects.get(material=tecido, tipo='AJUSTE').quantidade, Decimal('80'))
+
+    def test_single_consumption_rejects_oversell(self):
+        response = self.client.post(
+            f'/api/estoque/materias-primas/{self.linha.id}/utilizar-material/',
+            {'quantidade_utilizada': '21'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.linha.refresh_from_db()
+        self.assertEqual(self.linha.quantity, Decimal('20'))
+
+    def test_batch_consumption(self):
+        linhas = [
+            {'material_id': self.tecido.id, 'quantidade_utilizada': '10', 'pedido_id': self.pedido.id},
+            {'material_id': self.tecido.id, 'quantidade_utilizada': '5'},
+            {'material_id': self.linha.id, 'quantidade_utilizada': '2', 'pedido_id': 999999},
+        ]
+        response = self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['historico']), 3)
+        self.assertEqual(response.data['historico'][2]['pedido_id'], None)
+
+        self.tecido.refresh_from_db()
+        self.linha.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('85'))
+        self.assertEqual(self.linha.quantity, Decimal('18'))
+
+    def test_batch_is_all_or_nothing(self):
+        linhas = [
+            {'material_id': self.tecido.id, 'quantidade_utilizada': '10'},
+            {'material_id': self.linha.id, 'quantidade_utilizada': '15'},
+            {'material_id': self.linha.id, 'quantidade_utilizada': '15'},
+        ]
+        response = self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([falta['material_id'] for falta in response.data['faltas']], [self.linha.id])
+
+        self.tecido.refresh_from_db()
+        self.assertEqual(self.tecido.quantity, Decimal('100'))
+        self.assertFalse(HistoricoUsoMaterial.objects.exists())
+
+    def test_retry_with_same_key_does_not_debit_twice(self):
+        payload = {'linhas': [{'material_id': self.linha.id, 'quantidade_utilizada': '4'}]}
+        url = '/api/estoque/materias-primas/utilizar-lote/'
+
+        primeira = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='coletor-7-000123')
+        repetida = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='coletor-7-000123')
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.data, primeira.data)
+
+        self.linha.refresh_from_db()
+        self.assertEqual(self.linha.quantity, Decimal('16'))
+        self.assertEqual(RequisicaoConsumo.objects.count(), 1)
+
+    def test_failed_request_can_be_retried_with_same_key(self):
+        url = '/api/estoque/materias-primas/utilizar-lote/'
+        excesso = {'linhas': [{'material_id': self.linha.id, 'quantidade_utilizada': '50'}], 'chave_idempotencia': 'k1'}
+        self.assertEqual(self.client.post(url, excesso, format='json').status_code, 400)
+        self.assertFalse(RequisicaoConsumo.objects.exists())
+
+        valido = {'linhas': [{'material_id': self.linha.id, 'quantidade_utilizada': '5'}], 'chave_idempotencia': 'k1'}
+        self.assertEqual(self.client.post(url, valido, format='json').status_code, 201)
+
+    def test_history_uses_cursor_pagination(self):
+        linhas = [{'material_id': self.linha.id, 'quantidade_utilizada': '1'} for _ in range(3)]
+        self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+
+        response = self.client.get('/api/estoque/historico-uso-materiais/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('count', response.data)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+
+class RazaoEstoqueTests(EstoqueTestMixin, APITestCase):
+    def setUp(self):
+        self.autenticar()
+        self.linha = MateriaPrima.objects.create(name='Linha', unidade_medida='UNIDADE', quantity=Decimal('20'))
+
+    def _consumir(self, quantidade):
+        linhas = [{'material_id': self.linha.id, 'quantidade_utilizada': quantidade}]
+        response = self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_every_quantity_change_is_recorded(self):
+        response = self.client.post(f'/api/estoque/materias-primas/{self.linha.id}/entrada/', {'quantidade': '10'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['quantity']), Decimal('30'))
+        self._consumir('4')
+        response = self.client.patch(f'/api/estoque/materias-primas/{self.linha.id}/', {'quantity': '25'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        movimentos = MovimentoEstoque.objects.filter(material=self.linha).order_by('id')
+        self.assertEqual(
+            [(movimento.tipo, movimento.quantidade) for movimento in movimentos],
+            [('SALDO_INICIAL', Decimal('20')), ('ENTRADA', Decimal('10')), ('CONSUMO', Decimal('-4')), ('AJUSTE', Decimal('-1'))],
+        )
+        self.assertEqual(movimentos[2].historico, HistoricoUsoMaterial.objects.get())
+        self.assertEqual(conferir_projecao(), [])
+
+    def test_direct_quantity_updates_are_rejected(self):
+        with self.assertRaises(ValueError):
+            MateriaPrima.objects.filter(id=self.linha.id).update(quantity=F('quantity') + 1)
+        self.linha.quantity = Decimal('7')
+        with self.assertRaises(ValueError), transaction.atomic():
+            MateriaPrima.objects.bulk_update([self.linha], ['quantity'])
+
+        self.linha.refresh_from_db()
+        self.assertEqual(self.linha.quantity, Decimal('20'))
+        self.assertEqual(conferir_projecao(), [])
+
+    def test_balance_at_instant_reads_snapshot_and_tail(self):
+        antes_entrada = timezone.now()
+        self.client.post(f'/api/estoque/materias-primas/{self.linha.id}/entrada/', {'quantidade': '10'}, format='json')
+        corte = timezone.now()
+        self._consumir('5')
+
+        # Snapshots only accept cutoffs older than the safety margin
+        with self.assertRaises(ValueError):
+            gerar_snapshots(corte)
+        atraso = timedelta(hours=1)
+        MovimentoEstoque.objects.update(data=F('data') - atraso)
+        antes_entrada, corte = antes_entrada - atraso, corte - atraso
+
+        self.assertEqual(saldo_em(antes_entrada)[self.linha.id], Decimal('20'))
+        self.assertEqual(saldo_em(corte)[self.linha.id], Decimal('30'))
+
+        self.assertEqual(gerar_snapshots(corte), MateriaPrima.objects.count())
+        self.assertEqual(gerar_snapshots(corte), 0)
+        # With a snapshot at the cutoff, older movements are no longer read
+        MovimentoEstoque.objects.filter(data__lte=corte).delete()
+        with CaptureQueriesContext(connection) as consultas:
+            saldos = saldo_em(material_ids=[self.linha.id])
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(saldos[self.linha.id], Decimal('25'))
+        self.assertEqual(saldo_em(corte)[self.linha.id], Decimal('30'))
+
+        response = self.client.get(
+            '/api/estoque/materias-primas/saldo-em/', {'instante': corte.isoformat(), 'material': self.linha.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['saldos'], [{'material_id': self.linha.id, 'saldo': Decimal('30')}])
+        self.assertEqual(self.client.get('/api/estoque/materias-primas/saldo-em/').status_code, 400)
+
+    def test_period_movement_totals(self):
+        inicio = timezone.now()
+        self.client.post(f'/api/estoque/materias-primas/{self.linha.id}/entrada/', {'quantidade': '8'}, format='json')
+        self._consumir('3')
+        self._consumir('2')
+
+        response = self.client.get(
+            '/api/estoque/materias-primas/movimentacao/', {'inicio': inicio.isoformat(), 'material': self.linha.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        linha, = response.data['materiais']
+        self.assertEqual(linha['saldo_inicial'], Decimal('20'))
+        self.assertEqual(linha['entradas'], Decimal('8'))
+        self.assertEqual(linha['consumos'], Decimal('5'))
+        self.assertEqual(linha['saldo_final'], Decimal('23'))
+
+        response = self.client.get('/api/estoque/movimentos/', {'material': self.linha.id, 'page_size': 2})
+        self.assertEqual([movimento['tipo'] for movimento in response.data['results']], ['CONSUMO', 'CONSUMO'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_check_command_reports_divergence(self):
+        call_command('gerar_snapshot_estoque', stdout=io.StringIO())
+        self.assertEqual(SnapshotEstoque.objects.count(), MateriaPrima.objects.count())
+        call_command('conferir_estoque', stdout=io.StringIO())
+
+        # A write that bypasses the ledger (raw SQL) is caught
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE estoque_materiaprima SET quantity = %s WHERE id = %s', ['99', self.linha.id])
+        with self.assertRaises(CommandError):
+            call_command('conferir_estoque', stdout=io.StringIO())
+
+
+class ConsumoDiarioTests(EstoqueTestMixin, APITestCase):
+    def setUp(self):
+        self.autenticar()
+
+        cliente = Cliente.objects.create(nome='Cliente Consumo', cpf_cnpj='11.111.111/0001-11', tipo='PJ')
+        self.pedido = PedidoVenda.objects.create(cliente=cliente)
+        self.linha = MateriaPrima.objects.create(name='Linha Consumo', unidade_medida='UNIDADE', quantity=Decimal('100'))
+        self.botao = MateriaPrima.objects.create(name='Botão Consumo', unidade_medida='UNIDADE', quantity=Decimal('100'))
+
+    def _consumir(self, linhas):
+        response = self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_rollups_are_updated_as_history_is_written(self):
+        self._consumir([
+            {'material_id': self.linha.id, 'quantidade_utilizada': '3', 'pedido_id': self.pedido.id},
+            {'material_id': self.botao.id, 'quantidade_utilizada': '1'},
+        ])
+        self._consumir([{'material_id': self.linha.id, 'quantidade_utilizada': '2', 'pedido_id': self.pedido.id}])
+
+        diario = ConsumoDiario.objects.get(material=self.linha)
+        self.assertEqual((diario.dia, diario.quantidade, diario.registros), (timezone.localdate(), Decimal('5'), 2))
+        self.assertEqual(ConsumoDiario.objects.get(material=self.botao).quantidade, Decimal('1'))
+        por_pedido = ConsumoPedido.objects.get()
+        self.assertEqual((por_pedido.material_id, por_pedido.quantidade), (self.linha.id, Decimal('5')))
+
+        response = self.client.get('/api/estoque/historico-uso-materiais/por-pedido/', {'pedido': self.pedido.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(linha['material_id'], linha['registros']) for linha in response.data], [(self.linha.id, 2)])
+
+    def test_series_are_served_from_rollup(self):
+        self._consumir([{'material_id': self.linha.id, 'quantidade_utilizada': '1'} for _ in range(3)])
+        primeiro, segundo, terceiro = HistoricoUsoMaterial.objects.order_by('id')
+        HistoricoUsoMaterial.objects.filter(id=primeiro.id).update(data_utilizacao=datetime(2026, 8, 3, 12, tzinfo=dt_timezone.utc))
+        HistoricoUsoMaterial.objects.filter(id=segundo.id).update(data_utilizacao=datetime(2026, 8, 20, 12, tzinfo=dt_timezone.utc))
+        HistoricoUsoMaterial.objects.filter(id=terceiro.id).update(data_utilizacao=datetime(2026, 9, 1, 12, tzinfo=dt_timezone.utc))
+        call_command('reconstruir_consumo_diario', stdout=io.StringIO())
+        self.assertEqual(ConsumoDiario.objects.filter(material=self.linha).count(), 3)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(
+                '/api/estoque/historico-uso-materiais/serie/', {'agrupar': 'mes', 'material': self.linha.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(linha['periodo'], linha['quantidade'], linha['registros']) for linha in response.data],
+            [(date(2026, 8, 1), Decimal('2'), 2), (date(2026, 9, 1), Decimal('1'), 1)],
+        )
+        self.assertFalse(any(HistoricoUsoMaterial._meta.db_table in consulta['sql'] for consulta in consultas))
+
+        response = self.client.get(
+            '/api/estoque/historico-uso-materiais/serie/', {'agrupar': 'semana', 'inicio': '2026-08-01', 'fim': '2026-08-31'}
+        )
+        self.assertEqual([linha['periodo'] for linha in response.data], [date(2026, 8, 3), date(2026, 8, 17)])
+        self.assertEqual(
+            self.client.get('/api/estoque/historico-uso-materiais/serie/', {'agrupar': 'ano'}).status_code, 400
+        )
+
+
+class PrevisaoMaterialTests(EstoqueTestMixin, APITestCase):
+    def setUp(self):
+        self.autenticar()
+
+        self.hoje = date(2026, 10, 11)
+        self.constante = MateriaPrima.objects.create(name='Consumo Constante', unidade_medida='UNIDADE', quantity=Decimal('10'))
+        self.variavel = MateriaPrima.objects.create(name='Consumo Variável', unidade_medida='UNIDADE', quantity=Decimal('100'))
+        dias = [self.hoje - timedelta(days=n) for n in range(1, 11)]
+        ConsumoDiario.objects.bulk_create(
+            [ConsumoDiario(material=self.constante, dia=dia, quantidade=Decimal('2'), registros=1) for dia in dias]
+            # Alternate days of 4 and nothing: same mean, standard deviation 2
+            + [ConsumoDiario(material=self.variavel, dia=dia, quantidade=Decimal('4'), registros=1) for dia in dias[::2]]
+            # Outside the window
+            + [ConsumoDiario(material=self.variavel, dia=self.hoje, quantidade=Decimal('500'), registros=1)]
+        )
+
+    def test_forecast_for_all_materials(self):
+        self.assertEqual(calcular_previsoes(janela=10, prazo=7, ciclo=30, hoje=self.hoje), MateriaPrima.objects.count())
+
+        constante = PrevisaoMaterial.objects.get(material=self.constante)
+        self.assertEqual(constante.demanda_media_diaria, Decimal('2'))
+        self.assertEqual(constante.desvio_padrao_diario, Decimal('0'))
+        self.assertEqual(constante.dias_cobertura, Decimal('5.0'))
+        self.assertEqual(constante.ponto_pedido, Decimal('14'))
+        self.assertEqual(constante.quantidade_sugerida, Decimal('64'))
+
+        variavel = PrevisaoMaterial.objects.get(material=self.variavel)
+        self.assertEqual(variavel.desvio_padrao_diario, Decimal('2'))
+        self.assertEqual(variavel.estoque_seguranca, Decimal('8.73'))
+        self.assertEqual(variavel.ponto_pedido, Decimal('22.73'))
+        self.assertEqual(variavel.quantidade_sugerida, Decimal('0'))
+
+        sem_consumo = PrevisaoMaterial.objects.exclude(material__in=[self.constante, self.variavel]).first()
+        self.assertIsNone(sem_consumo.dias_cobertura)
+
+        # Recalculating updates the stored rows in place
+        constante = MateriaPrima.objects.get(id=self.constante.id)
+        constante.quantity = Decimal('20')
+        constante.save()
+        calcular_previsoes(janela=10, prazo=7, ciclo=30, hoje=self.hoje)
+        self.assertEqual(PrevisaoMaterial.objects.filter(material=self.constante).count(), 1)
+        self.assertEqual(PrevisaoMaterial.objects.get(material=self.constante).dias_cobertura, Decimal('10.0'))
+
+    def test_near_zero_consumption_caps_coverage(self):
+        # 0.01 over the window gives a mean of 0.001/day; 10^8 units would be
+        # 10^11 days of coverage, beyond dias_cobertura's max_digits
+        ocioso = MateriaPrima.objects.create(name='Consumo Ínfimo', unidade_medida='UNIDADE', quantity=Decimal('100000000'))
+        ConsumoDiario.objects.create(material=ocioso, dia=self.hoje - timedelta(days=1), quantidade=Decimal('0.01'), registros=1)
+
+        calcular_previsoes(janela=10, prazo=7, ciclo=30, hoje=self.hoje)
+
+        previsao = PrevisaoMaterial.objects.get(material=ocioso)
+        self.assertEqual(previsao.demanda_media_diaria, Decimal('0.001'))
+        self.assertEqual(previsao.dias_cobertura, Decimal(DIAS_COBERTURA_MAXIMO))
+        self.assertEqual(previsao.quantidade_sugerida, Decimal('0'))
+
+    def test_endpoint_and_command(self):
+        call_command('calcular_previsoes', '--janela', '10', stdout=io.StringIO())
+        self.assertEqual(PrevisaoMaterial.objects.count(), MateriaPrima.objects.count())
+
+        response = self.client.post('/api/estoque/previsoes/calcular/', {'janela': 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/estoque/previsoes/calcular/', {'janela': 30}, format='json')
+        self.assertEqual(response.data['materiais'], MateriaPrima.objects.count())
+
+        calcular_previsoes(janela=10, hoje=self.hoje)
+        response = self.client.get('/api/estoque/previsoes/', {'repor': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([linha['material'] for linha in response.data['results']], [self.constante.id])
+        response = self.client.get('/api/estoque/previsoes/')
+        self.assertEqual(response.data['results'][0]['material'], self.constante.id)
+
+
+class AbaixoMinimoTests(EstoqueTestMixin, APITestCase):
+    def setUp(self):
+        self.autenticar()
+        self.linha = MateriaPrima.objects.create(
+            name='Linha Mínimo', unidade_medida='UNIDADE', quantity=Decimal('20'), minimum_stock=Decimal('10')
+        )
+
+    def _estado(self):
+        self.linha.refresh_from_db()
+        return self.linha.abaixo_minimo, self.linha.abaixo_minimo_desde
+
+    def test_save_sets_and_clears_flag(self):
+        self.assertEqual(self._estado(), (False, None))
+        response = self.client.patch(f'/api/estoque/materias-primas/{self.linha.id}/', {'quantity': '5'}, format='json')
+        self.assertTrue(response.data['abaixo_minimo'])
+        _, desde = self._estado()
+        self.assertIsNotNone(desde)
+
+        # Still below: the crossing time is kept
+        self.client.patch(f'/api/estoque/materias-primas/{self.linha.id}/', {'quantity': '4'}, format='json')
+        self.assertEqual(self._estado(), (True, desde))
+        self.client.patch(f'/api/estoque/materias-primas/{self.linha.id}/', {'minimum_stock': '3'}, format='json')
+        self.assertEqual(self._estado(), (False, None))
+
+    def test_atomic_and_bulk_updates_maintain_flag(self):
+        linhas = [{'material_id': self.linha.id, 'quantidade_utilizada': '15'}]
+        self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        abaixo, desde = self._estado()
+        self.assertTrue(abaixo)
+
+        linhas = [{'material_id': self.linha.id, 'quantidade_utilizada': '1'}]
+        self.client.post('/api/estoque/materias-primas/utilizar-lote/', {'linhas': linhas}, format='json')
+        self.assertEqual(self._estado(), (True, desde))
+
+        self.client.post(f'/api/estoque/materias-primas/{self.linha.id}/entrada/', {'quantidade': '50'}, format='json')
+        self.assertEqual(self._estado(), (False, None))
+
+        self.linha.minimum_stock = Decimal('100')
+        MateriaPrima.objects.bulk_update([self.linha], ['minimum_stock'])
+        self.assertTrue(self._estado()[0])
+        MateriaPrima.objects.filter(id=self.linha.id).update(minimum_stock=Decimal('0'))
+        self.assertEqual(self._estado(), (False, None))
+
+    def test_list_and_feed(self):
+        outro = MateriaPrima.objects.create(
+            name='Botão Mínimo', unidade_medida='UNIDADE', quantity=Decimal('1'), minimum_stock=Decimal('5')
+        )
+        corte = timezone.now()
+        self.linha.quantity = Decimal('9')
+        self.linha.save()
+
+        url = '/api/estoque/materias-primas/abaixo-minimo/'
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual([material['id'] for material in response.data['results']][:2], [outro.id, self.linha.id])
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(url, {'desde': corte.isoformat()})
+        self.assertEqual([material['id'] for material in response.data['results']], [self.linha.id])
+        self.assertEqual(self.client.get(url, {'desde': 'ontem'}).status_code, 400)
+
+    def test_pages_are_stable_when_crossing_times_tie(self):
+        materiais = MateriaPrima.objects.bulk_create([
+            MateriaPrima(name=f'Agulha {indice}', quantity=Decimal('0'), minimum_stock=Decimal('1')) for indice in range(4)
+        ])
+        self.assertTrue(all(material.abaixo_minimo for material in materiais))
+        # Same crossing time for every row, as after the migration backfill
+        MateriaPrima.objects.filter(abaixo_minimo=True).update(abaixo_minimo_desde=timezone.now())
+
+        vistos, url = [], '/api/estoque/materias-primas/abaixo-minimo/?page_size=1'
+        while url:
+            response = self.client.get(url)
+            vistos += [material['id'] for material in response.data['results']]
+            url = response.data['next']
+            # A material crosses the minimum again while the client is paging
+            MateriaPrima.objects.filter(id=materiais[0].id).update(abaixo_minimo_desde=timezone.now())
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertEqual(set(vistos), set(MateriaPrima.objects.filter(abaixo_minimo=True).values_list('id', flat=True)))
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import MateriaPrimaViewSet, ProdutoProcessoViewSet, ProdutoAcabadoViewSet, CoresDisponiveisView, GolaSubtiposView, HistoricoUsoMaterialViewSet
+from .views import MateriaPrimaViewSet, ProdutoProcessoViewSet, ProdutoAcabadoViewSet, CoresDisponiveisView, GolaSubtiposView, HistoricoUsoMaterialViewSet, MovimentoEstoqueViewSet, PrevisaoMaterialViewSet
 
 app_name = 'estoque'
 
@@ -9,6 +9,8 @@ router.register(r'materias-primas', MateriaPrimaViewSet)
 router.register(r'produtos-processo', ProdutoProcessoViewSet)
 router.register(r'produtos-acabados', ProdutoAcabadoViewSet)
 router.register(r'historico-uso-materiais', HistoricoUsoMaterialViewSet)
+router.register(r'movimentos', MovimentoEstoqueViewSet)
+router.register(r'previsoes', PrevisaoMaterialViewSet)
 
 urlpatterns = router.urls + [
     path('cores-disponiveis/', CoresDisponiveisView.as_view(), name='cores-disponiveis'),
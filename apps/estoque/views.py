@@ -3,11 +3,22 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import ProtectedError
-from decimal import Decimal
-from .models import MateriaPrima, ProdutoProcesso, ProdutoAcabado, HistoricoUsoMaterial
+from django.db.models import F, ProtectedError
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+from .models import MateriaPrima, ProdutoProcesso, ProdutoAcabado, HistoricoUsoMaterial, MovimentoEstoque, PrevisaoMaterial
 from apps.comercial.models import PedidoVenda
-from .serializers import MateriaPrimaSerializer, ProdutoProcessoSerializer, ProdutoAcabadoSerializer, GolaSubtipoSerializer, HistoricoUsoMaterialSerializer
+from proindustria360.pagination import PaginacaoAbaixoMinimo, PaginacaoHistoricoUso, PaginacaoMovimentos
+from .consumo import consumo_por_pedido, serie_consumo
+from .previsao import calcular_previsoes
+from .movimentacao import EstoqueInsuficiente, consumir_lote, debitar_materiais
+from .razao import movimentacao_periodo, registrar_entrada, saldo_em
+from .serializers import (
+    MateriaPrimaSerializer, ProdutoProcessoSerializer, ProdutoAcabadoSerializer, GolaSubtipoSerializer,
+    HistoricoUsoMaterialSerializer, ConsumoLoteSerializer, MovimentoEstoqueSerializer, EntradaEstoqueSerializer,
+    ConsultaSaldoSerializer, SerieConsumoSerializer, ConsumoPedidoConsultaSerializer, PrevisaoMaterialSerializer,
+    CalculoPrevisaoSerializer, AbaixoMinimoSerializer, FeedAbaixoMinimoSerializer,
+)
 
 class CoresDisponiveisView(APIView):
     permission_classes = [IsAuthenticated]
@@ -43,33 +54,135 @@ class MateriaPrimaViewSet(viewsets.ModelViewSet):
         try:
             quantidade_utilizada = Decimal(request.data.get('quantidade_utilizada'))
             pedido_id = request.data.get('pedido_id')
-        except (TypeError, ValueError):
+            pedido_id = int(pedido_id) if pedido_id else None
+        except (TypeError, ValueError, InvalidOperation):
             return Response({'error': 'Dados inválidos.'}, status=status.HTTP_400_BAD_REQUEST)
 
         if quantidade_utilizada <= 0:
             return Response({'error': 'Quantidade utilizada deve ser maior que zero.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if material.quantity < quantidade_utilizada:
+        pedido_venda_id = pedido_id if pedido_id in self._pedidos_existentes([pedido_id]) else None
+        try:
+            debitar_materiais([(material.id, quantidade_utilizada, pedido_venda_id)])
+        except EstoqueInsuficiente:
             return Response({'error': 'Estoque insuficiente.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        material.quantity -= quantidade_utilizada
-        material.save()
+        material.refresh_from_db()
+        serializer = self.get_serializer(material)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='utilizar-lote')
+    def utilizar_lote(self, request):
+        """
+        Registra o consumo de várias linhas (material, quantidade, pedido) de uma
+        vez, tudo ou nada. Envie a mesma chave no cabeçalho Idempotency-Key (ou
+        em chave_idempotencia) ao repetir uma requisição: a repetição devolve a
+        resposta original sem baixar o estoque de novo.
+        """
+        serializer = ConsumoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        chave = request.headers.get('Idempotency-Key') or serializer.validated_data.get('chave_idempotencia') or None
 
-        pedido_venda = None
-        if pedido_id:
-            try:
-                pedido_venda = PedidoVenda.objects.get(id=pedido_id)
-            except PedidoVenda.DoesNotExist:
-                pass
+        linhas = serializer.validated_data['linhas']
+        pedidos = self._pedidos_existentes(linha.get('pedido_id') for linha in linhas)
+        try:
+            resposta, repetida = consumir_lote(
+                [
+                    (
+                        linha['material_id'],
+                        linha['quantidade_utilizada'],
+                        linha.get('pedido_id') if linha.get('pedido_id') in pedidos else None,
+                    )
+                    for linha in linhas
+                ],
+                chave=chave,
+            )
+        except EstoqueInsuficiente as e:
+            return Response({'error': str(e), 'faltas': e.faltas}, status=status.HTTP_400_BAD_REQUEST)
 
-        HistoricoUsoMaterial.objects.create(
-            material=material,
-            quantidade_utilizada=quantidade_utilizada,
-            pedido_venda=pedido_venda
-        )
+        if repetida:
+            return Response(resposta, status=status.HTTP_200_OK, headers={'Idempotent-Replayed': 'true'})
+        return Response(resposta, status=status.HTTP_201_CREATED)
 
-        serializer = self.get_serializer(material)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @action(detail=False, methods=['get'], url_path='abaixo-minimo')
+    def abaixo_minimo(self, request):
+        """
+        Materiais com quantity abaixo de minimum_stock, do mais novo para o mais
+        antigo, lidos pelo índice do estado abaixo_minimo. Com ?desde= (data e
+        hora) vira um feed: só os materiais que cruzaram o mínimo depois desse
+        instante; abaixo_minimo_desde de cada um diz quando.
+        """
+        serializer = FeedAbaixoMinimoSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        materiais = MateriaPrima.objects.filter(abaixo_minimo=True)
+        if serializer.validated_data.get('desde'):
+            materiais = materiais.filter(abaixo_minimo_desde__gt=serializer.validated_data['desde'])
+
+        paginador = PaginacaoAbaixoMinimo()
+        pagina = paginador.paginate_queryset(materiais, request, view=self)
+        return paginador.get_paginated_response(AbaixoMinimoSerializer(pagina, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def entrada(self, request, pk=None):
+        """Dá entrada de uma quantidade no material e lança o movimento no razão."""
+        material = self.get_object()
+        serializer = EntradaEstoqueSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        registrar_entrada(material.id, serializer.validated_data['quantidade'], serializer.validated_data['observacao'])
+        material.refresh_from_db()
+        return Response(self.get_serializer(material).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='saldo-em')
+    def saldo_no_instante(self, request):
+        """
+        Saldo de cada material em ?instante= (data ou data e hora), calculado
+        pelo razão a partir do snapshot mais recente. ?material= restringe a
+        consulta a um material.
+        """
+        serializer = ConsultaSaldoSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        if 'instante' not in serializer.validated_data:
+            return Response({'instante': ['Este campo é obrigatório.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        instante = serializer.validated_data['instante']
+        material = serializer.validated_data.get('material')
+        saldos = saldo_em(instante, [material] if material else None)
+        return Response({
+            'instante': instante,
+            'saldos': [{'material_id': material_id, 'saldo': saldo} for material_id, saldo in sorted(saldos.items())],
+        })
+
+    @action(detail=False, methods=['get'])
+    def movimentacao(self, request):
+        """
+        Saldo inicial, entradas, consumos, ajustes e saldo final de cada
+        material entre ?inicio= e ?fim= (padrão: agora).
+        """
+        serializer = ConsultaSaldoSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        if 'inicio' not in serializer.validated_data:
+            return Response({'inicio': ['Este campo é obrigatório.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        inicio = serializer.validated_data['inicio']
+        fim = serializer.validated_data.get('fim') or timezone.now()
+        if inicio > fim:
+            return Response({'fim': ['fim deve ser posterior ou igual a inicio.']}, status=status.HTTP_400_BAD_REQUEST)
+        material = serializer.validated_data.get('material')
+        return Response({
+            'inicio': inicio,
+            'fim': fim,
+            'materiais': movimentacao_periodo(inicio, fim, [material] if material else None),
+        })
+
+    def _pedidos_existentes(self, pedido_ids):
+        """
+        Pedidos informados que existem, em uma consulta. Pedidos inexistentes
+        são ignorados e o consumo fica sem pedido, como sempre foi.
+        """
+        pedido_ids = {pedido_id for pedido_id in pedido_ids if pedido_id}
+        if not pedido_ids:
+            return set()
+        return set(PedidoVenda.objects.filter(id__in=pedido_ids).values_list('id', flat=True))
 
 
 class ProdutoProcessoViewSet(viewsets.ModelViewSet):
@@ -96,6 +209,82 @@ class HistoricoUsoMaterialViewSet(viewsets.ReadOnlyModelViewSet):
     ViewSet para visualização do histórico de uso de materiais.
     Permite apenas operações de leitura (list e retrieve).
     """
-    queryset = HistoricoUsoMaterial.objects.select_related('material', 'pedido_venda').all()
+    queryset = HistoricoUsoMaterial.objects.select_related('material').all()
     serializer_class = HistoricoUsoMaterialSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacaoHistoricoUso
+
+    @action(detail=False, methods=['get'])
+    def serie(self, request):
+        """
+        Consumo por período e material, lido dos acumulados diários
+        (ConsumoDiario) e não do histórico bruto. Parâmetros: agrupar
+        (dia, semana ou mes), inicio, fim e material.
+        """
+        serializer = SerieConsumoSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filtros = serializer.validated_data
+        material = filtros.get('material')
+        return Response(serie_consumo(
+            agrupar=filtros['agrupar'],
+            inicio=filtros.get('inicio'),
+            fim=filtros.get('fim'),
+            material_ids=[material] if material else None,
+        ))
+
+    @action(detail=False, methods=['get'], url_path='por-pedido')
+    def por_pedido(self, request):
+        """Consumo acumulado de cada material por um pedido (?pedido=)."""
+        serializer = ConsumoPedidoConsultaSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(consumo_por_pedido([serializer.validated_data['pedido']]))
+
+
+class MovimentoEstoqueViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Razão de estoque, somente leitura, do movimento mais recente para o mais
+    antigo. ?material= e ?tipo= filtram os lançamentos.
+    """
+    queryset = MovimentoEstoque.objects.select_related('material').all()
+    serializer_class = MovimentoEstoqueSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = PaginacaoMovimentos
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        material = self.request.query_params.get('material')
+        if material and material.isdigit():
+            queryset = queryset.filter(material_id=material)
+        tipo = self.request.query_params.get('tipo')
+        if tipo:
+            queryset = queryset.filter(tipo=tipo.upper())
+        return queryset
+
+
+class PrevisaoMaterialViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Previsões de consumo e ponto de pedido, da menor cobertura para a maior
+    (materiais sem consumo por último). ?repor=true traz só os materiais com
+    quantidade sugerida de reposição.
+    """
+    queryset = PrevisaoMaterial.objects.select_related('material').order_by(
+        F('dias_cobertura').asc(nulls_last=True), 'material_id'
+    )
+    serializer_class = PrevisaoMaterialSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.query_params.get('repor') in ('1', 'true'):
+            queryset = queryset.filter(quantidade_sugerida__gt=0)
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def calcular(self, request):
+        """
+        Recalcula as previsões de todos os materiais com os parâmetros
+        {"janela", "prazo", "ciclo", "fator"} (todos opcionais).
+        """
+        serializer = CalculoPrevisaoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'materiais': calcular_previsoes(**serializer.validated_data)}, status=status.HTTP_200_OK)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comercial', '0022_pedidovenda_materiais_necessarios'),
+        ('pcp', '0002_alter_etapaproducao_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordemproducao',
+            name='pedido_venda',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ordem_producao', to='comercial.pedidovenda'),
+        ),
+    ]
@@ -21,6 +21,10 @@ class OrdemProducao(models.Model):
     estimated_end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='MEDIA')
+    # Pedido que originou a ordem; a unicidade impede gerar duas ordens para o mesmo pedido
+    pedido_venda = models.OneToOneField(
+        'comercial.PedidoVenda', on_delete=models.SET_NULL, null=True, blank=True, related_name='ordem_producao'
+    )
 
     class Meta:
         verbose_name = "Ordem de Produção"
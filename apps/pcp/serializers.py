@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import OrdemProducao, EtapaProducao, HistoricoEtapas
 from apps.comercial.models import PedidoVenda
-from apps.comercial.serializers import ItemPedidoSerializer
+from apps.comercial.serializers import ItemPedidoSerializer, PedidosListSerializer
 
 class OrdemProducaoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,4 +27,5 @@ class PedidoPCPSerializer(serializers.ModelSerializer):
             'id', 'cliente', 'data_pedido', 'prazo', 'prioridade',
             'quantidade_pecas', 'valor_total', 'status', 'etapas',
             'itens', 'created_at', 'updated_at'
-        ]
\ No newline at end of file
+        ]
+        list_serializer_class = PedidosListSerializer
\ No newline at end of file
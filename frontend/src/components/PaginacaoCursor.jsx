@@ -0,0 +1,30 @@
+import React from 'react';
+
+// Controles de listas com paginação por cursor: a API devolve as URLs
+// `previous` e `next` prontas, então não há número nem total de páginas
+const PaginacaoCursor = ({ anterior, proxima, onNavegar, carregando = false }) => {
+  if (!anterior && !proxima) {
+    return null;
+  }
+
+  return (
+    <div className="flex justify-between items-center p-4 bg-gray-100 border-t border-gray-200">
+      <button
+        onClick={() => onNavegar(anterior)}
+        disabled={!anterior || carregando}
+        className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
+      >
+        Anterior
+      </button>
+      <button
+        onClick={() => onNavegar(proxima)}
+        disabled={!proxima || carregando}
+        className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
+      >
+        Próxima
+      </button>
+    </div>
+  );
+};
+
+export default PaginacaoCursor;
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useMemo, useCallback } from 'react';
 import api from '../services/axios';
 import { PlusCircle, Trash2, ChevronDown, ChevronUp, Send } from 'lucide-react';
 import NovaPecaForm from '../components/NovaPecaForm';
+import PaginacaoCursor from '../components/PaginacaoCursor';
 
 const ComercialPage = () => {
   // Main page state
@@ -12,6 +13,8 @@ const ComercialPage = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  // URLs `previous`/`next` da página de pedidos carregada
+  const [cursor, setCursor] = useState({ anterior: null, proxima: null });
   
   // Modal state
   const [isModalOpen, setIsModalOpen] = useState(false);
@@ -44,6 +47,7 @@ const ComercialPage = () => {
       setClientes(Array.isArray(clientesData) ? clientesData : []);
 
       const pedidosData = pedidosRes.data.results || pedidosRes.data;
+      setCursor({ anterior: pedidosRes.data.previous || null, proxima: pedidosRes.data.next || null });
       if (Array.isArray(pedidosData) && Array.isArray(clientesData)) {
         const formattedData = pedidosData.map(item => ({
           ...item,
@@ -71,6 +75,26 @@ const ComercialPage = () => {
     fetchInitialData();
   }, [fetchInitialData]);
 
+  // Segue um link next/previous da lista de pedidos, sem recarregar o resto da página
+  const fetchPaginaPedidos = useCallback(async (url) => {
+    setLoading(true);
+    try {
+      const response = await api.get(url);
+      const pedidosData = response.data.results || [];
+      setCursor({ anterior: response.data.previous || null, proxima: response.data.next || null });
+      setPedidos(pedidosData.map(item => ({
+        ...item,
+        cliente: clientes.find(c => c.id === item.cliente) || item.cliente,
+      })));
+      setError(null);
+    } catch (err) {
+      setError('Falha ao carregar dados. Tente novamente.');
+      console.error('Failed to fetch orders page:', err);
+    } finally {
+      setLoading(false);
+    }
+  }, [clientes]);
+
   // --- Form Handlers ---
   const handleOrderDataChange = (e) => {
     const { name, value } = e.target;
@@ -270,6 +294,7 @@ const ComercialPage = () => {
               ))}
             </tbody>
           </table>
+          <PaginacaoCursor anterior={cursor.anterior} proxima={cursor.proxima} onNavegar={fetchPaginaPedidos} />
         </div>
       )}
 
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useMemo, useCallback } from 'react';
 import api from '../services/axios';
 import { FiPackage, FiSearch, FiPlus, FiChevronDown, FiEdit, FiTrash2, FiInfo } from 'react-icons/fi';
 import StatusBadge from '../components/StatusBadge';
+import PaginacaoCursor from '../components/PaginacaoCursor';
 
 const EstoquePage = () => {
   const [items, setItems] = useState([]);
@@ -9,10 +10,12 @@ const EstoquePage = () => {
   const [error, setError] = useState(null);
   const [activeTab, setActiveTab] = useState('produtos');
   const [pedidos, setPedidos] = useState([]);
-  const [clientes, setClientes] = useState([]);
   const [historicoItems, setHistoricoItems] = useState([]);
   const [historicoLoading, setHistoricoLoading] = useState(false);
   const [historicoError, setHistoricoError] = useState(null);
+  // URLs `previous`/`next` das listas paginadas por cursor
+  const [pedidosCursor, setPedidosCursor] = useState({ anterior: null, proxima: null });
+  const [historicoCursor, setHistoricoCursor] = useState({ anterior: null, proxima: null });
   const [activePedidoTab, setActivePedidoTab] = useState('estoque');
   const [materiais, setMateriais] = useState([]);
   const [loadingMateriais, setLoadingMateriais] = useState(false);
@@ -38,8 +41,6 @@ const EstoquePage = () => {
   const [selectedMaterial, setSelectedMaterial] = useState(null);
   const [quantidadeUtilizada, setQuantidadeUtilizada] = useState('');
   const [stockSearchTerm, setStockSearchTerm] = useState('');
-  const [currentPage, setCurrentPage] = useState(1);
-  const itemsPerPage = 10;
   const [formData, setFormData] = useState({
     name: '',
     tipo_produto: 'TECIDO',
@@ -142,39 +143,23 @@ const EstoquePage = () => {
     }
   };
 
-  const fetchClientes = useCallback(async (signal) => {
-    try {
-      const response = await api.get('clientes/clientes/', { signal });
-      const data = response.data.results || response.data;
-      if (Array.isArray(data)) {
-        setClientes(data);
-        return data;
-      }
-      return [];
-    } catch (err) {
-      if (err.name !== 'CanceledError') {
-        console.error('Failed to fetch clients', err);
-        setError('Failed to fetch clients.');
-      }
-      return [];
-    }
-  }, []);
-
-  const fetchPedidos = useCallback(async (currentClients, signal) => {
+  const fetchPedidos = useCallback(async (signal, url = null) => {
     setLoading(true);
     setError(null);
     try {
-      const response = await api.get('comercial/pedidos/', { signal });
+      // `url` é um link next/previous da página atual e já traz os parâmetros
+      const response = url
+        ? await api.get(url, { signal })
+        : await api.get('comercial/pedidos/', { params: { expand: 'itens' }, signal });
       const data = response.data.results || response.data;
+      setPedidosCursor({ anterior: response.data.previous || null, proxima: response.data.next || null });
       if (Array.isArray(data)) {
-        const formattedData = data.map(item => {
-          const client = currentClients.find(c => c.id === item.cliente);
-          return {
-            ...item,
-            cliente: client,
-            data_inicio: item.data_pedido,
-          };
-        });
+        // O resumo do cliente já vem embutido no pedido
+        const formattedData = data.map(item => ({
+          ...item,
+          cliente: item.cliente_resumo,
+          data_inicio: item.data_pedido,
+        }));
         setPedidos(formattedData);
       } else {
         setPedidos([]);
@@ -205,12 +190,23 @@ const EstoquePage = () => {
     }
   }, []);
 
-  const fetchHistorico = useCallback(async (signal) => {
+  // Documento e telefone só aparecem no modal; são buscados ao abri-lo
+  const fetchClienteDetalhes = useCallback(async (clienteId) => {
+    try {
+      const response = await api.get(`clientes/clientes/${clienteId}/`);
+      setSelectedPedido(prev => (prev && prev.cliente?.id === clienteId ? { ...prev, cliente: response.data } : prev));
+    } catch (err) {
+      console.error('Failed to fetch client details', err);
+    }
+  }, []);
+
+  const fetchHistorico = useCallback(async (signal, url = null) => {
     setHistoricoLoading(true);
     setHistoricoError(null);
     try {
-      const response = await api.get('estoque/historico-uso-materiais/', { signal });
+      const response = await api.get(url || 'estoque/historico-uso-materiais/', { signal });
       const data = response.data.results || response.data;
+      setHistoricoCursor({ anterior: response.data.previous || null, proxima: response.data.next || null });
       if (Array.isArray(data)) {
         setHistoricoItems(data);
       } else {
@@ -233,8 +229,7 @@ const EstoquePage = () => {
       if (activeTab === 'produtos') {
         await fetchItems(abortController.signal);
       } else if (activeTab === 'pedidos') {
-        const fetchedClients = await fetchClientes(abortController.signal);
-        await fetchPedidos(fetchedClients, abortController.signal);
+        await fetchPedidos(abortController.signal);
       } else if (activeTab === 'historico') {
         await fetchHistorico(abortController.signal);
       }
@@ -243,7 +238,7 @@ const EstoquePage = () => {
     return () => {
       abortController.abort();
     };
-  }, [activeTab, fetchClientes, fetchPedidos, fetchHistorico]);
+  }, [activeTab, fetchPedidos, fetchHistorico]);
 
   const handleFilterChange = (e) => {
     const { name, value } = e.target;
@@ -290,25 +285,13 @@ const EstoquePage = () => {
     });
   }, [pedidos, searchTerm, filters, activePedidoTab]);
 
-  const totalPages = Math.ceil(filteredPedidosByTab.length / itemsPerPage);
-  const currentPedidos = useMemo(() => {
-    const startIndex = (currentPage - 1) * itemsPerPage;
-    const endIndex = startIndex + itemsPerPage;
-    return filteredPedidosByTab.slice(startIndex, endIndex);
-  }, [filteredPedidosByTab, currentPage, itemsPerPage]);
-
-  const handleNextPage = () => {
-    setCurrentPage(prev => Math.min(prev + 1, totalPages));
-  };
-
-  const handlePrevPage = () => {
-    setCurrentPage(prev => Math.max(prev - 1, 1));
-  };
-
   const handleRowClick = (pedido) => {
     setSelectedPedido(pedido);
     setIsPedidoModalOpen(true);
     fetchMateriais(pedido.id);
+    if (pedido.cliente) {
+      fetchClienteDetalhes(pedido.cliente.id);
+    }
   };
 
   const closePedidoModal = () => {
@@ -812,7 +795,7 @@ const EstoquePage = () => {
               </div>
             ) : error ? (
               <div className="text-center text-red-500 bg-red-100 p-4 rounded-md">{error}</div>
-            ) : currentPedidos.length > 0 ? (
+            ) : filteredPedidosByTab.length > 0 ? (
               <>
                 <table className="min-w-full divide-y divide-gray-200">
                   <thead className="bg-gray-100">
@@ -826,7 +809,7 @@ const EstoquePage = () => {
                     </tr>
                   </thead>
                   <tbody className="bg-white divide-y divide-gray-200">
-                    {currentPedidos.map((pedido) => (
+                    {filteredPedidosByTab.map((pedido) => (
                       <tr key={pedido.id} className="hover:bg-gray-50 cursor-pointer" onClick={() => handleRowClick(pedido)}>
                         <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">#{pedido.id}</td>
                         <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-700">{pedido.cliente?.nome || 'N/A'}</td>
@@ -844,29 +827,19 @@ const EstoquePage = () => {
                     ))}
                   </tbody>
                 </table>
-                <div className="flex justify-between items-center p-4 bg-gray-100 border-t border-gray-200">
-                  <button
-                    onClick={handlePrevPage}
-                    disabled={currentPage === 1}
-                    className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                  >
-                    Anterior
-                  </button>
-                  <span className="text-sm text-gray-700">Página {currentPage} de {Math.max(totalPages, 1)}</span>
-                  <button
-                    onClick={handleNextPage}
-                    disabled={currentPage >= totalPages}
-                    className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                  >
-                    Próxima
-                  </button>
-                </div>
               </>
             ) : (
               <div className="bg-white rounded-lg shadow p-6 text-center text-gray-500">
                 <p>Nenhum pedido nesta categoria no momento.</p>
               </div>
             )}
+            {!loading && !error && (
+              <PaginacaoCursor
+                anterior={pedidosCursor.anterior}
+                proxima={pedidosCursor.proxima}
+                onNavegar={(url) => fetchPedidos(undefined, url)}
+              />
+            )}
           </div>
         </>
       )}
@@ -905,6 +878,13 @@ const EstoquePage = () => {
               <p>Nenhum registro de uso de material encontrado.</p>
             </div>
           )}
+          {!historicoLoading && !historicoError && (
+            <PaginacaoCursor
+              anterior={historicoCursor.anterior}
+              proxima={historicoCursor.proxima}
+              onNavegar={(url) => fetchHistorico(undefined, url)}
+            />
+          )}
         </div>
       )}
 
@@ -3,10 +3,10 @@ import api from '../services/axios';
 import { FiSearch, FiChevronDown, FiInfo } from 'react-icons/fi';
 import StatusBadge from '../components/StatusBadge';
 import EnviarParaSetor from '../components/EnviarParaSetor';
+import PaginacaoCursor from '../components/PaginacaoCursor';
 
 const PcpPage = () => {
   const [pedidos, setPedidos] = useState([]);
-  const [clientes, setClientes] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
@@ -15,8 +15,8 @@ const PcpPage = () => {
     etapas: '',
     prioridade: '',
   });
-  const [currentPage, setCurrentPage] = useState(1);
-  const itemsPerPage = 10;
+  // URLs `previous`/`next` da página de pedidos carregada
+  const [cursor, setCursor] = useState({ anterior: null, proxima: null });
   const [activeTab, setActiveTab] = useState('pendentes'); // New state for active tab
   const [isModalOpen, setIsModalOpen] = useState(false); // State for modal visibility
   const [selectedPedido, setSelectedPedido] = useState(null); // State for selected pedido details
@@ -29,28 +29,7 @@ const PcpPage = () => {
   const [errorMateriais, setErrorMateriais] = useState(null);
 
 
-  const fetchClientes = useCallback(async () => {
-    const token = localStorage.getItem("access_token");
-    if (!token) {
-      setError("Você não está autenticado. Por favor, faça login.");
-      return [];
-    }
-    try {
-      const response = await api.get('clientes/clientes/');
-      const data = response.data.results || response.data;
-      if (Array.isArray(data)) {
-        setClientes(data);
-        return data;
-      }
-      return [];
-    } catch (err) {
-      console.error('Failed to fetch clients', err);
-      setError('Failed to fetch clients.');
-      return [];
-    }
-  }, []);
-
-  const fetchPedidos = useCallback(async (currentClients) => {
+  const fetchPedidos = useCallback(async (url = null) => {
     const token = localStorage.getItem("access_token");
     if (!token) {
       setError("Você não está autenticado. Por favor, faça login.");
@@ -60,18 +39,20 @@ const PcpPage = () => {
     setLoading(true);
     setError(null);
     try {
-      // Fetch all pedidos, then filter on the frontend based on the active tab
-      const response = await api.get('comercial/pedidos/');
+      // Fetch a page of pedidos, then filter on the frontend based on the active tab;
+      // `url` is the page's next/previous link and already carries the params
+      const response = url
+        ? await api.get(url)
+        : await api.get('comercial/pedidos/', { params: { expand: 'itens' } });
       const data = response.data.results || response.data;
+      setCursor({ anterior: response.data.previous || null, proxima: response.data.next || null });
       if (Array.isArray(data)) {
-        const formattedData = data.map(item => {
-          const client = currentClients.find(c => c.id === item.cliente);
-          return {
-            ...item,
-            cliente: client,
-            data_inicio: item.data_pedido,
-          };
-        });
+        // O resumo do cliente já vem embutido no pedido
+        const formattedData = data.map(item => ({
+          ...item,
+          cliente: item.cliente_resumo,
+          data_inicio: item.data_pedido,
+        }));
         setPedidos(formattedData);
       } else {
         setPedidos([]);
@@ -100,18 +81,23 @@ const PcpPage = () => {
     }
   }, []);
 
+  // Documento e telefone só aparecem no modal; são buscados ao abri-lo
+  const fetchClienteDetalhes = useCallback(async (clienteId) => {
+    try {
+      const response = await api.get(`clientes/clientes/${clienteId}/`);
+      setSelectedPedido(prev => (prev && prev.cliente?.id === clienteId ? { ...prev, cliente: response.data } : prev));
+    } catch (err) {
+      console.error('Failed to fetch client details', err);
+    }
+  }, []);
+
   useEffect(() => {
-    const loadData = async () => {
-      const fetchedClients = await fetchClientes();
-      await fetchPedidos(fetchedClients);
-    };
-    loadData();
-  }, [fetchClientes, fetchPedidos]);
+    fetchPedidos();
+  }, [fetchPedidos]);
 
   const handleFilterChange = (e) => {
     const { name, value } = e.target;
     setFilters(prev => ({ ...prev, [name]: value }));
-    setCurrentPage(1);
   };
 
   const getDisplayStatus = (apiStatus) => {
@@ -177,15 +163,6 @@ const PcpPage = () => {
     });
   }, [pedidos, searchTerm, filters]);
 
-
-  const handleNextPage = () => {
-    setCurrentPage(prev => Math.min(prev + 1, totalPages));
-  };
-
-  const handlePrevPage = () => {
-    setCurrentPage(prev => Math.max(prev - 1, 1));
-  };
-
   const uniqueEtapas = useMemo(() => {
     const allEtapas = new Set();
     pedidos.forEach(pedido => {
@@ -198,6 +175,9 @@ const PcpPage = () => {
     setSelectedPedido(pedido);
     setIsModalOpen(true);
     fetchMateriais(pedido.id);
+    if (pedido.cliente) {
+      fetchClienteDetalhes(pedido.cliente.id);
+    }
   };
 
   const closeModal = () => {
@@ -298,12 +278,6 @@ const PcpPage = () => {
     });
   }, [pedidos, searchTerm, filters, activeTab]);
 
-  const totalPages = Math.ceil(filteredPedidosByTab.length / itemsPerPage);
-  const currentItems = useMemo(() => {
-    const startIndex = (currentPage - 1) * itemsPerPage;
-    const endIndex = startIndex + itemsPerPage;
-    return filteredPedidosByTab.slice(startIndex, endIndex);
-  }, [filteredPedidosByTab, currentPage, itemsPerPage]);
 
 
 
@@ -396,7 +370,7 @@ const PcpPage = () => {
                   </tr>
                 </thead>
                 <tbody className="bg-white divide-y divide-gray-200">
-                  {currentItems.map((pedido) => (
+                  {filteredPedidosByTab.map((pedido) => (
                     <tr key={pedido.id} className="hover:bg-gray-50 cursor-pointer" onClick={() => handleRowClick(pedido)}>
                       <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{pedido.id}</td>
                       <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-700">{pedido.cliente?.nome || 'N/A'}</td>
@@ -415,29 +389,13 @@ const PcpPage = () => {
                 </tbody>
               </table>
               {/* Pagination */}
-              <div className="flex justify-between items-center p-4 bg-gray-100 border-t border-gray-200">
-                <button
-                  onClick={handlePrevPage}
-                  disabled={currentPage === 1}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Anterior
-                </button>
-                <span className="text-sm text-gray-700">Página {currentPage} de {Math.max(totalPages, 1)}</span>
-                <button
-                  onClick={handleNextPage}
-                  disabled={currentPage >= totalPages}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Próxima
-                </button>
-              </div>
+              <PaginacaoCursor anterior={cursor.anterior} proxima={cursor.proxima} onNavegar={fetchPedidos} />
             </div>
           )}
 
           {activeTab === 'producao' && (
             <div className="overflow-x-auto bg-white rounded-lg shadow">
-              {currentItems.length > 0 ? (
+              {filteredPedidosByTab.length > 0 ? (
                 <table className="min-w-full divide-y divide-gray-200">
                   <thead className="bg-gray-100">
                     <tr>
@@ -450,7 +408,7 @@ const PcpPage = () => {
                     </tr>
                   </thead>
                   <tbody className="bg-white divide-y divide-gray-200">
-                    {currentItems.map((pedido) => (
+                    {filteredPedidosByTab.map((pedido) => (
                       <tr key={pedido.id} className="hover:bg-gray-50 cursor-pointer" onClick={() => handleRowClick(pedido)}>
                         <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{pedido.id}</td>
                         <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-700">{pedido.cliente?.nome || 'N/A'}</td>
@@ -472,29 +430,13 @@ const PcpPage = () => {
                 <div className="text-center text-gray-600 p-4">Nenhum pedido em produção no momento.</div>
               )}
               {/* Pagination */}
-              <div className="flex justify-between items-center p-4 bg-gray-100 border-t border-gray-200">
-                <button
-                  onClick={handlePrevPage}
-                  disabled={currentPage === 1}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Anterior
-                </button>
-                <span className="text-sm text-gray-700">Página {currentPage} de {Math.max(totalPages, 1)}</span>
-                <button
-                  onClick={handleNextPage}
-                  disabled={currentPage >= totalPages}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Próxima
-                </button>
-              </div>
+              <PaginacaoCursor anterior={cursor.anterior} proxima={cursor.proxima} onNavegar={fetchPedidos} />
             </div>
           )}
 
           {activeTab === 'em_espera' && (
             <div className="overflow-x-auto bg-white rounded-lg shadow">
-              {currentItems.length > 0 ? (
+              {filteredPedidosByTab.length > 0 ? (
                 <table className="min-w-full divide-y divide-gray-200">
                   <thead className="bg-gray-100">
                     <tr>
@@ -507,7 +449,7 @@ const PcpPage = () => {
                     </tr>
                   </thead>
                   <tbody className="bg-white divide-y divide-gray-200">
-                    {currentItems.map((pedido) => (
+                    {filteredPedidosByTab.map((pedido) => (
                       <tr key={pedido.id} className="hover:bg-gray-50 cursor-pointer" onClick={() => handleRowClick(pedido)}>
                         <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{pedido.id}</td>
                         <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-700">{pedido.cliente?.nome || 'N/A'}</td>
@@ -529,23 +471,7 @@ const PcpPage = () => {
                 <div className="text-center text-gray-600 p-4">Nenhum pedido em espera no momento.</div>
               )}
               {/* Pagination */}
-              <div className="flex justify-between items-center p-4 bg-gray-100 border-t border-gray-200">
-                <button
-                  onClick={handlePrevPage}
-                  disabled={currentPage === 1}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Anterior
-                </button>
-                <span className="text-sm text-gray-700">Página {currentPage} de {Math.max(totalPages, 1)}</span>
-                <button
-                  onClick={handleNextPage}
-                  disabled={currentPage >= totalPages}
-                  className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50 disabled:cursor-not-allowed"
-                >
-                  Próxima
-                </button>
-              </div>
+              <PaginacaoCursor anterior={cursor.anterior} proxima={cursor.proxima} onNavegar={fetchPedidos} />
             </div>
           )}
 
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef, useMemo } from 'react';
 import api from '../services/axios';
 import { FiChevronRight, FiCheck, FiRefreshCw, FiEdit3 } from 'react-icons/fi';
 import OrdemProducaoObservacaoModal from '../components/OrdemProducaoObservacaoModal';
+import PaginacaoCursor from '../components/PaginacaoCursor';
 
 const statusMap = {
   'PENDENTE': { text: 'Pendente', color: 'bg-yellow-500' },
@@ -115,10 +116,12 @@ const OrdemProducaoCard = ({ ordem, onUpdate }) => {
 
 const ProducaoPage = () => {
   const [ordens, setOrdens] = useState([]);
-  const [clientes, setClientes] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [refreshTrigger, setRefreshTrigger] = useState(0);
+  // Link next/previous da página exibida (null = primeira página) e os da resposta
+  const [paginaUrl, setPaginaUrl] = useState(null);
+  const [cursor, setCursor] = useState({ anterior: null, proxima: null });
    const fetchControllerRef = useRef(null);
    const [isObservationModalOpen, setIsObservationModalOpen] = useState(false);
    const [selectedOrdem, setSelectedOrdem] = useState(null);
@@ -135,24 +138,6 @@ const ProducaoPage = () => {
     setSelectedOrdem(null);
   };
 
-  const fetchClientes = async (signal) => {
-    try {
-      const response = await api.get('clientes/clientes/', { signal });
-      const data = response.data.results || response.data;
-      if (Array.isArray(data)) {
-        setClientes(data);
-        return data;
-      }
-      return [];
-    } catch (err) {
-      if (err.name !== 'CanceledError') {
-        console.error('Falha ao buscar clientes', err);
-        setError('Falha ao buscar clientes.');
-      }
-      return [];
-    }
-  };
-
   useEffect(() => {
     const abortController = new AbortController();
     const { signal } = abortController;
@@ -161,22 +146,26 @@ const ProducaoPage = () => {
       setLoading(true);
       setError(null);
 
-      const fetchedClients = await fetchClientes(signal);
-
       try {
-        const response = await api.get('/comercial/pedidos/', { signal });
+        // Os links do cursor já carregam fields e status da primeira requisição
+        const response = paginaUrl
+          ? await api.get(paginaUrl, { signal })
+          : await api.get('/comercial/pedidos/', {
+            params: {
+              fields: 'id,cliente,cliente_resumo,status,prioridade,prazo,valor_total,data_pedido,etapas',
+              status: 'APROVADO',
+            },
+            signal,
+          });
         if (!signal.aborted) {
+          setCursor({ anterior: response.data.previous || null, proxima: response.data.next || null });
           const approvedOrders = response.data.results
-            .filter(p => p.status === 'APROVADO')
-            .map(order => {
-              const cliente = fetchedClients.find(c => c.id === order.cliente);
-              return {
-                ...order,
-                cliente: cliente ? cliente.nome : `ID ${order.cliente}`,
-                valor_total: order.valor_total,
-                data_inicio_prevista: order.data_pedido,
-              };
-            });
+            .map(order => ({
+              ...order,
+              cliente: order.cliente_resumo ? order.cliente_resumo.nome : `ID ${order.cliente}`,
+              valor_total: order.valor_total,
+              data_inicio_prevista: order.data_pedido,
+            }));
           setOrdens(approvedOrders);
           console.log("Dados de ordens aprovadas recebidos:", approvedOrders);
         }
@@ -197,7 +186,7 @@ const ProducaoPage = () => {
     return () => {
       abortController.abort();
     };
-  }, [refreshTrigger]);
+  }, [refreshTrigger, paginaUrl]);
 
   useEffect(() => {
     const intervalId = setInterval(() => {
@@ -248,6 +237,10 @@ const ProducaoPage = () => {
         )
       )}
 
+      <div className="mt-6">
+        <PaginacaoCursor anterior={cursor.anterior} proxima={cursor.proxima} onNavegar={setPaginaUrl} carregando={loading} />
+      </div>
+
       {selectedOrdem && (
         <OrdemProducaoObservacaoModal
           isOpen={isObservationModalOpen}
@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacaoPorCursor(CursorPagination):
+    """
+    Paginação por cursor (keyset) para listas que só crescem. Cada página é
+    uma consulta "WHERE chave < cursor ORDER BY chave LIMIT n" sobre um índice
+    com a mesma ordenação, sem COUNT(*) nem OFFSET: a página 1000 custa o mesmo
+    que a primeira. O cliente segue o link `next` e pode pedir até
+    max_page_size registros por página com ?page_size=.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class PaginacaoPedidos(PaginacaoPorCursor):
+    ordering = ('-data_pedido', '-id')
+
+
+class PaginacaoHistoricoUso(PaginacaoPorCursor):
+    ordering = ('-data_utilizacao', '-id')
+
+
+class PaginacaoMovimentos(PaginacaoPorCursor):
+    ordering = ('-data', '-id')
+
+
+class PaginacaoAbaixoMinimo(PaginacaoPorCursor):
+    # O cursor do DRF guarda só o primeiro campo da ordenação; abaixo_minimo_desde
+    # muda a cada cruzamento do mínimo e se repete entre materiais, então a
+    # posição é o id, que é único e imutável
+    ordering = ('-id',)